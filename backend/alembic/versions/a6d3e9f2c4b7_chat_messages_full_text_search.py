@@ -0,0 +1,42 @@
+"""chat messages full text search
+
+Revision ID: a6d3e9f2c4b7
+Revises: f1b7d4e8a6c2
+Create Date: 2026-10-19 14:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d3e9f2c4b7'
+down_revision = 'f1b7d4e8a6c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # btree_gin позволяет держать thread_id и tsvector в одном GIN-индексе
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    op.add_column(
+        'chat_messages',
+        sa.Column(
+            'content_tsv',
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('russian', content)", persisted=True),
+            nullable=True
+        )
+    )
+    op.create_index(
+        'ix_chat_messages_thread_content_tsv',
+        'chat_messages',
+        ['thread_id', 'content_tsv'],
+        unique=False,
+        postgresql_using='gin'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_chat_messages_thread_content_tsv', table_name='chat_messages')
+    op.drop_column('chat_messages', 'content_tsv')
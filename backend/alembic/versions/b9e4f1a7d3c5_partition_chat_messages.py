@@ -0,0 +1,169 @@
+"""partition chat_messages by month
+
+Revision ID: b9e4f1a7d3c5
+Revises: a6d3e9f2c4b7
+Create Date: 2026-10-19 15:00:00.000000
+"""
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e4f1a7d3c5'
+down_revision = 'a6d3e9f2c4b7'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+COLUMNS = "id, thread_id, sender_id, content, created_at, is_read, read_at, client_id"
+
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def _add_months(value, months):
+    years, month_index = divmod(value.month - 1 + months, 12)
+    return value.replace(year=value.year + years, month=month_index + 1)
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    op.execute("ALTER TABLE chat_messages RENAME TO chat_messages_old")
+    op.execute("ALTER INDEX ix_chat_messages_thread_id_id RENAME TO ix_chat_messages_old_thread_id_id")
+    op.execute("ALTER INDEX ix_chat_messages_thread_content_tsv RENAME TO ix_chat_messages_old_thread_content_tsv")
+    op.execute("ALTER INDEX ux_chat_messages_sender_client_id RENAME TO ux_chat_messages_old_sender_client_id")
+
+    op.execute("""
+        CREATE TABLE chat_messages (
+            id INTEGER NOT NULL DEFAULT nextval('chat_messages_id_seq'),
+            thread_id INTEGER NOT NULL REFERENCES chat_threads (id),
+            sender_id INTEGER NOT NULL REFERENCES users (id),
+            content TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            is_read BOOLEAN,
+            read_at TIMESTAMP WITH TIME ZONE,
+            client_id VARCHAR(64),
+            content_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('russian', content)) STORED,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE chat_messages_id_seq OWNED BY chat_messages.id")
+
+    oldest = bind.execute(sa.text("SELECT min(created_at) FROM chat_messages_old")).scalar()
+    now = datetime.now(timezone.utc)
+    month = _month_start(oldest or now)
+    last = _add_months(_month_start(now), MONTHS_AHEAD)
+    while month <= last:
+        end = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE chat_messages_p{month:%Y_%m} PARTITION OF chat_messages "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        month = end
+    # Страховка на случай, если секции не были созданы заранее
+    op.execute("CREATE TABLE chat_messages_default PARTITION OF chat_messages DEFAULT")
+
+    op.execute(f"""
+        INSERT INTO chat_messages ({COLUMNS})
+        SELECT id, thread_id, sender_id, content, COALESCE(created_at, now()), is_read, read_at, client_id
+        FROM chat_messages_old
+    """)
+
+    op.create_table(
+        'chat_message_client_ids',
+        sa.Column('sender_id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.String(length=64), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('message_created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['sender_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('sender_id', 'client_id')
+    )
+    op.execute("""
+        INSERT INTO chat_message_client_ids (sender_id, client_id, message_id, message_created_at)
+        SELECT sender_id, client_id, id, created_at FROM chat_messages WHERE client_id IS NOT NULL
+    """)
+
+    op.execute("DROP TABLE chat_messages_old")
+
+    op.create_index('ix_chat_messages_thread_id_id', 'chat_messages', ['thread_id', 'id'], unique=False)
+    op.create_index(
+        'ix_chat_messages_thread_content_tsv',
+        'chat_messages',
+        ['thread_id', 'content_tsv'],
+        unique=False,
+        postgresql_using='gin'
+    )
+
+    op.create_table(
+        'chat_message_archives',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('thread_id', sa.Integer(), nullable=False),
+        sa.Column('period_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('object_name', sa.String(length=500), nullable=False),
+        sa.Column('min_id', sa.Integer(), nullable=False),
+        sa.Column('max_id', sa.Integer(), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ux_chat_message_archives_thread_period',
+        'chat_message_archives',
+        ['thread_id', 'period_start'],
+        unique=True
+    )
+    op.create_index(
+        'ix_chat_message_archives_thread_max_id',
+        'chat_message_archives',
+        ['thread_id', 'max_id'],
+        unique=False
+    )
+
+
+def downgrade():
+    # Архивированные в MinIO сообщения обратно не загружаются
+    op.drop_index('ix_chat_message_archives_thread_max_id', table_name='chat_message_archives')
+    op.drop_index('ux_chat_message_archives_thread_period', table_name='chat_message_archives')
+    op.drop_table('chat_message_archives')
+
+    op.execute("ALTER TABLE chat_messages RENAME TO chat_messages_partitioned")
+    op.execute("ALTER INDEX ix_chat_messages_thread_id_id RENAME TO ix_chat_messages_partitioned_thread_id_id")
+    op.execute("ALTER INDEX ix_chat_messages_thread_content_tsv RENAME TO ix_chat_messages_partitioned_thread_content_tsv")
+    op.execute("""
+        CREATE TABLE chat_messages (
+            id INTEGER NOT NULL DEFAULT nextval('chat_messages_id_seq') PRIMARY KEY,
+            thread_id INTEGER NOT NULL REFERENCES chat_threads (id),
+            sender_id INTEGER NOT NULL REFERENCES users (id),
+            content TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            is_read BOOLEAN,
+            read_at TIMESTAMP WITH TIME ZONE,
+            client_id VARCHAR(64),
+            content_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('russian', content)) STORED
+        )
+    """)
+    op.execute("ALTER SEQUENCE chat_messages_id_seq OWNED BY chat_messages.id")
+    op.execute(f"INSERT INTO chat_messages ({COLUMNS}) SELECT {COLUMNS} FROM chat_messages_partitioned")
+    op.execute("DROP TABLE chat_messages_partitioned")
+    op.drop_table('chat_message_client_ids')
+
+    op.create_index('ix_chat_messages_id', 'chat_messages', ['id'], unique=False)
+    op.create_index('ix_chat_messages_thread_id_id', 'chat_messages', ['thread_id', 'id'], unique=False)
+    op.create_index(
+        'ix_chat_messages_thread_content_tsv',
+        'chat_messages',
+        ['thread_id', 'content_tsv'],
+        unique=False,
+        postgresql_using='gin'
+    )
+    op.create_index(
+        'ux_chat_messages_sender_client_id',
+        'chat_messages',
+        ['sender_id', 'client_id'],
+        unique=True
+    )
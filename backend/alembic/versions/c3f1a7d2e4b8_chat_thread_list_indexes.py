@@ -0,0 +1,43 @@
+"""chat thread list indexes
+
+Revision ID: c3f1a7d2e4b8
+Revises: 9b4d6b3fd955
+Create Date: 2026-10-19 10:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f1a7d2e4b8'
+down_revision = '9b4d6b3fd955'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_chat_threads_user_one_last_message',
+        'chat_threads',
+        ['user_one_id', 'last_message_at'],
+        unique=False
+    )
+    op.create_index(
+        'ix_chat_threads_user_two_last_message',
+        'chat_threads',
+        ['user_two_id', 'last_message_at'],
+        unique=False
+    )
+    op.create_index(
+        'ix_chat_messages_thread_unread',
+        'chat_messages',
+        ['thread_id', 'sender_id'],
+        unique=False,
+        postgresql_where=sa.text('is_read = false')
+    )
+
+
+def downgrade():
+    op.drop_index('ix_chat_messages_thread_unread', table_name='chat_messages')
+    op.drop_index('ix_chat_threads_user_two_last_message', table_name='chat_threads')
+    op.drop_index('ix_chat_threads_user_one_last_message', table_name='chat_threads')
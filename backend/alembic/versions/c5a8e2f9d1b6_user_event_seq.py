@@ -0,0 +1,27 @@
+"""user event seq
+
+Revision ID: c5a8e2f9d1b6
+Revises: b9e4f1a7d3c5
+Create Date: 2026-10-19 16:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a8e2f9d1b6'
+down_revision = 'b9e4f1a7d3c5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Монотонный номер последнего события реального времени для пользователя
+    op.add_column('users', sa.Column('event_seq', sa.BigInteger(), nullable=False, server_default='0'))
+    # Снимок ожидающих предложений владельца
+    op.create_index('ix_exchanges_owner_status', 'exchanges', ['owner_id', 'status'])
+
+
+def downgrade():
+    op.drop_index('ix_exchanges_owner_status', table_name='exchanges')
+    op.drop_column('users', 'event_seq')
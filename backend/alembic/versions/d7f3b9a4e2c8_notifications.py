@@ -0,0 +1,35 @@
+"""notifications
+
+Revision ID: d7f3b9a4e2c8
+Revises: c5a8e2f9d1b6
+Create Date: 2026-10-19 17:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7f3b9a4e2c8'
+down_revision = 'c5a8e2f9d1b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'notifications',
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('seq', sa.BigInteger(), nullable=False),
+        sa.Column('type', sa.String(length=50), nullable=False),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('user_id', 'seq')
+    )
+    # Очистка по сроку хранения
+    op.create_index('ix_notifications_created_at', 'notifications', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_notifications_created_at', table_name='notifications')
+    op.drop_table('notifications')
@@ -0,0 +1,26 @@
+"""chat messages (thread_id, id) index
+
+Revision ID: d8e2b5c1f7a3
+Revises: c3f1a7d2e4b8
+Create Date: 2026-10-19 11:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8e2b5c1f7a3'
+down_revision = 'c3f1a7d2e4b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_chat_messages_thread_id_id', 'chat_messages', ['thread_id', 'id'], unique=False)
+    # (thread_id, id) покрывает все запросы, которые использовали индекс по thread_id
+    op.drop_index('ix_chat_messages_thread_id', table_name='chat_messages')
+
+
+def downgrade():
+    op.create_index('ix_chat_messages_thread_id', 'chat_messages', ['thread_id'], unique=False)
+    op.drop_index('ix_chat_messages_thread_id_id', table_name='chat_messages')
@@ -0,0 +1,48 @@
+"""chat read watermarks
+
+Revision ID: e4a9c6d3b2f1
+Revises: d8e2b5c1f7a3
+Create Date: 2026-10-19 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a9c6d3b2f1'
+down_revision = 'd8e2b5c1f7a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('chat_threads', sa.Column('user_one_last_read_id', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('chat_threads', sa.Column('user_two_last_read_id', sa.Integer(), server_default='0', nullable=False))
+
+    # Переносим существующие флаги is_read в водяные знаки
+    op.execute("""
+        UPDATE chat_threads t SET
+            user_one_last_read_id = COALESCE((
+                SELECT MAX(m.id) FROM chat_messages m
+                WHERE m.thread_id = t.id AND m.sender_id = t.user_two_id AND m.is_read
+            ), 0),
+            user_two_last_read_id = COALESCE((
+                SELECT MAX(m.id) FROM chat_messages m
+                WHERE m.thread_id = t.id AND m.sender_id = t.user_one_id AND m.is_read
+            ), 0)
+    """)
+
+    # Непрочитанные теперь считаются по диапазону (thread_id, id)
+    op.drop_index('ix_chat_messages_thread_unread', table_name='chat_messages')
+
+
+def downgrade():
+    op.create_index(
+        'ix_chat_messages_thread_unread',
+        'chat_messages',
+        ['thread_id', 'sender_id'],
+        unique=False,
+        postgresql_where=sa.text('is_read = false')
+    )
+    op.drop_column('chat_threads', 'user_two_last_read_id')
+    op.drop_column('chat_threads', 'user_one_last_read_id')
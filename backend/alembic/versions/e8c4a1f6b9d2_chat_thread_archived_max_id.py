@@ -0,0 +1,29 @@
+"""chat thread archived max id
+
+Revision ID: e8c4a1f6b9d2
+Revises: d7f3b9a4e2c8
+Create Date: 2026-10-19 20:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c4a1f6b9d2'
+down_revision = 'd7f3b9a4e2c8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Граница архива чата: сообщения с id <= archived_max_id выгружены в MinIO
+    op.add_column('chat_threads', sa.Column('archived_max_id', sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE chat_threads t SET archived_max_id = a.max_id "
+        "FROM (SELECT thread_id, MAX(max_id) AS max_id FROM chat_message_archives GROUP BY thread_id) a "
+        "WHERE a.thread_id = t.id"
+    )
+
+
+def downgrade():
+    op.drop_column('chat_threads', 'archived_max_id')
@@ -0,0 +1,30 @@
+"""chat message client id
+
+Revision ID: f1b7d4e8a6c2
+Revises: e4a9c6d3b2f1
+Create Date: 2026-10-19 13:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b7d4e8a6c2'
+down_revision = 'e4a9c6d3b2f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('chat_messages', sa.Column('client_id', sa.String(length=64), nullable=True))
+    op.create_index(
+        'ux_chat_messages_sender_client_id',
+        'chat_messages',
+        ['sender_id', 'client_id'],
+        unique=True
+    )
+
+
+def downgrade():
+    op.drop_index('ux_chat_messages_sender_client_id', table_name='chat_messages')
+    op.drop_column('chat_messages', 'client_id')
@@ -0,0 +1,283 @@
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Sequence
+
+from dotenv import load_dotenv
+from sqlalchemy import text, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from .database import engine
+from .models import ChatThread, ChatMessageArchive, ChatMessageClientId
+from .storage import put_archive_object, get_archive_object
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Сколько будущих месячных секций держать созданными заранее
+CHAT_PARTITIONS_AHEAD = int(os.getenv("CHAT_PARTITIONS_AHEAD", "3"))
+# Секции старше стольких месяцев выгружаются в архив
+CHAT_ARCHIVE_AFTER_MONTHS = int(os.getenv("CHAT_ARCHIVE_AFTER_MONTHS", "12"))
+# Как часто каждый воркер досоздаёт секции и как скоро повторяет после ошибки
+CHAT_PARTITIONS_CHECK_SECONDS = float(os.getenv("CHAT_PARTITIONS_CHECK_SECONDS", "3600"))
+CHAT_PARTITIONS_RETRY_SECONDS = float(os.getenv("CHAT_PARTITIONS_RETRY_SECONDS", "60"))
+# Окно "горячих" секций, которыми ограничивается первая страница истории
+CHAT_HOT_WINDOW_DAYS = int(os.getenv("CHAT_HOT_WINDOW_DAYS", "31"))
+
+PARTITION_NAME_RE = re.compile(r"chat_messages_p(\d{4})_(\d{2})")
+ARCHIVE_INSERT_CHUNK = 1000
+ARCHIVE_YIELD_PER = 1000
+# Ключ advisory-блокировки: воркеры, стартующие одновременно, не создают секции наперегонки
+PARTITIONS_LOCK_KEY = 7301001
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    years, month_index = divmod(value.month - 1 + months, 12)
+    return value.replace(year=value.year + years, month=month_index + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"chat_messages_p{month:%Y_%m}"
+
+
+def ensure_partitions(conn, months_ahead: int = CHAT_PARTITIONS_AHEAD, start: Optional[datetime] = None):
+    """Создаёт месячные секции от start (по умолчанию текущий месяц) на months_ahead вперёд"""
+    first = month_start(start or datetime.now(timezone.utc))
+    for offset in range(months_ahead + 1):
+        begin = add_months(first, offset)
+        end = add_months(begin, 1)
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(begin)} PARTITION OF chat_messages "
+            f"FOR VALUES FROM ('{begin.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+
+
+def ensure_chat_partitions():
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITIONS_LOCK_KEY})
+        ensure_partitions(conn)
+
+
+class PartitionMaintainer:
+    """
+    Держит месячные секции созданными на CHAT_PARTITIONS_AHEAD месяцев вперёд:
+    при старте и затем раз в CHAT_PARTITIONS_CHECK_SECONDS, чтобы долго
+    работающий процесс не начал писать в секцию по умолчанию. Пока последняя
+    попытка неудачна, error не пуст и /health/ready отвечает 503.
+    """
+
+    def __init__(
+        self,
+        interval: float = CHAT_PARTITIONS_CHECK_SECONDS,
+        retry_interval: float = CHAT_PARTITIONS_RETRY_SECONDS
+    ):
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.error: Optional[str] = "секции ещё не проверялись"
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure(self) -> bool:
+        try:
+            await asyncio.to_thread(ensure_chat_partitions)
+        except Exception as exc:
+            self.error = str(exc)
+            logger.exception("Не удалось создать секции chat_messages")
+            return False
+        self.error = None
+        return True
+
+    async def start(self) -> bool:
+        ensured = await self.ensure()
+        self._task = asyncio.create_task(self._run())
+        return ensured
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval if self.error is None else self.retry_interval)
+            await self.ensure()
+
+
+partition_maintainer = PartitionMaintainer()
+
+
+def list_partitions(conn) -> List[datetime]:
+    """Начала месяцев существующих месячных секций (секция по умолчанию не входит)"""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'chat_messages'::regclass"
+    )).scalars()
+    months = []
+    for name in names:
+        match = PARTITION_NAME_RE.fullmatch(name)
+        if match:
+            months.append(datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc))
+    return sorted(months)
+
+
+def archive_object_name(thread_id: int, month: datetime) -> str:
+    return f"chat/{month:%Y-%m}/thread-{thread_id}.ndjson.gz"
+
+
+def _upload_thread_archive(thread_id: int, month: datetime, messages: List[dict]) -> dict:
+    object_name = archive_object_name(thread_id, month)
+    payload = "\n".join(json.dumps(message, ensure_ascii=False) for message in messages)
+    put_archive_object(object_name, gzip.compress(payload.encode("utf-8")))
+    return {
+        "thread_id": thread_id,
+        "period_start": month,
+        "object_name": object_name,
+        "min_id": messages[0]["id"],
+        "max_id": messages[-1]["id"],
+        "message_count": len(messages),
+    }
+
+
+def archive_partition(month: datetime) -> int:
+    """
+    Выгружает секцию в MinIO (по файлу на чат), регистрирует архивы
+    и удаляет секцию. Повторный запуск после сбоя перезаписывает те же объекты.
+    """
+    name = partition_name(month)
+    archives = []
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=ARCHIVE_YIELD_PER).execute(text(
+            f"SELECT id, thread_id, sender_id, content, created_at, is_read, read_at "
+            f"FROM {name} ORDER BY thread_id, id"
+        ))
+        current_thread = None
+        messages: List[dict] = []
+        for row in result:
+            if row.thread_id != current_thread:
+                if messages:
+                    archives.append(_upload_thread_archive(current_thread, month, messages))
+                current_thread = row.thread_id
+                messages = []
+            messages.append({
+                "id": row.id,
+                "thread_id": row.thread_id,
+                "sender_id": row.sender_id,
+                "content": row.content,
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+                "is_read": bool(row.is_read),
+                "read_at": row.read_at.isoformat() if row.read_at else None,
+            })
+        if messages:
+            archives.append(_upload_thread_archive(current_thread, month, messages))
+
+    with engine.begin() as conn:
+        for index in range(0, len(archives), ARCHIVE_INSERT_CHUNK):
+            statement = insert(ChatMessageArchive).values(archives[index:index + ARCHIVE_INSERT_CHUNK])
+            conn.execute(statement.on_conflict_do_update(
+                index_elements=["thread_id", "period_start"],
+                set_={
+                    "object_name": statement.excluded.object_name,
+                    "min_id": statement.excluded.min_id,
+                    "max_id": statement.excluded.max_id,
+                    "message_count": statement.excluded.message_count,
+                }
+            ))
+        # По этой отметке история чата знает, что дальше нужно читать архив
+        for archive in archives:
+            conn.execute(
+                update(ChatThread)
+                .where(ChatThread.id == archive["thread_id"])
+                .values(archived_max_id=func.greatest(
+                    func.coalesce(ChatThread.archived_max_id, 0), archive["max_id"]
+                ))
+            )
+        conn.execute(text(f"ALTER TABLE chat_messages DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+        conn.execute(delete(ChatMessageClientId).where(
+            ChatMessageClientId.message_created_at < add_months(month, 1)
+        ))
+
+    logger.info("Секция %s выгружена в архив: %s чатов", name, len(archives))
+    return len(archives)
+
+
+def archive_cold_partitions(older_than_months: int = CHAT_ARCHIVE_AFTER_MONTHS) -> int:
+    cutoff = add_months(month_start(datetime.now(timezone.utc)), -older_than_months)
+    with engine.connect() as conn:
+        months = list_partitions(conn)
+    archived = 0
+    for month in months:
+        if add_months(month, 1) <= cutoff:
+            archive_partition(month)
+            archived += 1
+    return archived
+
+
+def _read_archive(object_name: str) -> List[dict]:
+    lines = gzip.decompress(get_archive_object(object_name)).decode("utf-8").splitlines()
+    return [json.loads(line) for line in lines if line]
+
+
+def iter_archived_messages(db: Session, thread_id: int) -> Iterator[dict]:
+    """Все архивные сообщения чата по возрастанию id; в памяти один архив за раз"""
+    archives = db.query(ChatMessageArchive.object_name).filter(
+        ChatMessageArchive.thread_id == thread_id
+    ).order_by(ChatMessageArchive.min_id.asc()).all()
+    for archive in archives:
+        yield from _read_archive(archive.object_name)
+
+
+def archived_page_select(thread_id: int, before_id: Optional[int]):
+    """
+    select имён архивов чата, где могут быть сообщения с id < before_id, от
+    новых к старым. Выполняется сессией вызывающего (в том числе асинхронной
+    сессией реплики), а сами объекты читает read_archived_page.
+    """
+    query = select(ChatMessageArchive.object_name).where(ChatMessageArchive.thread_id == thread_id)
+    if before_id is not None:
+        query = query.where(ChatMessageArchive.min_id < before_id)
+    return query.order_by(ChatMessageArchive.max_id.desc())
+
+
+def read_archived_page(object_names: Sequence[str], before_id: Optional[int], limit: int) -> List[dict]:
+    """Последние limit сообщений с id < before_id из архивов object_names, по возрастанию id"""
+    collected: List[dict] = []
+    for object_name in object_names:
+        messages = _read_archive(object_name)
+        if before_id is not None:
+            messages = [message for message in messages if message["id"] < before_id]
+        collected = messages + collected
+        if len(collected) >= limit:
+            break
+    return collected[-limit:]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Секции и архив сообщений чата")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ensure_parser = subparsers.add_parser("ensure", help="создать секции на ближайшие месяцы")
+    ensure_parser.add_argument("--months-ahead", type=int, default=CHAT_PARTITIONS_AHEAD)
+    archive_parser = subparsers.add_parser("archive", help="выгрузить холодные секции в MinIO")
+    archive_parser.add_argument("--older-than-months", type=int, default=CHAT_ARCHIVE_AFTER_MONTHS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "ensure":
+        with engine.begin() as conn:
+            ensure_partitions(conn, args.months_ahead)
+    else:
+        print(f"Выгружено секций: {archive_cold_partitions(args.older_than_months)}")
@@ -0,0 +1,477 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import text, tuple_, update, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from .database import SessionLocal
+from .messaging import MAX_CLIENT_ID_LENGTH, message_to_dict
+from .models import ChatThread, ChatMessage, ChatMessageClientId
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "false").lower() == "true"
+CHAT_WRITE_BEHIND_INTERVAL_MS = int(os.getenv("CHAT_WRITE_BEHIND_INTERVAL_MS", "200"))
+CHAT_WRITE_BEHIND_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BEHIND_BATCH_SIZE", "500"))
+CHAT_WRITE_BEHIND_SPOOL = os.getenv("CHAT_WRITE_BEHIND_SPOOL", "spool/chat_messages.jsonl")
+CHAT_WRITE_BEHIND_FSYNC = os.getenv("CHAT_WRITE_BEHIND_FSYNC", "true").lower() == "true"
+
+RECENT_CLIENT_IDS = 10000
+PARTICIPANTS_CACHE_SIZE = 10000
+
+
+class ChatWriteBehind:
+    """
+    Отложенная пакетная запись сообщений чата.
+
+    submit() сразу возвращает готовое сообщение и дописывает его в локальный
+    журнал. id берётся из последовательности chat_messages отдельным nextval
+    на каждое сообщение: блоки id на процесс при нескольких воркерах нарушили
+    бы порядок отправки, на который опираются курсор after_id и отметки
+    прочтения. Фоновая задача раз в interval_ms или при накоплении batch_size
+    сообщений пишет их в Postgres одним INSERT и одним UPDATE сводки на каждый чат.
+    После успешной записи журнал усекается; при старте незаписанные сообщения
+    из журнала повторно отправляются в БД (вставка идемпотентна по id).
+
+    client_id резервируется в chat_message_client_ids ещё в submit(), сразу
+    после записи в журнал и до подтверждения: повтор после рестарта или с
+    другого воркера получает исходное сообщение. Если процесс упал между
+    журналом и резервом, резерв создаётся при записи пачки, а сообщение,
+    чей client_id уже занят другим, не записывается. Если пачка не записывается из-за данных (например,
+    чат удалён), сообщения пишутся по одному, а отвергнутые БД уходят в
+    <имя>-dead.jsonl рядом с журналом и не блокируют очередь.
+
+    Каждый процесс-воркер пишет в свой журнал (spool_path, затем
+    <имя>.1.jsonl, <имя>.2.jsonl, ...), удерживая flock на его .lock-файле.
+    Журналы без владельца, оставшиеся от остановленных воркеров, подбирает
+    стартующий процесс.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        interval_ms: int = CHAT_WRITE_BEHIND_INTERVAL_MS,
+        batch_size: int = CHAT_WRITE_BEHIND_BATCH_SIZE,
+        spool_path: str = CHAT_WRITE_BEHIND_SPOOL,
+        fsync: bool = CHAT_WRITE_BEHIND_FSYNC
+    ):
+        self.session_factory = session_factory
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self.base_spool_path = Path(spool_path)
+        self.spool_path = self.base_spool_path
+        self.fsync = fsync
+
+        self._pending: List[dict] = []
+        self._participants: "OrderedDict[int, Tuple[int, int]]" = OrderedDict()
+        self._recent_client_ids: "OrderedDict[Tuple[int, str], dict]" = OrderedDict()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._spool = None
+        self._spool_lock = None
+
+    async def start(self):
+        self.base_spool_path.parent.mkdir(parents=True, exist_ok=True)
+        self.spool_path, self._spool_lock = self._claim_spool()
+        recovered = self._read_spool(self.spool_path)
+        self._spool = open(self.spool_path, "a", encoding="utf-8")
+        for message in self._adopt_orphan_spools():
+            self._append_to_spool(message)
+            recovered.append(message)
+        if recovered:
+            logger.warning("Восстановлено %s незаписанных сообщений из журнала", len(recovered))
+            self._pending.extend(recovered)
+            await self.flush()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._spool:
+            self._spool.close()
+            self._spool = None
+        if self._spool_lock:
+            self._spool_lock.close()
+            self._spool_lock = None
+
+    async def submit(
+        self,
+        thread_id: int,
+        sender_id: int,
+        content: Optional[str],
+        client_id: Optional[str] = None
+    ) -> Tuple[dict, Tuple[int, int], bool]:
+        """Тот же контракт, что у messaging.persist_chat_message"""
+        content = (content or "").strip()
+        if not content:
+            raise HTTPException(status_code=400, detail="Сообщение не может быть пустым")
+        if client_id is not None and (not isinstance(client_id, str) or not client_id or len(client_id) > MAX_CLIENT_ID_LENGTH):
+            raise HTTPException(status_code=400, detail="Некорректный client_id")
+
+        participants = await self._get_participants(thread_id)
+        if sender_id not in participants:
+            raise HTTPException(status_code=403, detail="Вы не участвуете в этом чате")
+
+        if client_id is not None:
+            existing = self._recent_client_ids.get((sender_id, client_id))
+            if existing is not None:
+                return existing, participants, False
+
+        message_id = await self._next_id()
+        message = {
+            "id": message_id,
+            "thread_id": thread_id,
+            "sender_id": sender_id,
+            "content": content,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "is_read": False,
+            "client_id": client_id,
+        }
+
+        # Сначала журнал: client_id не должен указывать на сообщение, которое может пропасть
+        self._append_to_spool(message)
+
+        if client_id is not None:
+            # Кэш выше — только свой процесс; повтор мог прийти после рестарта или на другой воркер
+            existing = await asyncio.to_thread(self._reserve_client_id, message)
+            if existing is not None:
+                # Строка журнала останется до ближайшего сжатия; при проигрывании
+                # после сбоя _write_batch пропустит её по чужому client_id
+                self._remember_client_id(existing)
+                return existing, participants, False
+
+        self._pending.append(message)
+
+        if client_id is not None:
+            self._remember_client_id(message)
+
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return message, participants, True
+
+    def _remember_client_id(self, message: dict):
+        self._recent_client_ids[(message["sender_id"], message["client_id"])] = message
+        if len(self._recent_client_ids) > RECENT_CLIENT_IDS:
+            self._recent_client_ids.popitem(last=False)
+
+    def _reserve_client_id(self, message: dict) -> Optional[dict]:
+        """
+        Закрепляет client_id за новым сообщением. Если он уже занят, возвращает
+        исходное сообщение: из БД или, пока оно ждёт записи в очереди другого
+        процесса, собранное по сохранённым id и времени.
+        """
+        created_at = datetime.fromisoformat(message["created_at"])
+        db = self.session_factory()
+        try:
+            reserved = db.execute(
+                insert(ChatMessageClientId)
+                .values(
+                    sender_id=message["sender_id"],
+                    client_id=message["client_id"],
+                    message_id=message["id"],
+                    message_created_at=created_at,
+                )
+                .on_conflict_do_nothing(index_elements=["sender_id", "client_id"])
+                .returning(ChatMessageClientId.message_id)
+            ).first()
+            db.commit()
+            if reserved is not None:
+                return None
+            mapping = db.query(ChatMessageClientId).filter(
+                ChatMessageClientId.sender_id == message["sender_id"],
+                ChatMessageClientId.client_id == message["client_id"]
+            ).one()
+            existing = db.query(ChatMessage).filter(
+                ChatMessage.id == mapping.message_id,
+                ChatMessage.created_at == mapping.message_created_at
+            ).first()
+            if existing is not None:
+                return message_to_dict(existing)
+            return {
+                **message,
+                "id": mapping.message_id,
+                "created_at": mapping.message_created_at.isoformat(),
+            }
+        finally:
+            db.close()
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                try:
+                    await asyncio.to_thread(self._write_batch, batch)
+                except (IntegrityError, DataError) as exc:
+                    # Ошибка в данных, а не в соединении: повтор пачки целиком не поможет
+                    logger.error("Пачка сообщений чата отвергнута БД, пишем по одному: %s", exc)
+                    await asyncio.to_thread(self._write_one_by_one, batch)
+                del self._pending[:len(batch)]
+            self._compact_spool()
+
+    def _write_one_by_one(self, batch: List[dict]):
+        for message in batch:
+            try:
+                self._write_batch([message])
+            except (IntegrityError, DataError) as exc:
+                self._dead_letter(message, exc)
+
+    @property
+    def dead_letter_path(self) -> Path:
+        # Не попадает под шаблон журналов <имя>.N.jsonl, который подбирают другие процессы
+        return self.spool_path.with_name(f"{self.spool_path.stem}-dead{self.spool_path.suffix}")
+
+    def _dead_letter(self, message: dict, exc: Exception):
+        logger.error(
+            "Сообщение %s чата %s не записано и перенесено в %s: %s",
+            message["id"], message["thread_id"], self.dead_letter_path.name, exc
+        )
+        with open(self.dead_letter_path, "a", encoding="utf-8") as dead:
+            dead.write(json.dumps({**message, "error": str(exc.orig if hasattr(exc, "orig") else exc)}, ensure_ascii=False) + "\n")
+            dead.flush()
+            os.fsync(dead.fileno())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._pending:
+                continue
+            try:
+                await self.flush()
+            except Exception as exc:
+                # Сбой соединения: сообщения остаются в журнале и очереди, повторим на следующем тике
+                logger.error("Ошибка пакетной записи сообщений чата: %s", exc)
+
+    async def _get_participants(self, thread_id: int) -> Tuple[int, int]:
+        participants = self._participants.get(thread_id)
+        if participants is not None:
+            self._participants.move_to_end(thread_id)
+            return participants
+        participants = await asyncio.to_thread(self._load_participants, thread_id)
+        self._participants[thread_id] = participants
+        if len(self._participants) > PARTICIPANTS_CACHE_SIZE:
+            self._participants.popitem(last=False)
+        return participants
+
+    def _load_participants(self, thread_id: int) -> Tuple[int, int]:
+        db = self.session_factory()
+        try:
+            row = db.query(ChatThread.user_one_id, ChatThread.user_two_id).filter(
+                ChatThread.id == thread_id
+            ).first()
+        finally:
+            db.close()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Чат не найден")
+        return row[0], row[1]
+
+    async def _next_id(self) -> int:
+        return await asyncio.to_thread(self._reserve_id)
+
+    def _reserve_id(self) -> int:
+        db = self.session_factory()
+        try:
+            message_id = db.execute(
+                text("SELECT nextval(pg_get_serial_sequence('chat_messages', 'id'))")
+            ).scalar_one()
+            db.commit()
+        finally:
+            db.close()
+        return message_id
+
+    @staticmethod
+    def _claim_client_ids(db, rows: List[dict]) -> List[dict]:
+        """
+        Создаёт резервы client_id, которых нет (процесс упал между журналом и
+        submit-резервом), и отбрасывает строки, чей client_id закреплён за
+        другим сообщением
+        """
+        keyed = [row for row in rows if row["client_id"] is not None]
+        if not keyed:
+            return rows
+        db.execute(
+            insert(ChatMessageClientId)
+            .values([
+                {
+                    "sender_id": row["sender_id"],
+                    "client_id": row["client_id"],
+                    "message_id": row["id"],
+                    "message_created_at": row["created_at"],
+                }
+                for row in keyed
+            ])
+            .on_conflict_do_nothing(index_elements=["sender_id", "client_id"])
+        )
+        owners = dict(
+            ((sender_id, client_id), message_id)
+            for sender_id, client_id, message_id in db.query(
+                ChatMessageClientId.sender_id,
+                ChatMessageClientId.client_id,
+                ChatMessageClientId.message_id
+            ).filter(
+                tuple_(ChatMessageClientId.sender_id, ChatMessageClientId.client_id).in_(
+                    [(row["sender_id"], row["client_id"]) for row in keyed]
+                )
+            )
+        )
+        return [
+            row for row in rows
+            if row["client_id"] is None or owners.get((row["sender_id"], row["client_id"])) == row["id"]
+        ]
+
+    def _write_batch(self, batch: List[dict]):
+        rows = [
+            {
+                "id": message["id"],
+                "thread_id": message["thread_id"],
+                "sender_id": message["sender_id"],
+                "content": message["content"],
+                "created_at": datetime.fromisoformat(message["created_at"]),
+                "is_read": False,
+                "client_id": message["client_id"],
+            }
+            for message in batch
+        ]
+
+        db = self.session_factory()
+        try:
+            rows = self._claim_client_ids(db, rows)
+            if not rows:
+                db.commit()
+                return
+            summaries: Dict[int, dict] = {}
+            for row in rows:
+                summary = summaries.get(row["thread_id"])
+                if summary is None or row["id"] > summary["id"]:
+                    summaries[row["thread_id"]] = row
+            # Пропускается только повтор уже записанной строки журнала (тот же id и время)
+            db.execute(
+                insert(ChatMessage).values(rows).on_conflict_do_nothing(index_elements=["id", "created_at"])
+            )
+            for thread_id, summary in summaries.items():
+                db.execute(
+                    update(ChatThread)
+                    .where(
+                        ChatThread.id == thread_id,
+                        or_(
+                            ChatThread.last_message_at.is_(None),
+                            ChatThread.last_message_at <= summary["created_at"]
+                        )
+                    )
+                    .values(
+                        last_message=summary["content"],
+                        last_sender_id=summary["sender_id"],
+                        last_message_at=summary["created_at"]
+                    )
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _append_to_spool(self, message: dict):
+        self._spool.write(json.dumps(message, ensure_ascii=False) + "\n")
+        self._spool.flush()
+        if self.fsync:
+            os.fsync(self._spool.fileno())
+
+    def _compact_spool(self):
+        """Переписывает журнал, оставляя только ещё не записанные сообщения"""
+        if self._spool is None:
+            return
+        self._spool.close()
+        tmp_path = self.spool_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as tmp:
+            for message in self._pending:
+                tmp.write(json.dumps(message, ensure_ascii=False) + "\n")
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, self.spool_path)
+        self._spool = open(self.spool_path, "a", encoding="utf-8")
+
+    def _slot_path(self, slot: int) -> Path:
+        if slot == 0:
+            return self.base_spool_path
+        base = self.base_spool_path
+        return base.with_name(f"{base.stem}.{slot}{base.suffix}")
+
+    @staticmethod
+    def _try_lock(path: Path):
+        lock = open(path.with_name(path.name + ".lock"), "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return None
+        return lock
+
+    def _claim_spool(self):
+        """Первый журнал, который не занят другим процессом"""
+        slot = 0
+        while True:
+            path = self._slot_path(slot)
+            lock = self._try_lock(path)
+            if lock is not None:
+                return path, lock
+            slot += 1
+
+    def _adopt_orphan_spools(self) -> List[dict]:
+        """Забирает сообщения из журналов, владельцы которых уже остановлены"""
+        base = self.base_spool_path
+        candidates = [base, *base.parent.glob(f"{base.stem}.*{base.suffix}")]
+        adopted = []
+        for path in candidates:
+            if path == self.spool_path or not path.exists():
+                continue
+            lock = self._try_lock(path)
+            if lock is None:
+                continue
+            try:
+                messages = self._read_spool(path)
+                if messages:
+                    logger.warning("Журнал %s остался без владельца, забираем его сообщения", path.name)
+                    adopted.extend(messages)
+                    # Файл не удаляется: на его .lock может ждать другой процесс
+                    open(path, "w").close()
+            finally:
+                lock.close()
+        return adopted
+
+    def _read_spool(self, path: Path) -> List[dict]:
+        if not path.exists():
+            return []
+        messages = []
+        with open(path, encoding="utf-8") as spool:
+            for line in spool:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    messages.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Недописанная строка в конце журнала после аварийной остановки
+                    logger.warning("Пропущена повреждённая запись журнала сообщений")
+        return messages
@@ -0,0 +1,184 @@
+"""
+Сжатие ответов API (brotli или gzip по Accept-Encoding).
+
+Не сжимаются: маленькие ответы (меньше COMPRESSION_MIN_SIZE байт), уже сжатые
+тела (Content-Encoding задан), изображения и прочие несжимаемые типы, а также
+пути из COMPRESSION_EXCLUDE_PATHS — обложки из /media и /uploads отдаются
+потоком как есть, /ws — вебсокеты. Потоковые ответы (экспорт) сжимаются
+по частям, без буферизации всего тела.
+"""
+import os
+import time
+import zlib
+from typing import Optional
+
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+
+from .metrics import current_request_stats
+
+load_dotenv()
+
+try:
+    import brotli
+except ImportError:  # без пакета Brotli остаётся только gzip
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+# Уровни 10-11 дают мало выигрыша ценой многократного роста CPU
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSION_EXCLUDE_PATHS = tuple(
+    path.strip() for path in os.getenv("COMPRESSION_EXCLUDE_PATHS", "/media,/uploads,/ws").split(",") if path.strip()
+)
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/x-ndjson",
+    "image/svg+xml",
+}
+
+
+def _is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return (
+        media_type.startswith("text/")
+        or media_type in COMPRESSIBLE_TYPES
+        or media_type.endswith("+json")
+        or media_type.endswith("+xml")
+    )
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """br, если клиент его принимает и пакет установлен, иначе gzip; q=0 — отказ"""
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        if quality > 0:
+            accepted.add(coding.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            # wbits=31 — формат gzip с заголовком и контрольной суммой
+            self._zlib = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Часть потока; сбрасывается сразу, чтобы клиент получал данные без задержки"""
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(COMPRESSION_EXCLUDE_PATHS):
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressionResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _CompressionResponder:
+    def __init__(self, app, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start_message = None
+        self.compressor = None
+        # None — решение ещё не принято (ждём первую часть тела)
+        self.compressing = None
+        self.raw_bytes = 0
+        self.compress_time = 0.0
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def _compress(self, body: bytes, more_body: bool) -> bytes:
+        started = time.perf_counter()
+        data = self.compressor.chunk(body) if more_body else self.compressor.finish(body)
+        self.compress_time += time.perf_counter() - started
+        self.raw_bytes += len(body)
+        stats = current_request_stats()
+        if stats is not None:
+            stats.encoding = self.encoding
+            stats.compress_time = self.compress_time
+            stats.raw_bytes = self.raw_bytes
+        return data
+
+    async def send_compressed(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Заголовки отправим, когда станет ясно, сжимается ли тело
+            self.start_message = message
+            return
+        if message_type != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressing is None:
+            headers = MutableHeaders(scope=self.start_message)
+            self.compressing = (
+                "content-encoding" not in headers
+                and _is_compressible(headers.get("content-type", ""))
+                and (more_body or len(body) >= self.minimum_size)
+            )
+            if _is_compressible(headers.get("content-type", "")):
+                headers.add_vary_header("Accept-Encoding")
+            if not self.compressing:
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+
+            self.compressor = _Compressor(self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            data = self._compress(body, more_body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(data))
+            await self.send(self.start_message)
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+            return
+
+        if not self.compressing:
+            await self.send(message)
+            return
+        data = self._compress(body, more_body)
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -11,18 +13,72 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
-if "?" in DATABASE_URL:
-    DATABASE_URL += "&client_encoding=utf8"
-else:
-    DATABASE_URL += "?client_encoding=utf8"
 
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=300,
+def _async_database_url(url: str) -> str:
+    """Тот же адрес БД для драйвера asyncpg (client_encoding он не принимает)"""
+    parsed = make_url(url)
+    query = {key: value for key, value in parsed.query.items() if key != "client_encoding"}
+    return parsed.set(drivername="postgresql+asyncpg", query=query).render_as_string(hide_password=False)
+
+
+def _with_client_encoding(url: str) -> str:
+    if "?" in url:
+        return url + "&client_encoding=utf8"
+    return url + "?client_encoding=utf8"
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_database_url(DATABASE_URL)
+DATABASE_URL = _with_client_encoding(DATABASE_URL)
+
+# Реплика только для чтения; без неё все запросы идут в основную БД
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+ASYNC_DATABASE_REPLICA_URL = os.getenv("ASYNC_DATABASE_REPLICA_URL") or (
+    _async_database_url(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
 )
+if DATABASE_REPLICA_URL:
+    DATABASE_REPLICA_URL = _with_client_encoding(DATABASE_REPLICA_URL)
+
+# Пул соединений каждого engine (синхронного и асинхронного, основной БД и реплики)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+# Проверочный запрос при каждой выдаче соединения из пула — лишний round trip
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+
+
+def pool_options(**overrides) -> dict:
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    options.update(overrides)
+    return options
+
+
+engine = create_engine(DATABASE_URL, **pool_options())
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Асинхронный слой для async-маршрутов; синхронный engine остаётся для остальных
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options())
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+replica_engine = None
+ReplicaSessionLocal = None
+async_replica_engine = None
+AsyncReplicaSessionLocal = None
+if DATABASE_REPLICA_URL:
+    replica_engine = create_engine(DATABASE_REPLICA_URL, **pool_options())
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+if ASYNC_DATABASE_REPLICA_URL:
+    async_replica_engine = create_async_engine(ASYNC_DATABASE_REPLICA_URL, **pool_options())
+    AsyncReplicaSessionLocal = async_sessionmaker(async_replica_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -30,4 +86,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -3,3 +3,8 @@ from fastapi import Request
 def get_socket_manager(request: Request):
     """Dependency для получения socket_manager из состояния приложения"""
     return request.app.state.socket_manager
+
+
+def get_chat_write_behind(request: Request):
+    """Очередь отложенной записи сообщений чата (None, если режим выключен)"""
+    return request.app.state.chat_write_behind
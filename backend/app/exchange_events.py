@@ -0,0 +1,71 @@
+from typing import Optional, Tuple
+
+from sqlalchemy.orm import Session, aliased
+
+from .models import User, Exchange, Book
+
+EXCHANGE_CREATED = "exchange_created"
+EXCHANGE_STATUS_CHANGED = "exchange_status_changed"
+
+
+def current_event_seq(db: Session, user_id: int) -> int:
+    row = db.query(User.event_seq).filter(User.id == user_id).first()
+    return row.event_seq if row else 0
+
+
+def _exchange_rows(db: Session):
+    requester = aliased(User)
+    return db.query(
+        Exchange.id,
+        Exchange.book_id,
+        Exchange.requester_id,
+        Exchange.owner_id,
+        Exchange.status,
+        Exchange.created_at,
+        Book.title.label("book_title"),
+        requester.username.label("requester_username")
+    ).outerjoin(
+        Book, Book.id == Exchange.book_id
+    ).outerjoin(
+        requester, requester.id == Exchange.requester_id
+    )
+
+
+def _row_to_dict(row) -> dict:
+    return {
+        "id": row.id,
+        "book_id": row.book_id,
+        "book_title": row.book_title or "Неизвестная книга",
+        "requester_id": row.requester_id,
+        "requester_username": row.requester_username or "Неизвестный пользователь",
+        "owner_id": row.owner_id,
+        "status": row.status,
+        "created_at": row.created_at.isoformat() if row.created_at else ""
+    }
+
+
+def load_exchange_event(db: Session, exchange_id: int, event_type: str) -> Optional[Tuple[int, dict]]:
+    """
+    Данные уведомления об одном обмене и его получатель: о новом предложении
+    узнаёт владелец, о смене статуса — запросивший. None, если обмен уже удалён.
+    """
+    row = _exchange_rows(db).filter(Exchange.id == exchange_id).first()
+    if row is None:
+        return None
+    recipient_id = row.owner_id if event_type == EXCHANGE_CREATED else row.requester_id
+    return recipient_id, {"exchange": _row_to_dict(row)}
+
+
+def load_pending_snapshot(db: Session, owner_id: int) -> dict:
+    """
+    Полный список ожидающих предложений владельца и номер события, которому он
+    соответствует. Номер читается первым: событие, пришедшее между двумя запросами,
+    клиент получит повторно и применит идемпотентно по id обмена.
+    """
+    seq = current_event_seq(db, owner_id)
+    rows = _exchange_rows(db).filter(
+        Exchange.owner_id == owner_id,
+        Exchange.status == "pending"
+    ).order_by(Exchange.id.asc()).all()
+    return {"seq": seq, "exchanges": [_row_to_dict(row) for row in rows]}
+
@@ -0,0 +1,80 @@
+import csv
+import io
+import itertools
+import json
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Query, Session
+
+from .database import SessionLocal
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_YIELD_PER = 1000
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def export_response(
+    build_query: Callable[[Session], Query],
+    columns: List[str],
+    format: str,
+    filename: str,
+    leading_rows: Optional[Callable[[Session], Iterable[tuple]]] = None
+) -> StreamingResponse:
+    """
+    Потоковая выгрузка результата запроса в NDJSON или CSV.
+
+    Строки читаются серверным курсором пачками по EXPORT_YIELD_PER и
+    отдаются кусками около EXPORT_CHUNK_SIZE байт, поэтому память не зависит
+    от объёма выгрузки. Запрос выполняется в собственной сессии, которая живёт
+    столько же, сколько ответ. leading_rows — строки (в порядке columns),
+    которые выгружаются до результата запроса, например из архива.
+    """
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Неподдерживаемый формат экспорта")
+
+    def generate():
+        db = SessionLocal()
+        try:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if format == "csv":
+                writer.writerow(columns)
+
+            rows = build_query(db).yield_per(EXPORT_YIELD_PER)
+            if leading_rows is not None:
+                rows = itertools.chain(leading_rows(db), rows)
+            for row in rows:
+                values = [_serialize(value) for value in row]
+                if format == "csv":
+                    writer.writerow(values)
+                else:
+                    buffer.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False))
+                    buffer.write("\n")
+
+                if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate()
+
+            if buffer.tell():
+                yield buffer.getvalue().encode("utf-8")
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        generate(),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'}
+    )
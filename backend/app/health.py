@@ -0,0 +1,84 @@
+"""
+Проверки готовности для /health/ready.
+
+Каждая проверка кэширует результат на HEALTH_CACHE_SECONDS: частые запросы
+балансировщика и оркестратора не превращаются в поток запросов к Postgres и
+MinIO, а одновременные пробы ждут одну и ту же проверку.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from .chat_partitions import partition_maintainer
+from .database import async_engine
+from .storage import get_minio_client, MINIO_BUCKET_COVERS
+
+load_dotenv()
+
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "2"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+
+
+class HealthCheck:
+    def __init__(self, name: str, probe: Callable[[], Awaitable[None]], ttl: float = HEALTH_CACHE_SECONDS):
+        self.name = name
+        self.probe = probe
+        self.ttl = ttl
+        self.result: Optional[dict] = None
+        self._checked_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def status(self) -> dict:
+        if time.monotonic() - self._checked_at < self.ttl:
+            return self.result
+        async with self._lock:
+            # Пока ждали блокировку, проверку мог выполнить другой запрос
+            if time.monotonic() - self._checked_at < self.ttl:
+                return self.result
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self.probe(), timeout=HEALTH_CHECK_TIMEOUT)
+                result = {"ok": True}
+            except asyncio.TimeoutError:
+                result = {"ok": False, "error": "timeout"}
+            except Exception as e:
+                result = {"ok": False, "error": str(e)}
+            result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            self.result = result
+            self._checked_at = time.monotonic()
+            return result
+
+
+async def _check_database():
+    async with async_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+
+async def _check_storage():
+    def probe():
+        if not get_minio_client().bucket_exists(MINIO_BUCKET_COVERS):
+            raise RuntimeError(f"Бакет {MINIO_BUCKET_COVERS} не найден")
+
+    await asyncio.to_thread(probe)
+
+
+async def _check_chat_partitions():
+    # Без секций на текущий месяц сообщения уходят в секцию по умолчанию
+    if partition_maintainer.error:
+        raise RuntimeError(partition_maintainer.error)
+
+
+READINESS_CHECKS = [
+    HealthCheck("database", _check_database),
+    HealthCheck("storage", _check_storage),
+    HealthCheck("chat_partitions", _check_chat_partitions),
+]
+
+
+async def readiness() -> Dict[str, dict]:
+    results = await asyncio.gather(*(check.status() for check in READINESS_CHECKS))
+    return {check.name: result for check, result in zip(READINESS_CHECKS, results)}
@@ -0,0 +1,188 @@
+"""
+Сброс нагрузки при перегрузке воркера.
+
+LoadSheddingMiddleware отвечает 503 с Retry-After, не начиная обработку, если
+в процессе уже выполняется SHED_MAX_IN_FLIGHT запросов или если скользящая
+средняя времени ответа превысила SHED_TARGET_LATENCY_MS при заметной
+очереди (не меньше SHED_MIN_IN_FLIGHT запросов). Быстрый отказ дешевле, чем
+принять запрос, который всё равно не успеет за таймаут клиента.
+
+concurrency_limit (зависимость) и concurrency_slot (контекстный менеджер)
+ограничивают число одновременных выполнений дорогой работы (bcrypt, Pillow), чтобы они не занимали весь пул потоков. Запросы
+сверх лимита ждут в очереди ограниченной длины не дольше SHED_QUEUE_TIMEOUT
+секунд, остальные получают 503.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+
+from .metrics import REQUESTS_IN_FLIGHT, REQUESTS_REJECTED
+from .responses import AppJSONResponse
+
+load_dotenv()
+
+SHED_ENABLED = os.getenv("SHED_ENABLED", "true").lower() == "true"
+# Одновременных запросов на процесс (0 — без ограничения)
+SHED_MAX_IN_FLIGHT = int(os.getenv("SHED_MAX_IN_FLIGHT", "200"))
+# Порог средней задержки ответа (0 — не учитывать)
+SHED_TARGET_LATENCY_MS = float(os.getenv("SHED_TARGET_LATENCY_MS", "2000"))
+SHED_MIN_IN_FLIGHT = int(os.getenv("SHED_MIN_IN_FLIGHT", "20"))
+SHED_RETRY_AFTER = int(os.getenv("SHED_RETRY_AFTER", "2"))
+SHED_QUEUE_TIMEOUT = float(os.getenv("SHED_QUEUE_TIMEOUT", "5"))
+SHED_EXEMPT_PATHS = tuple(
+    path.strip() for path in os.getenv("SHED_EXEMPT_PATHS", "/health,/metrics,/ws").split(",") if path.strip()
+)
+
+# Одновременных выполнений и длина очереди на процесс; переопределяются
+# переменными SHED_CONCURRENCY_<ИМЯ> и SHED_QUEUE_<ИМЯ>
+DEFAULT_CONCURRENCY = {
+    "password_hash": (4, 32),
+    "cover_upload": (4, 16),
+}
+
+# Вес нового замера в скользящей средней задержки
+LATENCY_EWMA_WEIGHT = 0.1
+
+OVERLOADED_DETAIL = "Сервер перегружен, попробуйте позже"
+
+
+def _overloaded(retry_after: float = SHED_RETRY_AFTER) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=OVERLOADED_DETAIL,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class LoadSheddingMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = 0
+        self.latency_ms = 0.0
+
+    def overloaded(self) -> bool:
+        if SHED_MAX_IN_FLIGHT and self.in_flight >= SHED_MAX_IN_FLIGHT:
+            return True
+        return bool(
+            SHED_TARGET_LATENCY_MS
+            and self.latency_ms > SHED_TARGET_LATENCY_MS
+            and self.in_flight >= SHED_MIN_IN_FLIGHT
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SHED_ENABLED or scope["path"].startswith(SHED_EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        if self.overloaded():
+            REQUESTS_REJECTED.labels("overload", "").inc()
+            response = AppJSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"detail": OVERLOADED_DETAIL},
+                headers={"Retry-After": str(SHED_RETRY_AFTER)}
+            )
+            await response(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+            REQUESTS_IN_FLIGHT.dec()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.latency_ms += (elapsed_ms - self.latency_ms) * LATENCY_EWMA_WEIGHT
+
+
+class ConcurrencyLimiter:
+    """Не больше limit одновременных выполнений и max_queue ожидающих"""
+
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self, timeout: float = SHED_QUEUE_TIMEOUT):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            REQUESTS_REJECTED.labels("queue_full", self.name).inc()
+            raise _overloaded()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # Слот передаётся ожидающему в release, active при этом не меняется
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # Слот успели передать одновременно с таймаутом — отдаём дальше
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            REQUESTS_REJECTED.labels("queue_timeout", self.name).inc()
+            raise _overloaded()
+        except asyncio.CancelledError:
+            if waiter.done():
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+_limiters: Dict[str, ConcurrencyLimiter] = {}
+
+
+def get_concurrency_limiter(name: str) -> ConcurrencyLimiter:
+    limiter = _limiters.get(name)
+    if limiter is None:
+        default_limit, default_queue = DEFAULT_CONCURRENCY.get(name, (4, 16))
+        limiter = ConcurrencyLimiter(
+            name,
+            int(os.getenv(f"SHED_CONCURRENCY_{name.upper()}", str(default_limit))),
+            int(os.getenv(f"SHED_QUEUE_{name.upper()}", str(default_queue)))
+        )
+        _limiters[name] = limiter
+    return limiter
+
+
+@asynccontextmanager
+async def concurrency_slot(name: str):
+    if not SHED_ENABLED:
+        yield
+        return
+    limiter = get_concurrency_limiter(name)
+    await limiter.acquire()
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+def concurrency_limit(name: str):
+    """Зависимость FastAPI: слот освобождается после отправки ответа"""
+
+    async def hold_slot():
+        async with concurrency_slot(name):
+            yield
+
+    return hold_slot
@@ -1,31 +1,80 @@
-from fastapi import FastAPI
+import time
+
+# Отсчёт времени запуска: импорт модулей приложения + lifespan
+_started_at = time.perf_counter()
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 from pathlib import Path
 
-from .database import engine, Base
-from .routes import auth, books, exchanges, chat, media
+from .database import engine, async_engine, async_replica_engine, DATABASE_REPLICA_URL, Base
+from .read_replica import ReadYourWritesMiddleware, write_marks
+from .metrics import MetricsMiddleware, render_metrics
+from .compression import CompressionMiddleware, COMPRESSION_ENABLED
+from .responses import AppJSONResponse
+from .load_shedding import LoadSheddingMiddleware
+from .rate_limit import close_rate_limiter
+from .serve import register_drain_hook
+from .routes import auth, books, exchanges, chat, media, health
 from .websockets import SocketManager  # Импортируем SocketManager
+from .chat_write_behind import ChatWriteBehind, CHAT_WRITE_BEHIND
+from .chat_partitions import partition_maintainer
 from contextlib import asynccontextmanager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # При запуске приложения
     print("🚀 Запуск приложения...")
+    # Секции досоздаются и дальше в фоне; пока это не удалось, /health/ready отвечает 503
+    if not await partition_maintainer.start():
+        print("❌ Не удалось создать секции chat_messages, повторим в фоне")
     print("🔌 Инициализация вебсокет-сервера...")
+    await socket_manager.start()
+    if CHAT_WRITE_BEHIND:
+        print("📝 Включена отложенная запись сообщений чата")
+        chat_write_behind = ChatWriteBehind()
+        await chat_write_behind.start()
+        app.state.chat_write_behind = chat_write_behind
+        socket_manager.chat_write_behind = chat_write_behind
+    print(f"✅ Приложение готово за {time.perf_counter() - _started_at:.2f} с")
     
     yield
     
     # При остановке приложения
     print("🛑 Остановка приложения...")
+    if hasattr(socket_manager, 'sio'):
+        print("🔌 Отключение клиентов вебсокетов...")
+        await socket_manager.drain()
+    if app.state.chat_write_behind:
+        print("📝 Запись оставшихся сообщений чата...")
+        await app.state.chat_write_behind.stop()
     if hasattr(socket_manager, 'sio'):
         print("🔌 Остановка вебсокет-сервера...")
         await socket_manager.sio.eio.shutdown()
+        await socket_manager.stop()
+    await partition_maintainer.stop()
+    await close_rate_limiter()
+    await async_engine.dispose()
+    if async_replica_engine is not None:
+        await async_replica_engine.dispose()
+    if write_marks is not None:
+        await write_marks.close()
 
-app = FastAPI(title="Book Exchange API", version="1.0.0", lifespan=lifespan)
+app = FastAPI(
+    title="Book Exchange API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=AppJSONResponse,
+)
 
 socket_manager = SocketManager()
+# По SIGTERM, до закрытия listener: /health/ready отвечает 503, сокеты переезжают на другие воркеры
+register_drain_hook(socket_manager.drain)
+
+# Внутри CORS, чтобы браузер видел ответ 503 и Retry-After
+app.add_middleware(LoadSheddingMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,11 +85,22 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+if DATABASE_REPLICA_URL:
+    # Отметка о записи нужна только для выбора между репликой и основной БД
+    app.add_middleware(ReadYourWritesMiddleware)
+
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# Добавлен последним — внешний слой, измеряет запрос целиком и байты после сжатия
+app.add_middleware(MetricsMiddleware)
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 UPLOAD_DIR = BASE_DIR / "uploads" / "covers"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 app.state.socket_manager = socket_manager
+app.state.chat_write_behind = None
 
 app.mount("/ws", socket_manager.app)
 
@@ -51,18 +111,24 @@ app.include_router(books.router)
 app.include_router(exchanges.router)
 app.include_router(chat.router)
 app.include_router(media.router)
+app.include_router(health.router)
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Book Exchange API"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/health")
-def health_check():
+async def health_check():
     return {
         "status": "healthy",
         "database": "postgresql",
         "websockets": "enabled",
-        "online_users": len(socket_manager.online_users)
+        "online_users": await socket_manager.online_count()
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import update, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .models import ChatThread, ChatMessage, ChatMessageClientId
+
+MAX_CLIENT_ID_LENGTH = 64
+
+
+def message_to_dict(message: ChatMessage) -> dict:
+    return {
+        "id": message.id,
+        "thread_id": message.thread_id,
+        "sender_id": message.sender_id,
+        "content": message.content,
+        "created_at": message.created_at.isoformat() if message.created_at else None,
+        "is_read": bool(message.is_read),
+        "client_id": message.client_id,
+    }
+
+
+def chat_message_payload(message: dict) -> dict:
+    """Событие chat_message в том виде, в котором его ждёт фронтенд"""
+    return {
+        "thread_id": message["thread_id"],
+        "message": message,
+        "meta": {
+            "last_message": message["content"],
+            "last_message_at": message["created_at"]
+        }
+    }
+
+
+def persist_chat_message(
+    db: Session,
+    thread_id: int,
+    sender_id: int,
+    content: Optional[str],
+    client_id: Optional[str] = None
+) -> Tuple[dict, Tuple[int, int], bool]:
+    """
+    Сохраняет сообщение и обновляет сводку чата без повторного чтения из БД.
+
+    Возвращает (сообщение, участники чата, created). Повторная отправка с тем же
+    client_id не создаёт дубль: возвращается ранее сохранённое сообщение и created=False.
+    """
+    content = (content or "").strip()
+    if not content:
+        raise HTTPException(status_code=400, detail="Сообщение не может быть пустым")
+    if client_id is not None and (not isinstance(client_id, str) or not client_id or len(client_id) > MAX_CLIENT_ID_LENGTH):
+        raise HTTPException(status_code=400, detail="Некорректный client_id")
+
+    now = datetime.now(timezone.utc)
+
+    # Проверка участия и обновление сводки чата одним UPDATE ... RETURNING
+    participants = db.execute(
+        update(ChatThread)
+        .where(
+            ChatThread.id == thread_id,
+            or_(ChatThread.user_one_id == sender_id, ChatThread.user_two_id == sender_id)
+        )
+        .values(last_message=content, last_sender_id=sender_id, last_message_at=now)
+        .returning(ChatThread.user_one_id, ChatThread.user_two_id)
+    ).first()
+    if participants is None:
+        db.rollback()
+        if db.query(ChatThread.id).filter(ChatThread.id == thread_id).first() is None:
+            raise HTTPException(status_code=404, detail="Чат не найден")
+        raise HTTPException(status_code=403, detail="Вы не участвуете в этом чате")
+    participants = (participants[0], participants[1])
+
+    message = ChatMessage(
+        thread_id=thread_id,
+        sender_id=sender_id,
+        content=content,
+        created_at=now,
+        is_read=False,
+        client_id=client_id
+    )
+    db.add(message)
+    db.flush()
+
+    if client_id is not None:
+        db.add(ChatMessageClientId(
+            sender_id=sender_id,
+            client_id=client_id,
+            message_id=message.id,
+            message_created_at=now
+        ))
+        try:
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+            existing = db.query(ChatMessage).join(
+                ChatMessageClientId,
+                and_(
+                    ChatMessageClientId.message_id == ChatMessage.id,
+                    ChatMessageClientId.message_created_at == ChatMessage.created_at
+                )
+            ).filter(
+                ChatMessageClientId.sender_id == sender_id,
+                ChatMessageClientId.client_id == client_id
+            ).first()
+            if existing is None:
+                raise
+            return message_to_dict(existing), participants, False
+
+    data = message_to_dict(message)
+    db.commit()
+    return data, participants, True
@@ -0,0 +1,260 @@
+"""
+Метрики производительности в формате Prometheus.
+
+MetricsMiddleware измеряет каждый HTTP-запрос по шаблону маршрута
+(/books/{book_id}, а не /books/42). Обработчики событий SQLAlchemy считают
+запросы к БД и их время в рамках текущего HTTP-запроса, observe_storage —
+вызовы MinIO, observe_image_processing — обработку обложек Pillow,
+observe_emit — отправки Socket.IO. Ответы учитываются по
+размеру до и после сжатия, а также по времени сериализации JSON и сжатия.
+С METRICS_SERVER_TIMING итоги запроса возвращаются в заголовке Server-Timing.
+
+С несколькими воркерами gunicorn метрики собираются через каталог
+PROMETHEUS_MULTIPROC_DIR (см. gunicorn.conf.py).
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from dotenv import load_dotenv
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+load_dotenv()
+
+logger = logging.getLogger("bookex.metrics")
+
+# Предупреждение в журнал, если запрос сделал больше стольких обращений к БД (признак N+1)
+METRICS_MAX_DB_STATEMENTS = int(os.getenv("METRICS_MAX_DB_STATEMENTS", "20"))
+# ... или провёл в БД больше стольких миллисекунд
+METRICS_MAX_DB_TIME_MS = float(os.getenv("METRICS_MAX_DB_TIME_MS", "500"))
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "false").lower() == "true"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+REQUEST_DB_STATEMENTS = Histogram(
+    "http_request_db_statements", "Запросов к БД на один HTTP-запрос",
+    ["route"], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_seconds", "Суммарное время запросов к БД за HTTP-запрос",
+    ["route"], buckets=LATENCY_BUCKETS
+)
+DB_STATEMENT_LATENCY = Histogram(
+    "db_statement_duration_seconds", "Время одного запроса к БД", buckets=FAST_BUCKETS
+)
+STORAGE_LATENCY = Histogram(
+    "storage_operation_duration_seconds", "Время операции с MinIO",
+    ["operation"], buckets=LATENCY_BUCKETS
+)
+IMAGE_PROCESSING_LATENCY = Histogram(
+    "image_processing_duration_seconds", "Время обработки изображения (Pillow)", buckets=LATENCY_BUCKETS
+)
+STORAGE_ERRORS = Counter("storage_operation_errors_total", "Ошибки операций с MinIO", ["operation"])
+SOCKETIO_EMIT_LATENCY = Histogram(
+    "socketio_emit_duration_seconds", "Время отправки события Socket.IO (включая публикацию в Redis)",
+    ["event"], buckets=FAST_BUCKETS
+)
+RESPONSE_BYTES = Histogram(
+    "http_response_bytes", "Размер тела ответа: raw — до сжатия, wire — переданный клиенту",
+    ["route", "stage"], buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+)
+RESPONSE_SERIALIZE_TIME = Histogram(
+    "http_response_serialize_seconds", "Время сериализации JSON-ответа", ["route"], buckets=FAST_BUCKETS
+)
+RESPONSE_COMPRESS_TIME = Histogram(
+    "http_response_compress_seconds", "Время сжатия ответа", ["route", "encoding"], buckets=FAST_BUCKETS
+)
+REQUESTS_REJECTED = Counter(
+    "http_requests_rejected_total", "Запросы, отклонённые ограничением частоты или сбросом нагрузки",
+    ["reason", "limit"]
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Выполняющиеся HTTP-запросы", multiprocess_mode="livesum"
+)
+SOCKETIO_CONNECTIONS = Gauge(
+    "socketio_connections", "Открытые подключения Socket.IO", multiprocess_mode="livesum"
+)
+
+
+class RequestStats:
+    __slots__ = (
+        "db_statements", "db_time", "storage_time", "image_time",
+        "serialize_time", "compress_time", "encoding", "raw_bytes",
+    )
+
+    def __init__(self):
+        self.db_statements = 0
+        self.db_time = 0.0
+        self.storage_time = 0.0
+        self.image_time = 0.0
+        self.serialize_time = 0.0
+        self.compress_time = 0.0
+        self.encoding = None
+        # Размер до сжатия; None — ответ не сжимался
+        self.raw_bytes = None
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+# Изменяемый объект: синхронные обработчики в пуле потоков получают копию контекста,
+# но пишут в тот же RequestStats
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+    DB_STATEMENT_LATENCY.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_statements += 1
+        stats.db_time += elapsed
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # Запрос упал: снимаем его отметку, иначе стек разойдётся со следующими
+    stack = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if stack:
+        stack.pop()
+
+
+@contextmanager
+def observe_storage(operation: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STORAGE_ERRORS.labels(operation).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STORAGE_LATENCY.labels(operation).observe(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.storage_time += elapsed
+
+
+@contextmanager
+def observe_image_processing():
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        IMAGE_PROCESSING_LATENCY.observe(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.image_time += elapsed
+
+
+@contextmanager
+def observe_emit(event_name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        SOCKETIO_EMIT_LATENCY.labels(event_name).observe(time.perf_counter() - started)
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Смонтированные приложения (/ws, /uploads) и 404 — без сырого пути, чтобы не плодить метки
+    return "unmatched"
+
+
+def _server_timing(stats: RequestStats, elapsed: float) -> str:
+    return (
+        f'app;dur={elapsed * 1000:.1f}, '
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.db_statements} queries", '
+        f'storage;dur={stats.storage_time * 1000:.1f}, '
+        f'image;dur={stats.image_time * 1000:.1f}, '
+        f'ser;dur={stats.serialize_time * 1000:.2f}, '
+        f'compress;dur={stats.compress_time * 1000:.2f}'
+    )
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+        wire_bytes = 0
+
+        async def send_with_timing(message):
+            nonlocal status, wire_bytes
+            if message["type"] == "http.response.body":
+                wire_bytes += len(message.get("body", b""))
+            elif message["type"] == "http.response.start":
+                status = message["status"]
+                if METRICS_SERVER_TIMING:
+                    timing = _server_timing(stats, time.perf_counter() - started)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+            elapsed = time.perf_counter() - started
+            route = _route_label(scope)
+            REQUEST_LATENCY.labels(scope["method"], route, str(status)).observe(elapsed)
+            REQUEST_DB_STATEMENTS.labels(route).observe(stats.db_statements)
+            REQUEST_DB_TIME.labels(route).observe(stats.db_time)
+            RESPONSE_BYTES.labels(route, "wire").observe(wire_bytes)
+            RESPONSE_BYTES.labels(route, "raw").observe(wire_bytes if stats.raw_bytes is None else stats.raw_bytes)
+            if stats.serialize_time:
+                RESPONSE_SERIALIZE_TIME.labels(route).observe(stats.serialize_time)
+            if stats.encoding:
+                RESPONSE_COMPRESS_TIME.labels(route, stats.encoding).observe(stats.compress_time)
+            if stats.db_statements > METRICS_MAX_DB_STATEMENTS or stats.db_time * 1000 > METRICS_MAX_DB_TIME_MS:
+                logger.warning(
+                    "%s %s: %s запросов к БД, %.1f мс в БД, %.1f мс всего",
+                    scope["method"], route, stats.db_statements, stats.db_time * 1000, elapsed * 1000
+                )
+
+
+def render_metrics():
+    """Текст для /metrics: со всех воркеров, если задан PROMETHEUS_MULTIPROC_DIR"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        from prometheus_client import REGISTRY as registry
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,8 +1,12 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Boolean, ForeignKey, Index, Computed
+from sqlalchemy.dialects.postgresql import TSVECTOR, JSONB
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 from .database import Base
 
+# Конфигурация полнотекстового поиска по сообщениям чата
+CHAT_SEARCH_CONFIG = "russian"
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -13,6 +17,8 @@ class User(Base):
     city = Column(String(100))
     about = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Номер последнего события реального времени, отправленного пользователю
+    event_seq = Column(BigInteger, nullable=False, default=0, server_default="0")
     books = relationship("Book", back_populates="owner")
 
 class Book(Base):
@@ -33,6 +39,9 @@ class Book(Base):
 
 class Exchange(Base):
     __tablename__ = "exchanges"
+    __table_args__ = (
+        Index("ix_exchanges_owner_status", "owner_id", "status"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
     requester_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -47,6 +56,10 @@ class Exchange(Base):
 
 class ChatThread(Base):
     __tablename__ = "chat_threads"
+    __table_args__ = (
+        Index("ix_chat_threads_user_one_last_message", "user_one_id", "last_message_at"),
+        Index("ix_chat_threads_user_two_last_message", "user_two_id", "last_message_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_one_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     user_two_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -55,6 +68,11 @@ class ChatThread(Base):
     last_message = Column(Text)
     last_sender_id = Column(Integer, ForeignKey("users.id"))
     last_message_at = Column(DateTime(timezone=True))
+    # Водяные знаки прочтения: id последнего прочитанного сообщения для каждого участника
+    user_one_last_read_id = Column(Integer, nullable=False, default=0, server_default="0")
+    user_two_last_read_id = Column(Integer, nullable=False, default=0, server_default="0")
+    # Наибольший id сообщения, выгруженного в архив; NULL — архива у чата нет
+    archived_max_id = Column(Integer)
 
     user_one = relationship("User", foreign_keys=[user_one_id])
     user_two = relationship("User", foreign_keys=[user_two_id])
@@ -63,14 +81,73 @@ class ChatThread(Base):
 
 
 class ChatMessage(Base):
+    # Таблица секционирована по месяцам created_at (см. app/chat_partitions.py),
+    # поэтому первичный ключ включает ключ секционирования
     __tablename__ = "chat_messages"
-    id = Column(Integer, primary_key=True, index=True)
-    thread_id = Column(Integer, ForeignKey("chat_threads.id"), nullable=False, index=True)
+    __table_args__ = (
+        Index("ix_chat_messages_thread_id_id", "thread_id", "id"),
+        Index(
+            "ix_chat_messages_thread_content_tsv",
+            "thread_id",
+            "content_tsv",
+            postgresql_using="gin",
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    thread_id = Column(Integer, ForeignKey("chat_threads.id"), nullable=False)
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     is_read = Column(Boolean, default=False)
     read_at = Column(DateTime(timezone=True))
+    # Идентификатор, сгенерированный клиентом, для идемпотентной отправки
+    client_id = Column(String(64))
+    # Поисковый вектор вычисляется самим Postgres при вставке
+    content_tsv = deferred(Column(
+        TSVECTOR,
+        Computed(f"to_tsvector('{CHAT_SEARCH_CONFIG}', content)", persisted=True)
+    ))
 
     thread = relationship("ChatThread", back_populates="messages")
     sender = relationship("User")
+
+
+class ChatMessageClientId(Base):
+    # Идемпотентность отправки: уникальность (sender_id, client_id) нельзя
+    # обеспечить индексом секционированной таблицы, поэтому она хранится отдельно
+    __tablename__ = "chat_message_client_ids"
+    sender_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    client_id = Column(String(64), primary_key=True)
+    message_id = Column(Integer, nullable=False)
+    message_created_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class ChatMessageArchive(Base):
+    # Сообщения одного чата за один месяц, выгруженные из холодной секции в MinIO
+    __tablename__ = "chat_message_archives"
+    __table_args__ = (
+        Index("ux_chat_message_archives_thread_period", "thread_id", "period_start", unique=True),
+        Index("ix_chat_message_archives_thread_max_id", "thread_id", "max_id"),
+    )
+    id = Column(Integer, primary_key=True)
+    thread_id = Column(Integer, nullable=False)
+    period_start = Column(DateTime(timezone=True), nullable=False)
+    object_name = Column(String(500), nullable=False)
+    min_id = Column(Integer, nullable=False)
+    max_id = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class Notification(Base):
+    # Входящие уведомления пользователя; seq совпадает с users.event_seq на момент записи
+    __tablename__ = "notifications"
+    __table_args__ = (
+        Index("ix_notifications_created_at", "created_at"),
+    )
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    seq = Column(BigInteger, primary_key=True)
+    type = Column(String(50), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import text, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from .models import Notification
+from .exchange_events import current_event_seq, load_pending_snapshot
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS_FLUSH_INTERVAL_MS = int(os.getenv("NOTIFICATIONS_FLUSH_INTERVAL_MS", "50"))
+NOTIFICATIONS_BATCH_SIZE = int(os.getenv("NOTIFICATIONS_BATCH_SIZE", "500"))
+NOTIFICATIONS_RETENTION_DAYS = int(os.getenv("NOTIFICATIONS_RETENTION_DAYS", "30"))
+# Сколько пропущенных уведомлений отдаётся при переподключении; при большем разрыве — снимок
+NOTIFICATIONS_REPLAY_LIMIT = int(os.getenv("NOTIFICATIONS_REPLAY_LIMIT", "500"))
+
+PRUNE_INTERVAL_SECONDS = 3600
+PRUNE_CHUNK = 10000
+
+
+def notification_event(notification: dict) -> dict:
+    """Событие notification в том виде, в котором его ждёт фронтенд"""
+    return {
+        "seq": notification["seq"],
+        "type": notification["type"],
+        "created_at": notification["created_at"],
+        **notification["payload"]
+    }
+
+
+def write_notifications(db: Session, batch: List[dict]) -> List[dict]:
+    """
+    Записывает пачку уведомлений: номера выдаются одним UPDATE users на всю пачку,
+    строки вставляются одним INSERT. Уведомления удалённых пользователей отбрасываются.
+    """
+    counts = Counter(item["user_id"] for item in batch)
+    user_ids = sorted(counts)
+    # Блокировки строк пользователей в одном порядке на всех узлах
+    db.execute(
+        text("SELECT id FROM users WHERE id = ANY(:ids) ORDER BY id FOR UPDATE"),
+        {"ids": user_ids}
+    )
+    rows = db.execute(
+        text(
+            "UPDATE users SET event_seq = users.event_seq + v.n "
+            "FROM (SELECT unnest(CAST(:ids AS integer[])) AS id, "
+            "unnest(CAST(:counts AS integer[])) AS n) AS v "
+            "WHERE users.id = v.id RETURNING users.id, users.event_seq"
+        ),
+        {"ids": user_ids, "counts": [counts[user_id] for user_id in user_ids]}
+    ).all()
+    next_seq: Dict[int, int] = {row.id: row.event_seq - counts[row.id] + 1 for row in rows}
+
+    now = datetime.now(timezone.utc)
+    written = []
+    for item in batch:
+        seq = next_seq.get(item["user_id"])
+        if seq is None:
+            continue
+        next_seq[item["user_id"]] = seq + 1
+        written.append({
+            "user_id": item["user_id"],
+            "seq": seq,
+            "type": item["type"],
+            "payload": item["payload"],
+            "created_at": now,
+        })
+    if written:
+        db.execute(insert(Notification).values(written))
+    db.commit()
+    return [{**item, "created_at": now.isoformat()} for item in written]
+
+
+def load_notifications_since(db: Session, user_id: int, since: Optional[int], limit: int = NOTIFICATIONS_REPLAY_LIMIT) -> dict:
+    """
+    Синхронизация после (пере)подключения. Клиент передаёт номер последнего
+    полученного уведомления и получает только пропущенные. Если клиент подключается
+    впервые, пропущено слишком много или часть уже удалена по сроку хранения,
+    возвращается снимок ожидающих предложений (reset=True).
+    """
+    if since is not None:
+        seq = current_event_seq(db, user_id)
+        if since == seq:
+            return {"seq": seq, "notifications": []}
+        if since < seq and seq - since <= limit:
+            rows = db.execute(
+                select(Notification)
+                .where(Notification.user_id == user_id, Notification.seq > since)
+                .order_by(Notification.seq.asc())
+            ).scalars().all()
+            if rows and rows[0].seq == since + 1:
+                return {
+                    "seq": rows[-1].seq,
+                    "notifications": [
+                        notification_event({
+                            "seq": row.seq,
+                            "type": row.type,
+                            "created_at": row.created_at.isoformat(),
+                            "payload": row.payload,
+                        })
+                        for row in rows
+                    ]
+                }
+    return {**load_pending_snapshot(db, user_id), "reset": True}
+
+
+def prune_notifications(db: Session, retention_days: int = NOTIFICATIONS_RETENTION_DAYS) -> int:
+    """Удаляет уведомления старше срока хранения небольшими порциями"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    removed = 0
+    while True:
+        result = db.execute(
+            text(
+                "DELETE FROM notifications WHERE ctid IN ("
+                "SELECT ctid FROM notifications WHERE created_at < :cutoff LIMIT :chunk)"
+            ),
+            {"cutoff": cutoff, "chunk": PRUNE_CHUNK}
+        )
+        db.commit()
+        removed += result.rowcount
+        if result.rowcount < PRUNE_CHUNK:
+            return removed
+
+
+class NotificationOutbox:
+    """
+    Пакетная запись уведомлений с последующей доставкой.
+
+    publish() ставит уведомление в очередь. Раз в interval_ms (или при
+    накоплении batch_size) очередь записывается в таблицу notifications одной
+    транзакцией, и только после этого уведомления с присвоенными номерами
+    рассылаются получателям — всё, что получил клиент, можно повторить при
+    переподключении. Раз в час удаляются уведомления старше срока хранения.
+    """
+
+    def __init__(
+        self,
+        db,
+        deliver: Callable[[dict], Awaitable[None]],
+        interval_ms: int = NOTIFICATIONS_FLUSH_INTERVAL_MS,
+        batch_size: int = NOTIFICATIONS_BATCH_SIZE
+    ):
+        self.db = db
+        self.deliver = deliver
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self._pending: List[dict] = []
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._pruned_at = 0.0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def publish(self, user_id: int, notification_type: str, payload: dict):
+        self._pending.append({"user_id": user_id, "type": notification_type, "payload": payload})
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                written = await self.db.run(write_notifications, batch)
+                del self._pending[:len(batch)]
+                for notification in written:
+                    try:
+                        await self.deliver(notification)
+                    except Exception as exc:
+                        # Уведомление уже сохранено, клиент получит его при синхронизации
+                        logger.error("Не удалось доставить уведомление: %s", exc)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                if self._pending:
+                    await self.flush()
+                if loop.time() - self._pruned_at >= PRUNE_INTERVAL_SECONDS:
+                    self._pruned_at = loop.time()
+                    removed = await self.db.run(prune_notifications)
+                    if removed:
+                        logger.info("Удалено устаревших уведомлений: %s", removed)
+            except Exception as exc:
+                # Очередь сохраняется, повторим на следующем тике
+                logger.error("Ошибка записи уведомлений: %s", exc)
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import os
+import uuid
+from typing import Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Общий Redis (или совместимый сервер) для шины Socket.IO и присутствия.
+# Без него каждый процесс видит только свои подключения.
+SOCKETIO_REDIS_URL = os.getenv("SOCKETIO_REDIS_URL")
+PRESENCE_NODE_TTL = int(os.getenv("PRESENCE_NODE_TTL", "30"))
+# Задержка объявления ухода в офлайн: быстрые переподключения не рассылаются
+PRESENCE_OFFLINE_GRACE = float(os.getenv("PRESENCE_OFFLINE_GRACE", "5"))
+# Максимум пользователей в одном запросе статусов и в подписке одного сокета
+MAX_PRESENCE_USERS = 500
+
+
+class MemoryPresenceStore:
+    """Присутствие в памяти процесса: подходит только для одного воркера"""
+
+    def __init__(self):
+        self._sessions: Dict[str, Set[str]] = {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def add(self, user_id: str, sid: str) -> bool:
+        """Регистрирует сокет; True, если пользователь только что появился в сети"""
+        sessions = self._sessions.setdefault(user_id, set())
+        sessions.add(sid)
+        return len(sessions) == 1
+
+    async def remove(self, user_id: str, sid: str) -> bool:
+        """Удаляет сокет; True, если у пользователя не осталось подключений"""
+        sessions = self._sessions.get(user_id)
+        if not sessions or sid not in sessions:
+            return False
+        sessions.discard(sid)
+        if not sessions:
+            del self._sessions[user_id]
+            return True
+        return False
+
+    async def sessions(self, user_id: str) -> Set[str]:
+        return set(self._sessions.get(user_id, ()))
+
+    async def is_online(self, user_id: str) -> bool:
+        return user_id in self._sessions
+
+    async def statuses(self, user_ids: List[str]) -> Dict[str, bool]:
+        return {user_id: user_id in self._sessions for user_id in user_ids}
+
+    async def count(self) -> int:
+        return len(self._sessions)
+
+    async def expire_dead_nodes(self) -> List[str]:
+        return []
+
+
+# KEYS: ключ сокетов пользователя, ключ онлайн-пользователей, ключ сокетов узла
+# ARGV: sid, user_id, элемент узла
+_ADD_SCRIPT = """
+redis.call('SADD', KEYS[1], ARGV[1])
+redis.call('SADD', KEYS[3], ARGV[3])
+local count = redis.call('SCARD', KEYS[1])
+redis.call('SADD', KEYS[2], ARGV[2])
+return count
+"""
+
+_REMOVE_SCRIPT = """
+local removed = redis.call('SREM', KEYS[1], ARGV[1])
+redis.call('SREM', KEYS[3], ARGV[3])
+if removed == 0 then
+    return 0
+end
+if redis.call('SCARD', KEYS[1]) == 0 then
+    redis.call('SREM', KEYS[2], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class RedisPresenceStore:
+    """
+    Присутствие в Redis, общее для всех процессов и узлов.
+
+    Каждый узел регистрирует свои сокеты в отдельном множестве и продлевает
+    ключ жизни узла. Если узел упал, его сокеты удаляет первый узел,
+    заметивший истёкший ключ (expire_dead_nodes).
+    """
+
+    prefix = "bookex:presence"
+
+    def __init__(self, url: str, node_ttl: int = PRESENCE_NODE_TTL):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.node_id = uuid.uuid4().hex
+        self.node_ttl = node_ttl
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._add = self.redis.register_script(_ADD_SCRIPT)
+        self._remove = self.redis.register_script(_REMOVE_SCRIPT)
+
+    def _user_key(self, user_id: str) -> str:
+        return f"{self.prefix}:user:{user_id}"
+
+    @property
+    def _online_key(self) -> str:
+        return f"{self.prefix}:online"
+
+    @property
+    def _nodes_key(self) -> str:
+        return f"{self.prefix}:nodes"
+
+    def _node_key(self, node_id: str) -> str:
+        return f"{self.prefix}:node:{node_id}"
+
+    def _node_alive_key(self, node_id: str) -> str:
+        return f"{self.prefix}:node_alive:{node_id}"
+
+    async def start(self):
+        await self._touch()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def stop(self):
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        # Сокеты этого узла уже отключены при остановке сервера
+        await self._expire_node(self.node_id)
+        await self.redis.aclose()
+
+    async def _touch(self):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.sadd(self._nodes_key, self.node_id)
+            pipe.set(self._node_alive_key(self.node_id), "1", ex=self.node_ttl)
+            await pipe.execute()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.node_ttl / 3)
+            try:
+                await self._touch()
+            except Exception as exc:
+                logger.error("Не удалось продлить присутствие узла: %s", exc)
+
+    async def add(self, user_id: str, sid: str) -> bool:
+        count = await self._add(
+            keys=[self._user_key(user_id), self._online_key, self._node_key(self.node_id)],
+            args=[sid, user_id, f"{user_id}:{sid}"]
+        )
+        return int(count) == 1
+
+    async def remove(self, user_id: str, sid: str) -> bool:
+        went_offline = await self._remove(
+            keys=[self._user_key(user_id), self._online_key, self._node_key(self.node_id)],
+            args=[sid, user_id, f"{user_id}:{sid}"]
+        )
+        return bool(went_offline)
+
+    async def sessions(self, user_id: str) -> Set[str]:
+        return set(await self.redis.smembers(self._user_key(user_id)))
+
+    async def is_online(self, user_id: str) -> bool:
+        return bool(await self.redis.sismember(self._online_key, user_id))
+
+    async def statuses(self, user_ids: List[str]) -> Dict[str, bool]:
+        if not user_ids:
+            return {}
+        flags = await self.redis.smismember(self._online_key, user_ids)
+        return {user_id: bool(flag) for user_id, flag in zip(user_ids, flags)}
+
+    async def count(self) -> int:
+        return int(await self.redis.scard(self._online_key))
+
+    async def _expire_node(self, node_id: str) -> List[str]:
+        offline = []
+        for entry in await self.redis.smembers(self._node_key(node_id)):
+            user_id, _, sid = entry.partition(":")
+            went_offline = await self._remove(
+                keys=[self._user_key(user_id), self._online_key, self._node_key(node_id)],
+                args=[sid, user_id, entry]
+            )
+            if went_offline:
+                offline.append(user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._node_key(node_id), self._node_alive_key(node_id))
+            pipe.srem(self._nodes_key, node_id)
+            await pipe.execute()
+        return offline
+
+    async def expire_dead_nodes(self) -> List[str]:
+        """Удаляет сокеты упавших узлов; возвращает ушедших в офлайн пользователей"""
+        offline = []
+        for node_id in await self.redis.smembers(self._nodes_key):
+            if node_id == self.node_id:
+                continue
+            if not await self.redis.exists(self._node_alive_key(node_id)):
+                logger.warning("Узел %s не отвечает, удаляем его подключения", node_id)
+                offline.extend(await self._expire_node(node_id))
+        return offline
+
+
+def create_presence_store():
+    if SOCKETIO_REDIS_URL:
+        return RedisPresenceStore(SOCKETIO_REDIS_URL)
+    return MemoryPresenceStore()
@@ -0,0 +1,224 @@
+"""
+Ограничение частоты запросов к дорогим маршрутам.
+
+Каждое ограничение — ведро токенов: ёмкость N, пополнение N токенов за
+период. Ключ — имя пользователя из токена, а без него — IP клиента. Лимиты
+задаются переменными RATE_LIMIT_<ИМЯ> в виде "30/minute" ("0" — выключить).
+
+Без общего Redis ведра живут в памяти процесса, и при нескольких воркерах
+лимит фактически умножается на их число. С RATE_LIMIT_REDIS_URL (по
+умолчанию SOCKETIO_REDIS_URL) ведро хранится в Redis и общее для всех
+процессов. Если Redis недоступен, запрос пропускается: ограничение не должно
+класть API.
+
+    @router.post("/login", dependencies=[Depends(rate_limit("login", key="ip"))])
+"""
+import logging
+import math
+import os
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request, status
+
+from .metrics import REQUESTS_REJECTED
+from .security import _username_from_token
+
+load_dotenv()
+
+logger = logging.getLogger("bookex.rate_limit")
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL") or os.getenv("SOCKETIO_REDIS_URL")
+# Брать IP клиента из X-Forwarded-For (только за доверенным прокси)
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+# Сколько ключей держит ведро в памяти, прежде чем выбросить полные (неактивные)
+RATE_LIMIT_MEMORY_KEYS = int(os.getenv("RATE_LIMIT_MEMORY_KEYS", "10000"))
+
+DEFAULT_LIMITS = {
+    # bcrypt на каждую попытку; ключ — IP, пользователь ещё не известен
+    "login": "10/minute",
+    # Поиск по каталогу — ILIKE по трём полям
+    "search": "60/minute",
+    # Создание и изменение книг с обложкой — Pillow и MinIO
+    "cover_upload": "30/hour",
+    # Списки чатов и история сообщений, которые клиент перезапрашивает
+    "chat_poll": "120/minute",
+}
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class RateLimit:
+    def __init__(self, name: str, capacity: int, period: float):
+        self.name = name
+        self.capacity = capacity
+        self.period = period
+
+    @property
+    def rate(self) -> float:
+        """Токенов в секунду"""
+        return self.capacity / self.period
+
+
+def parse_limit(name: str, value: str) -> Optional[RateLimit]:
+    value = value.strip().lower()
+    if value in ("", "0", "off"):
+        return None
+    count, _, period = value.partition("/")
+    period = period.strip() or "second"
+    seconds = PERIODS.get(period.rstrip("s")) or float(period)
+    return RateLimit(name, int(count), seconds)
+
+
+def configured_limit(name: str) -> Optional[RateLimit]:
+    value = os.getenv(f"RATE_LIMIT_{name.upper()}", DEFAULT_LIMITS.get(name, "0"))
+    return parse_limit(name, value)
+
+
+class MemoryRateLimiter:
+    """Ведра в памяти процесса: подходит для одного воркера"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MEMORY_KEYS):
+        self.max_keys = max_keys
+        # Имя ограничения -> ключ -> (токены, время обновления)
+        self._buckets: Dict[str, Dict[str, Tuple[float, float]]] = {}
+
+    async def close(self):
+        pass
+
+    @staticmethod
+    def _prune(buckets: Dict[str, Tuple[float, float]], now: float, limit: RateLimit):
+        # Ведро, успевшее наполниться, ничем не отличается от отсутствующего
+        for key, (_, updated) in list(buckets.items()):
+            if now - updated >= limit.period:
+                del buckets[key]
+
+    async def acquire(self, key: str, limit: RateLimit, cost: float = 1) -> float:
+        """0 — запрос разрешён, иначе через сколько секунд появится токен"""
+        now = time.monotonic()
+        buckets = self._buckets.setdefault(limit.name, {})
+        tokens, updated = buckets.get(key, (limit.capacity, now))
+        tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+        if tokens >= cost:
+            retry_after = 0.0
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / limit.rate
+        buckets[key] = (tokens, now)
+        if len(buckets) > self.max_keys:
+            self._prune(buckets, now, limit)
+        return retry_after
+
+
+# KEYS: ключ ведра; ARGV: ёмкость, токенов в секунду, текущее время, стоимость
+_ACQUIRE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(retry_after)
+"""
+
+
+class RedisRateLimiter:
+    """Ведра в Redis, общие для всех процессов; проверка и списание атомарны (Lua)"""
+
+    prefix = "bookex:ratelimit"
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url, decode_responses=True)
+        self._acquire = self.redis.register_script(_ACQUIRE_SCRIPT)
+
+    async def close(self):
+        await self.redis.aclose()
+
+    async def acquire(self, key: str, limit: RateLimit, cost: float = 1) -> float:
+        try:
+            retry_after = await self._acquire(
+                keys=[f"{self.prefix}:{limit.name}:{key}"],
+                args=[limit.capacity, limit.rate, time.time(), cost]
+            )
+        except Exception as exc:
+            logger.warning("Ограничение %s не проверено, Redis недоступен: %s", limit.name, exc)
+            return 0.0
+        return float(retry_after)
+
+
+_limiter = None
+
+
+def get_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        _limiter = RedisRateLimiter(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else MemoryRateLimiter()
+    return _limiter
+
+
+async def close_rate_limiter():
+    global _limiter
+    if _limiter is not None:
+        await _limiter.close()
+        _limiter = None
+
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _user_key(request: Request) -> Optional[str]:
+    # Подпись токена проверяется без обращения к БД; недействительный токен — ключ по IP
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return _username_from_token(token)
+    except HTTPException:
+        return None
+
+
+def rate_limit(name: str, key: str = "user", applies: Optional[Callable[[Request], bool]] = None):
+    """
+    Зависимость FastAPI с ограничением name. key="user" — по пользователю
+    (без токена — по IP), key="ip" — всегда по IP. applies — условие, при
+    котором запрос учитывается (например, только запросы с поиском).
+    """
+    limit = configured_limit(name)
+
+    async def check_rate_limit(request: Request):
+        if not RATE_LIMIT_ENABLED or limit is None:
+            return
+        if applies is not None and not applies(request):
+            return
+        user = _user_key(request) if key == "user" else None
+        bucket_key = f"user:{user}" if user else f"ip:{client_ip(request)}"
+        retry_after = await get_rate_limiter().acquire(bucket_key, limit)
+        if retry_after > 0:
+            REQUESTS_REJECTED.labels("rate_limit", name).inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Слишком много запросов, попробуйте позже",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
+    return check_rate_limit
@@ -0,0 +1,229 @@
+"""
+Маршрутизация чтения на реплику.
+
+GET-маршруты каталога, профилей и истории чата берут сессию через
+get_read_db / get_async_read_db. Сессия открывается на реплике, если она
+настроена и не отстаёт дольше DB_REPLICA_MAX_LAG секунд, иначе — на основной БД.
+
+Чтобы пользователь видел свои изменения, ReadYourWritesMiddleware после
+успешного изменяющего запроса запоминает время записи для пользователя из
+JWT; записи через сокет отмечает mark_user_write. Пока реплика могла ещё не
+догнать эту запись (прошло меньше текущего отставания плюс
+DB_REPLICA_LAG_MARGIN), чтение этого пользователя идёт в основную БД.
+Отметки хранятся в Redis (SOCKETIO_REDIS_URL), общем для всех воркеров,
+а без него — в памяти процесса.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from fastapi import Request
+from jose import JWTError, jwt
+from sqlalchemy import text
+
+from .database import (
+    SessionLocal,
+    AsyncSessionLocal,
+    ReplicaSessionLocal,
+    AsyncReplicaSessionLocal,
+    replica_engine,
+    async_replica_engine,
+    DATABASE_REPLICA_URL,
+)
+from .presence import SOCKETIO_REDIS_URL
+from .security import SECRET_KEY, ALGORITHM
+
+load_dotenv()
+
+logger = logging.getLogger("bookex.replica")
+
+# При большем отставании реплики все чтения идут в основную БД
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", "1"))
+# Запас к измеренному отставанию при чтении после собственной записи
+DB_REPLICA_LAG_MARGIN = float(os.getenv("DB_REPLICA_LAG_MARGIN", "0.5"))
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Пока реплика проигрывает WAL, отставание — возраст последней проигранной транзакции
+_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class ReplicaLag:
+    """Отставание реплики в секундах, не чаще раза в DB_REPLICA_LAG_CHECK_INTERVAL"""
+
+    def __init__(self, interval: float = DB_REPLICA_LAG_CHECK_INTERVAL):
+        self.interval = interval
+        self.value = float("inf")
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        self._async_lock = None
+
+    def _stale(self) -> bool:
+        return time.monotonic() - self._checked_at >= self.interval
+
+    def _store(self, value: Optional[float]):
+        # Реплика недоступна — считаем отставание бесконечным до следующей проверки
+        self.value = float("inf") if value is None else float(value)
+        self._checked_at = time.monotonic()
+
+    def current(self) -> float:
+        if replica_engine is None:
+            return float("inf")
+        if self._stale() and self._lock.acquire(blocking=False):
+            try:
+                with replica_engine.connect() as connection:
+                    self._store(connection.execute(_LAG_QUERY).scalar())
+            except Exception as e:
+                logger.warning("Не удалось проверить отставание реплики: %s", e)
+                self._store(None)
+            finally:
+                self._lock.release()
+        return self.value
+
+    async def current_async(self) -> float:
+        if async_replica_engine is None:
+            return float("inf")
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        if self._stale() and not self._async_lock.locked():
+            async with self._async_lock:
+                try:
+                    async with async_replica_engine.connect() as connection:
+                        self._store((await connection.execute(_LAG_QUERY)).scalar())
+                except Exception as e:
+                    logger.warning("Не удалось проверить отставание реплики: %s", e)
+                    self._store(None)
+        return self.value
+
+
+replica_lag = ReplicaLag()
+
+
+class WriteMarks:
+    """Время последней записи каждого пользователя с TTL, за которым отметка не нужна"""
+
+    prefix = "bookex:wrote_at"
+    max_local_marks = 10000
+
+    def __init__(self, url: Optional[str] = SOCKETIO_REDIS_URL):
+        # Позже DB_REPLICA_MAX_LAG отметка не нужна: дальше реплика либо догнала, либо отключена
+        self.ttl = int(DB_REPLICA_MAX_LAG + DB_REPLICA_LAG_MARGIN) + 1
+        self._local: Dict[str, float] = {}
+        self.redis = None
+        if url:
+            import redis.asyncio as redis
+
+            self.redis = redis.from_url(url, decode_responses=True)
+
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+
+    async def mark(self, user_id):
+        now = time.time()
+        if self.redis is None:
+            self._local[str(user_id)] = now
+            if len(self._local) > self.max_local_marks:
+                self._local = {key: value for key, value in self._local.items() if now - value < self.ttl}
+            return
+        try:
+            await self.redis.set(f"{self.prefix}:{user_id}", f"{now:.3f}", ex=self.ttl)
+        except Exception as e:
+            logger.warning("Не удалось сохранить отметку записи: %s", e)
+
+    async def last(self, user_id) -> float:
+        if self.redis is None:
+            return self._local.get(str(user_id), 0.0)
+        try:
+            value = await self.redis.get(f"{self.prefix}:{user_id}")
+        except Exception as e:
+            # Не знаем, писал ли пользователь, — читаем из основной БД
+            logger.warning("Не удалось прочитать отметку записи: %s", e)
+            return time.time()
+        return float(value) if value else 0.0
+
+
+write_marks = WriteMarks() if DATABASE_REPLICA_URL else None
+
+
+async def mark_user_write(user_id):
+    """Отметка для записей мимо HTTP (сообщения через сокет)"""
+    if write_marks is not None:
+        await write_marks.mark(user_id)
+
+
+def _use_replica(request: Request, lag: float) -> bool:
+    if lag > DB_REPLICA_MAX_LAG:
+        return False
+    wrote_at = getattr(request.state, "wrote_at", 0.0)
+    return time.time() - wrote_at > lag + DB_REPLICA_LAG_MARGIN
+
+
+def get_read_db(request: Request):
+    factory = SessionLocal
+    if ReplicaSessionLocal is not None and _use_replica(request, replica_lag.current()):
+        factory = ReplicaSessionLocal
+    db = factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(request: Request):
+    factory = AsyncSessionLocal
+    if AsyncReplicaSessionLocal is not None and _use_replica(request, await replica_lag.current_async()):
+        factory = AsyncReplicaSessionLocal
+    async with factory() as db:
+        yield db
+
+
+def _user_id_from_scope(scope) -> Optional[str]:
+    # Только подпись токена, без обращения к БД; анонимные запросы ничего не пишут
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                user_id = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("user_id")
+            except JWTError:
+                return None
+            return str(user_id) if user_id is not None else None
+    return None
+
+
+class ReadYourWritesMiddleware:
+    """
+    Запоминает время последнего успешного изменяющего запроса пользователя и
+    передаёт его чтениям через request.state.wrote_at
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        user_id = _user_id_from_scope(scope) if scope["type"] == "http" else None
+        if user_id is None or write_marks is None:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] not in WRITE_METHODS:
+            scope.setdefault("state", {})["wrote_at"] = await write_marks.last(user_id)
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_mark(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                await write_marks.mark(user_id)
+            await send(message)
+
+        await self.app(scope, receive, send_with_mark)
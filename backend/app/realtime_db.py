@@ -0,0 +1,53 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from .database import DATABASE_URL, pool_options
+
+load_dotenv()
+
+# Потоки и соединения, выделенные под запросы вебсокет-сервера
+REALTIME_DB_WORKERS = int(os.getenv("REALTIME_DB_WORKERS", "8"))
+
+T = TypeVar("T")
+
+# Отдельный пул соединений: нагрузка на HTTP API не забирает соединения у сокетов
+realtime_engine = create_engine(
+    DATABASE_URL,
+    **pool_options(pool_size=REALTIME_DB_WORKERS, max_overflow=0)
+)
+
+RealtimeSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=realtime_engine)
+
+
+class RealtimeDB:
+    """
+    Доступ к БД для обработчиков Socket.IO без блокировки цикла событий.
+
+    Синхронная функция fn(db, *args) выполняется в отдельном пуле потоков
+    со своей сессией; корутина ждёт результат, не задерживая другие сокеты.
+    """
+
+    def __init__(self, workers: int = REALTIME_DB_WORKERS, session_factory=RealtimeSessionLocal):
+        self.session_factory = session_factory
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="realtime-db")
+
+    def _call(self, fn: Callable[..., T], args) -> T:
+        db: Session = self.session_factory()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, args)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        realtime_engine.dispose()
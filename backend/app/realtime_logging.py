@@ -0,0 +1,55 @@
+import atexit
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Доля записанных событий уровня ниже WARNING; предупреждения и ошибки пишутся всегда
+SOCKETIO_LOG_SAMPLE_RATE = float(os.getenv("SOCKETIO_LOG_SAMPLE_RATE", "0.01"))
+SOCKETIO_LOG_LEVEL = os.getenv("SOCKETIO_LOG_LEVEL", "INFO").upper()
+
+_listener = None
+_queue_handler = None
+
+
+class SampledFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+def _start_listener() -> QueueHandler:
+    """Форматирование и вывод записей — в отдельном потоке, а не в цикле событий"""
+    global _listener
+    records = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    _listener = QueueListener(records, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return QueueHandler(records)
+
+
+def realtime_logger(name: str) -> logging.Logger:
+    """Логгер вебсокет-сервера: асинхронный вывод и выборка низкоуровневых записей"""
+    global _queue_handler
+    if _listener is None:
+        _queue_handler = _start_listener()
+        _queue_handler.addFilter(SampledFilter(SOCKETIO_LOG_SAMPLE_RATE))
+    logger = logging.getLogger(name)
+    if _queue_handler not in logger.handlers:
+        logger.addHandler(_queue_handler)
+    logger.setLevel(SOCKETIO_LOG_LEVEL)
+    logger.propagate = False
+    return logger
+
@@ -0,0 +1,38 @@
+"""
+Класс JSON-ответа по умолчанию для всего приложения.
+
+С FAST_JSON_RESPONSES (по умолчанию) тело сериализуется orjson — он в
+несколько раз быстрее json из стандартной библиотеки и сам умеет datetime.
+Время сериализации записывается в метрики запроса (http_response_serialize_seconds,
+ser в Server-Timing), поэтому оба варианта можно сравнить на одной нагрузке.
+"""
+import os
+import time
+from typing import Any
+
+from dotenv import load_dotenv
+from fastapi.responses import JSONResponse
+
+from .metrics import current_request_stats
+
+load_dotenv()
+
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "true").lower() == "true"
+
+try:
+    import orjson
+except ImportError:  # orjson не установлен — остаёмся на стандартном json
+    orjson = None
+
+
+class AppJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        started = time.perf_counter()
+        if FAST_JSON_RESPONSES and orjson is not None:
+            body = orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        else:
+            body = super().render(content)
+        stats = current_request_stats()
+        if stats is not None:
+            stats.serialize_time += time.perf_counter() - started
+        return body
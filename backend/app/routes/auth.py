@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session, joinedload
 from typing import List
 
 from ..database import get_db
+from ..read_replica import get_read_db
 from ..models import Book, User
 from ..schemas import (
     BookResponse,
@@ -23,11 +24,13 @@ from ..security import (
     ALGORITHM
 )
 from ..storage import get_book_cover_url
+from ..rate_limit import rate_limit
+from ..load_shedding import concurrency_limit
 from jose import JWTError, jwt
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
-@router.post("/register", response_model=Token)
+@router.post("/register", response_model=Token, dependencies=[Depends(concurrency_limit("password_hash"))])
 def register(user_data: UserCreate, db: Session = Depends(get_db)):
     # Check if user exists
     if db.query(User).filter(User.email == user_data.email).first():
@@ -67,7 +70,11 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         "user": db_user
     }
 
-@router.post("/login", response_model=Token)
+@router.post(
+    "/login",
+    response_model=Token,
+    dependencies=[Depends(rate_limit("login", key="ip")), Depends(concurrency_limit("password_hash"))]
+)
 def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = db.query(User).filter(User.username == form_data.username).first()
     
@@ -136,7 +143,7 @@ def refresh_token(payload: RefreshTokenRequest, db: Session = Depends(get_db)):
 @router.get("/profile/{user_id}", response_model=UserResponse)
 def get_user_profile(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)  # Можно убрать эту зависимость для публичного доступа
 ):
     user = db.query(User).filter(User.id == user_id).first()
@@ -147,7 +154,7 @@ def get_user_profile(
 @router.get("/profile/{user_id}/books", response_model=List[BookResponse])
 def get_user_books(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)  # Можно убрать эту зависимость для публичного доступа
 ):
     books = db.query(Book).filter(Book.owner_id == user_id, Book.status == "available").options(joinedload(Book.owner)).all()
@@ -1,15 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Request, status, UploadFile, File, Form
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, select, func
 from math import ceil
 from typing import List, Optional
 
 from ..database import get_db
+from ..read_replica import get_async_read_db
 from ..models import Book, User
 from ..schemas import BookResponse, PaginatedBookResponse
-from ..security import get_current_user
+from ..security import get_current_user, get_current_user_async
 from ..storage import upload_book_cover, delete_book_cover, get_book_cover_url
+from ..rate_limit import rate_limit
+from ..load_shedding import concurrency_slot
 
 router = APIRouter(prefix="/books", tags=["books"])
 
@@ -22,7 +26,20 @@ def _attach_cover_url(book: Book):
     return book
 
 
-@router.post("/", response_model=BookResponse)
+_check_cover_rate = rate_limit("cover_upload")
+
+
+async def limit_cover_upload(request: Request, cover: UploadFile = File(None)):
+    """Частота и параллельность обработки обложек; правки без обложки не ограничиваются"""
+    if not cover:
+        yield
+        return
+    await _check_cover_rate(request)
+    async with concurrency_slot("cover_upload"):
+        yield
+
+
+@router.post("/", response_model=BookResponse, dependencies=[Depends(limit_cover_upload)])
 def create_book(
     title: str = Form(...),
     author: str = Form(...),
@@ -52,24 +69,28 @@ def create_book(
     db.refresh(db_book)
     return _attach_cover_url(db_book)
 
-@router.get("/", response_model=PaginatedBookResponse)
-def get_books(
+@router.get(
+    "/",
+    response_model=PaginatedBookResponse,
+    dependencies=[Depends(rate_limit("search", applies=lambda request: bool(request.query_params.get("search"))))]
+)
+async def get_books(
     page: int = 1,
     limit: int = 10,
     genre: Optional[str] = None,
     condition: Optional[str] = None,
     search: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    query = db.query(Book).filter(Book.status == "available")
+    query = select(Book).where(Book.status == "available")
     
     # Применяем фильтры
     if genre:
-        query = query.filter(Book.genre.ilike(f"%{genre}%"))
+        query = query.where(Book.genre.ilike(f"%{genre}%"))
     if condition:
-        query = query.filter(Book.condition == condition)
+        query = query.where(Book.condition == condition)
     if search:
-        query = query.filter(
+        query = query.where(
             or_(
                 Book.title.ilike(f"%{search}%"),
                 Book.author.ilike(f"%{search}%"),
@@ -78,18 +99,18 @@ def get_books(
         )
     
     # Получаем общее количество
-    total_count = query.count()
+    total_count = (await db.execute(select(func.count()).select_from(query.subquery()))).scalar_one()
     
     # Вычисляем смещение
     skip = (page - 1) * limit
     
-    # Получаем книги с загруженными владельцами
-    books = query.options(joinedload(Book.owner)).offset(skip).limit(limit).all()
-    
     # Вычисляем общее количество страниц
     total_pages = ceil(total_count / limit) if limit > 0 else 1
     
-    books = query.options(joinedload(Book.owner)).offset(skip).limit(limit).all()
+    # Получаем книги с загруженными владельцами
+    books = (await db.execute(
+        query.options(joinedload(Book.owner)).offset(skip).limit(limit)
+    )).scalars().all()
     _attach_cover_url(books)
     return {
         "books": books,
@@ -100,21 +121,25 @@ def get_books(
     }
 
 @router.get("/my-books", response_model=List[BookResponse])
-def get_my_books(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_my_books(
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_user_async)
 ):
-    books = db.query(Book).filter(Book.owner_id == current_user.id).all()
-    return _attach_cover_url(books)
+    books = (await db.execute(
+        select(Book).options(joinedload(Book.owner)).where(Book.owner_id == current_user.id)
+    )).scalars().all()
+    return _attach_cover_url(list(books))
 
 @router.get("/{book_id}", response_model=BookResponse)
-def get_book(book_id: int, db: Session = Depends(get_db)):
-    book = db.query(Book).filter(Book.id == book_id).first()
+async def get_book(book_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    book = (await db.execute(
+        select(Book).options(joinedload(Book.owner)).where(Book.id == book_id)
+    )).scalar_one_or_none()
     if not book:
         raise HTTPException(status_code=404, detail="Книга не найдена")
     return _attach_cover_url(book)
 
-@router.put("/{book_id}", response_model=BookResponse)
+@router.put("/{book_id}", response_model=BookResponse, dependencies=[Depends(limit_cover_upload)])
 def update_book(
     book_id: int,
     title: str = Form(...),
@@ -1,22 +1,33 @@
-from datetime import datetime
-from typing import List
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Numeric, or_, and_, case, cast, func, select
 
 from ..database import get_db
-from ..models import ChatThread, ChatMessage, User, Book
+from ..read_replica import get_async_read_db
+from ..models import ChatThread, ChatMessage, User, Book, CHAT_SEARCH_CONFIG
 from ..schemas import (
     ChatThreadResponse,
     ChatMessageResponse,
     ChatMessageRequest,
     ChatThreadCreate,
     ChatThreadByUsername,
-    ChatThreadByBook
+    ChatThreadByBook,
+    ChatReadResponse,
+    ChatSearchResult
 )
-from ..security import get_current_user
-from ..dependencies import get_socket_manager
+from ..security import get_current_user, get_current_user_async
+from ..dependencies import get_socket_manager, get_chat_write_behind
+from ..messaging import persist_chat_message, chat_message_payload
+from ..export import export_response
+from ..chat_partitions import archived_page_select, read_archived_page, iter_archived_messages, CHAT_HOT_WINDOW_DAYS
+from ..presence import MAX_PRESENCE_USERS
+from ..rate_limit import rate_limit
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
@@ -35,44 +46,218 @@ def _get_or_create_thread(db: Session, user_a: int, user_b: int) -> ChatThread:
     return thread
 
 
-def _thread_to_response(db: Session, thread: ChatThread, current_user: User) -> ChatThreadResponse:
-    partner = thread.user_two if thread.user_one_id == current_user.id else thread.user_one
-    if not partner:
-        raise HTTPException(status_code=404, detail="Участник чата не найден")
+def _last_read_column(user_id: int):
+    return case(
+        (ChatThread.user_one_id == user_id, ChatThread.user_one_last_read_id),
+        else_=ChatThread.user_two_last_read_id
+    )
 
-    unread_count = db.query(ChatMessage).filter(
-        ChatMessage.thread_id == thread.id,
-        ChatMessage.sender_id != current_user.id,
-        ChatMessage.is_read.is_(False)
-    ).count()
 
+def _thread_rows_select(user_id: int):
+    """
+    Возвращает select (thread, partner, unread_count) по всем чатам пользователя.
+    Непрочитанные считаются одним сгруппированным подзапросом по диапазону id
+    выше водяного знака прочтения, а собеседник
+    подтягивается join'ом, поэтому список чатов собирается за один запрос.
+    Один и тот же select выполняется и синхронной, и асинхронной сессией.
+    """
+    membership = or_(
+        ChatThread.user_one_id == user_id,
+        ChatThread.user_two_id == user_id
+    )
+
+    unread = select(
+        ChatMessage.thread_id.label("thread_id"),
+        func.count(ChatMessage.id).label("unread_count")
+    ).join(
+        ChatThread, ChatThread.id == ChatMessage.thread_id
+    ).where(
+        membership,
+        ChatMessage.sender_id != user_id,
+        ChatMessage.id > _last_read_column(user_id)
+    ).group_by(ChatMessage.thread_id).subquery()
+
+    partner = aliased(User)
+    partner_id = case(
+        (ChatThread.user_one_id == user_id, ChatThread.user_two_id),
+        else_=ChatThread.user_one_id
+    )
+
+    return select(
+        ChatThread,
+        partner,
+        func.coalesce(unread.c.unread_count, 0)
+    ).join(
+        partner, partner.id == partner_id
+    ).outerjoin(
+        unread, unread.c.thread_id == ChatThread.id
+    ).where(membership)
+
+
+def _row_to_response(thread: ChatThread, partner: User, unread_count: int) -> ChatThreadResponse:
+    if partner.id == thread.user_one_id:
+        partner_last_read_id = thread.user_one_last_read_id
+    else:
+        partner_last_read_id = thread.user_two_last_read_id
     return ChatThreadResponse(
         id=thread.id,
         partner=partner,
         last_message=thread.last_message,
         last_message_at=thread.last_message_at,
-        unread_count=unread_count
+        unread_count=unread_count,
+        partner_last_read_id=partner_last_read_id or 0
     )
 
 
+def _thread_to_response(db: Session, thread: ChatThread, current_user: User) -> ChatThreadResponse:
+    row = db.execute(_thread_rows_select(current_user.id).where(ChatThread.id == thread.id)).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Участник чата не найден")
+    return _row_to_response(*row)
+
+
 def _ensure_membership(thread: ChatThread, current_user: User):
     if current_user.id not in (thread.user_one_id, thread.user_two_id):
         raise HTTPException(status_code=403, detail="Вы не участвуете в этом чате")
 
 
-@router.get("/threads", response_model=List[ChatThreadResponse])
-def get_threads(
+@router.get("/threads", response_model=List[ChatThreadResponse], dependencies=[Depends(rate_limit("chat_poll"))])
+async def get_threads(
+    limit: int = 50,
+    before_at: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_user_async)
+):
+    """
+    Список чатов, отсортированный по last_message_at (новые сверху).
+    Следующая страница запрашивается по курсору последнего элемента:
+    before_at=<last_message_at>&before_id=<id>. Чаты без сообщений идут в конце,
+    для них достаточно before_id.
+    """
+    limit = max(1, min(limit, 100))
+    query = _thread_rows_select(current_user.id)
+
+    if before_id is not None:
+        if before_at is not None:
+            query = query.where(
+                or_(
+                    ChatThread.last_message_at < before_at,
+                    and_(ChatThread.last_message_at == before_at, ChatThread.id < before_id),
+                    ChatThread.last_message_at.is_(None)
+                )
+            )
+        else:
+            query = query.where(
+                ChatThread.last_message_at.is_(None),
+                ChatThread.id < before_id
+            )
+
+    rows = (await db.execute(query.order_by(
+        ChatThread.last_message_at.desc().nullslast(),
+        ChatThread.id.desc()
+    ).limit(limit))).all()
+
+    return [_row_to_response(*row) for row in rows]
+
+
+# Маркеры подсветки в сниппете; фронтенд заменяет их на <mark>, не используя HTML из БД
+SEARCH_HIGHLIGHT_START = "\u0002"
+SEARCH_HIGHLIGHT_STOP = "\u0003"
+# ts_rank возвращает float4, который не переживает путь в JSON и обратно;
+# ранг округляется одинаково в ответе и в курсоре, чтобы равенство работало
+SEARCH_RANK_TYPE = Numeric(12, 8)
+SEARCH_RANK_QUANTUM = Decimal("1e-8")
+
+
+@router.get("/search", response_model=List[ChatSearchResult])
+def search_messages(
+    q: str,
+    limit: int = 20,
+    before_rank: Optional[float] = None,
+    before_id: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    threads = db.query(ChatThread).filter(
-        or_(
-            ChatThread.user_one_id == current_user.id,
-            ChatThread.user_two_id == current_user.id
+    """
+    Полнотекстовый поиск по сообщениям чатов текущего пользователя.
+    Результаты упорядочены по релевантности; следующая страница —
+    по курсору before_rank/before_id последнего результата.
+    """
+    q = q.strip()
+    if len(q) < 2:
+        raise HTTPException(status_code=400, detail="Слишком короткий поисковый запрос")
+    limit = max(1, min(limit, 50))
+
+    thread_ids = [
+        row.id for row in db.query(ChatThread.id).filter(
+            or_(
+                ChatThread.user_one_id == current_user.id,
+                ChatThread.user_two_id == current_user.id
+            )
+        )
+    ]
+    if not thread_ids:
+        return []
+
+    ts_query = func.websearch_to_tsquery(CHAT_SEARCH_CONFIG, q)
+    rank = cast(func.ts_rank(ChatMessage.content_tsv, ts_query), SEARCH_RANK_TYPE)
+
+    # thread_id и tsvector проверяются одним GIN-индексом (thread_id, content_tsv)
+    page = db.query(
+        ChatMessage.id.label("id"),
+        ChatMessage.thread_id.label("thread_id"),
+        ChatMessage.sender_id.label("sender_id"),
+        ChatMessage.created_at.label("created_at"),
+        rank.label("rank")
+    ).filter(
+        ChatMessage.thread_id.in_(thread_ids),
+        ChatMessage.content_tsv.op("@@")(ts_query)
+    )
+    if before_rank is not None and before_id is not None:
+        before_rank = Decimal(repr(before_rank)).quantize(SEARCH_RANK_QUANTUM)
+        page = page.filter(
+            or_(
+                rank < before_rank,
+                and_(rank == before_rank, ChatMessage.id < before_id)
+            )
         )
-    ).order_by(ChatThread.last_message_at.desc().nullslast()).all()
+    page = page.order_by(rank.desc(), ChatMessage.id.desc()).limit(limit).subquery()
+
+    # Сниппеты строятся только для строк текущей страницы
+    snippet = func.ts_headline(
+        CHAT_SEARCH_CONFIG,
+        ChatMessage.content,
+        ts_query,
+        f"StartSel={SEARCH_HIGHLIGHT_START}, StopSel={SEARCH_HIGHLIGHT_STOP}, MaxWords=25, MinWords=8"
+    )
+    rows = db.query(page, snippet.label("snippet")).join(
+        ChatMessage, ChatMessage.id == page.c.id
+    ).order_by(page.c.rank.desc(), page.c.id.desc()).all()
+
+    return [
+        ChatSearchResult(
+            message_id=row.id,
+            thread_id=row.thread_id,
+            sender_id=row.sender_id,
+            created_at=row.created_at,
+            snippet=row.snippet,
+            rank=row.rank
+        )
+        for row in rows
+    ]
 
-    return [_thread_to_response(db, thread, current_user) for thread in threads]
+
+@router.get("/presence", response_model=Dict[str, bool])
+async def get_presence(
+    user_ids: List[int] = Query(...),
+    current_user: User = Depends(get_current_user),
+    socket_manager=Depends(get_socket_manager)
+):
+    """Статус в сети для указанных пользователей (например, собеседников из списка чатов)"""
+    if len(user_ids) > MAX_PRESENCE_USERS:
+        raise HTTPException(status_code=400, detail="Слишком много пользователей в запросе")
+    return await socket_manager.get_presence(user_ids)
 
 
 @router.post("/threads", response_model=ChatThreadResponse)
@@ -130,70 +315,229 @@ def create_thread_by_book(
     return _thread_to_response(db, thread, current_user)
 
 
-@router.get("/threads/{thread_id}/messages", response_model=List[ChatMessageResponse])
-def get_thread_messages(
+@router.get(
+    "/threads/{thread_id}/messages",
+    response_model=List[ChatMessageResponse],
+    dependencies=[Depends(rate_limit("chat_poll"))]
+)
+async def get_thread_messages(
     thread_id: int,
     limit: int = 50,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    before_id: Optional[int] = None,
+    before_at: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: User = Depends(get_current_user_async)
 ):
-    thread = db.query(ChatThread).filter(ChatThread.id == thread_id).first()
+    """
+    История сообщений по курсору. Без курсора возвращает последние `limit`
+    сообщений, с before_id — страницу более старых, с after_id — более новых.
+    before_at (created_at сообщения before_id) позволяет не трогать более новые секции.
+    Когда сообщения в БД заканчиваются, а у чата есть архив (archived_max_id),
+    страница дополняется из архива.
+    Сообщения в ответе всегда идут по возрастанию id.
+    """
+    if before_id is not None and after_id is not None:
+        raise HTTPException(status_code=400, detail="Укажите только один из параметров before_id или after_id")
+
+    limit = max(1, min(limit, 200))
+
+    thread = await db.get(ChatThread, thread_id)
     if not thread:
         raise HTTPException(status_code=404, detail="Чат не найден")
     _ensure_membership(thread, current_user)
 
-    messages = db.query(ChatMessage).filter(
-        ChatMessage.thread_id == thread_id
-    ).order_by(ChatMessage.created_at.asc()).limit(limit).all()
-
-    unread_messages = [
-        message for message in messages
-        if message.sender_id != current_user.id and not message.is_read
-    ]
-    if unread_messages:
-        for message in unread_messages:
-            message.is_read = True
-            message.read_at = datetime.utcnow()
-        db.commit()
+    query = select(ChatMessage).where(ChatMessage.thread_id == thread_id)
+    if after_id is not None:
+        return (await db.execute(query.where(
+            ChatMessage.id > after_id
+        ).order_by(ChatMessage.id.asc()).limit(limit))).scalars().all()
+
+    if before_id is not None:
+        query = query.where(ChatMessage.id < before_id)
+    if before_at is not None:
+        query = query.where(ChatMessage.created_at <= before_at)
+
+    if before_id is None and before_at is None:
+        # Первая страница почти всегда целиком лежит в последних секциях
+        hot_window_start = datetime.now(timezone.utc) - timedelta(days=CHAT_HOT_WINDOW_DAYS)
+        messages = list((await db.execute(query.where(
+            ChatMessage.created_at >= hot_window_start
+        ).order_by(ChatMessage.id.desc()).limit(limit))).scalars())
+        # Чат моложе окна целиком в нём; иначе дочитываем только более старые секции
+        thread_is_recent = thread.created_at is not None and thread.created_at >= hot_window_start
+        if len(messages) < limit and not thread_is_recent:
+            older = query.where(ChatMessage.created_at < hot_window_start)
+            if messages:
+                older = older.where(ChatMessage.id < messages[-1].id)
+            messages.extend((await db.execute(
+                older.order_by(ChatMessage.id.desc()).limit(limit - len(messages))
+            )).scalars())
+    else:
+        messages = list((await db.execute(
+            query.order_by(ChatMessage.id.desc()).limit(limit)
+        )).scalars())
+    messages.reverse()
+
+    if len(messages) < limit and thread.archived_max_id is not None:
+        # Страница дошла до самого старого сообщения в БД, дальше — архив
+        oldest_id = messages[0].id if messages else before_id
+        object_names = (await db.execute(archived_page_select(thread_id, oldest_id))).scalars().all()
+        if object_names:
+            # Объекты MinIO читаются синхронным клиентом в пуле потоков
+            archived = await anyio.to_thread.run_sync(
+                read_archived_page, object_names, oldest_id, limit - len(messages)
+            )
+            return archived + messages
 
     return messages
 
 
-@router.post("/threads/{thread_id}/messages", response_model=ChatMessageResponse)
-def send_message(
+@router.get("/threads/{thread_id}/export")
+def export_thread_messages(
+    thread_id: int,
+    format: str = "ndjson",
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Полная история чата в NDJSON или CSV, от старых сообщений к новым:
+    сначала выгруженные в архив месяцы, затем сообщения из БД
+    """
+    thread = db.query(ChatThread).filter(ChatThread.id == thread_id).first()
+    if not thread:
+        raise HTTPException(status_code=404, detail="Чат не найден")
+    _ensure_membership(thread, current_user)
+
+    columns = ["id", "thread_id", "sender_id", "sender_username", "content", "created_at", "is_read", "read_at"]
+    # В архиве нет имён отправителей; в чате всего два участника
+    usernames = dict(
+        db.query(User.id, User.username).filter(User.id.in_([thread.user_one_id, thread.user_two_id])).all()
+    )
+
+    def archived_rows(export_db: Session):
+        for message in iter_archived_messages(export_db, thread_id):
+            yield (
+                message["id"],
+                message["thread_id"],
+                message["sender_id"],
+                usernames.get(message["sender_id"]),
+                message["content"],
+                message["created_at"],
+                message["is_read"],
+                message["read_at"]
+            )
+
+    def build_query(export_db: Session):
+        return export_db.query(
+            ChatMessage.id,
+            ChatMessage.thread_id,
+            ChatMessage.sender_id,
+            User.username,
+            ChatMessage.content,
+            ChatMessage.created_at,
+            ChatMessage.is_read,
+            ChatMessage.read_at
+        ).join(
+            User, User.id == ChatMessage.sender_id
+        ).filter(
+            ChatMessage.thread_id == thread_id
+        ).order_by(ChatMessage.id.asc())
+
+    return export_response(build_query, columns, format, f"chat-{thread_id}", leading_rows=archived_rows)
+
+
+@router.post("/threads/{thread_id}/read", response_model=ChatReadResponse)
+def mark_thread_read(
     thread_id: int,
-    payload: ChatMessageRequest,
     background_tasks: BackgroundTasks,
+    up_to: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     socket_manager=Depends(get_socket_manager)
 ):
-    if not payload.content.strip():
-        raise HTTPException(status_code=400, detail="Сообщение не может быть пустым")
-
+    """
+    Отмечает прочитанными входящие сообщения чата до up_to включительно
+    (по умолчанию — до последнего) и сдвигает водяной знак текущего участника.
+    Собеседник получает событие messages_read.
+    """
     thread = db.query(ChatThread).filter(ChatThread.id == thread_id).first()
     if not thread:
         raise HTTPException(status_code=404, detail="Чат не найден")
     _ensure_membership(thread, current_user)
 
-    message = ChatMessage(
-        thread_id=thread.id,
-        sender_id=current_user.id,
-        content=payload.content.strip()
-    )
-    db.add(message)
+    is_user_one = thread.user_one_id == current_user.id
+    last_read_column = ChatThread.user_one_last_read_id if is_user_one else ChatThread.user_two_last_read_id
+    partner_id = thread.user_two_id if is_user_one else thread.user_one_id
+    current_last_read_id = (thread.user_one_last_read_id if is_user_one else thread.user_two_last_read_id) or 0
 
-    thread.last_message = payload.content.strip()
-    thread.last_sender_id = current_user.id
-    thread.last_message_at = datetime.utcnow()
+    last_message_id = db.query(func.max(ChatMessage.id)).filter(
+        ChatMessage.thread_id == thread.id
+    ).scalar() or 0
+    if up_to is None or up_to > last_message_id:
+        up_to = last_message_id
 
+    if up_to <= current_last_read_id:
+        return ChatReadResponse(thread_id=thread.id, last_read_id=current_last_read_id, updated=0)
+
+    read_at = datetime.now(timezone.utc)
+    updated = db.query(ChatMessage).filter(
+        ChatMessage.thread_id == thread.id,
+        ChatMessage.sender_id != current_user.id,
+        ChatMessage.id <= up_to,
+        ChatMessage.is_read.is_(False)
+    ).update({ChatMessage.is_read: True, ChatMessage.read_at: read_at}, synchronize_session=False)
+
+    db.query(ChatThread).filter(ChatThread.id == thread.id).update(
+        {last_read_column: func.greatest(last_read_column, up_to)},
+        synchronize_session=False
+    )
     db.commit()
-    db.refresh(message)
 
     background_tasks.add_task(
-        socket_manager.notify_chat_message,
+        socket_manager.notify_messages_read,
         thread.id,
-        message.id
+        current_user.id,
+        partner_id,
+        up_to,
+        read_at
     )
 
+    return ChatReadResponse(thread_id=thread.id, last_read_id=up_to, updated=updated)
+
+
+@router.post("/threads/{thread_id}/messages", response_model=ChatMessageResponse)
+def send_message(
+    thread_id: int,
+    payload: ChatMessageRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    socket_manager=Depends(get_socket_manager),
+    chat_write_behind=Depends(get_chat_write_behind)
+):
+    if chat_write_behind is not None:
+        message, participants, created = anyio.from_thread.run(
+            chat_write_behind.submit,
+            thread_id,
+            current_user.id,
+            payload.content,
+            payload.client_id
+        )
+    else:
+        message, participants, created = persist_chat_message(
+            db,
+            thread_id,
+            current_user.id,
+            payload.content,
+            payload.client_id
+        )
+
+    if created:
+        background_tasks.add_task(
+            socket_manager.broadcast_chat_message,
+            chat_message_payload(message),
+            participants
+        )
+
     return message
@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from ..database import get_db
+from sqlalchemy.orm import Session, aliased, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, select
+from ..database import get_db, get_async_db
 from ..models import Exchange, Book, User
 from ..schemas import ExchangeResponse, ExchangeCreate
-from ..security import get_current_user
+from ..security import get_current_user, get_current_user_async
 from ..dependencies import get_socket_manager
 from ..storage import get_book_cover_url
+from ..export import export_response
 
 router = APIRouter(prefix="/exchanges", tags=["exchanges"])
 
@@ -49,23 +51,74 @@ def create_exchange(
     background_tasks.add_task(socket_manager.notify_new_exchange, db_exchange.id)
     return _attach_exchange_cover(db_exchange)
 
+def _exchange_list_query():
+    # В async-сессии ленивой загрузки нет: всё, что нужно ExchangeResponse, грузится сразу
+    return select(Exchange).options(
+        joinedload(Exchange.book).joinedload(Book.owner),
+        joinedload(Exchange.requester),
+        joinedload(Exchange.owner)
+    )
+
 @router.get("/my-requests", response_model=list[ExchangeResponse])
-def get_my_requests(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_my_requests(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     # Получаем все предложения обмена, где текущий пользователь - запросивший
-    exchanges = db.query(Exchange).filter(Exchange.requester_id == current_user.id).all()
-    return _attach_exchange_cover(exchanges)
+    exchanges = (await db.execute(
+        _exchange_list_query().where(Exchange.requester_id == current_user.id)
+    )).scalars().all()
+    return _attach_exchange_cover(list(exchanges))
 
 @router.get("/my-offers", response_model=list[ExchangeResponse])
-def get_my_offers(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_my_offers(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     # Получаем все предложения обмена, где текущий пользователь - владелец книги
-    exchanges = db.query(Exchange).filter(Exchange.owner_id == current_user.id).all()
-    return _attach_exchange_cover(exchanges)
+    exchanges = (await db.execute(
+        _exchange_list_query().where(Exchange.owner_id == current_user.id)
+    )).scalars().all()
+    return _attach_exchange_cover(list(exchanges))
+
+@router.get("/export")
+def export_exchanges(
+    format: str = "ndjson",
+    current_user: User = Depends(get_current_user)
+):
+    # Все обмены пользователя: и отправленные, и полученные предложения
+    columns = [
+        "id", "status", "book_id", "book_title", "book_author",
+        "requester_id", "requester_username", "owner_id", "owner_username",
+        "created_at", "updated_at"
+    ]
+    requester = aliased(User)
+    owner = aliased(User)
+
+    def build_query(export_db: Session):
+        return export_db.query(
+            Exchange.id,
+            Exchange.status,
+            Exchange.book_id,
+            Book.title,
+            Book.author,
+            Exchange.requester_id,
+            requester.username,
+            Exchange.owner_id,
+            owner.username,
+            Exchange.created_at,
+            Exchange.updated_at
+        ).join(
+            Book, Book.id == Exchange.book_id
+        ).join(
+            requester, requester.id == Exchange.requester_id
+        ).join(
+            owner, owner.id == Exchange.owner_id
+        ).filter(
+            or_(Exchange.requester_id == current_user.id, Exchange.owner_id == current_user.id)
+        ).order_by(Exchange.id.asc())
+
+    return export_response(build_query, columns, format, "exchanges")
 
 @router.put("/{exchange_id}/accept", response_model=ExchangeResponse)
 def accept_exchange(
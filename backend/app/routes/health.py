@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends
+
+from ..dependencies import get_socket_manager
+from ..health import readiness
+from ..responses import AppJSONResponse
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+
+@router.get("/live")
+async def liveness():
+    """Процесс отвечает; внешние сервисы не проверяются"""
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def readiness_probe(socket_manager=Depends(get_socket_manager)):
+    """Готовность принимать трафик: БД и хранилище доступны, воркер не останавливается"""
+    checks = await readiness()
+    ready = all(check["ok"] for check in checks.values()) and not socket_manager.draining
+    return AppJSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "unavailable",
+            "draining": socket_manager.draining,
+            "checks": checks
+        }
+    )
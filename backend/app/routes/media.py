@@ -1,8 +1,8 @@
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
 from starlette.background import BackgroundTask
-from minio.error import S3Error
 
+from ..metrics import observe_storage
 from ..storage import get_minio_client, MINIO_BUCKET_COVERS
 
 router = APIRouter(prefix="/media", tags=["media"])
@@ -21,11 +21,15 @@ def serve_media(object_path: str):
     if not object_path.startswith("covers/"):
         raise HTTPException(status_code=404, detail="Файл не найден")
 
+    from minio.error import S3Error
+
     client = get_minio_client()
 
     try:
-        stat = client.stat_object(MINIO_BUCKET_COVERS, object_path)
-        obj = client.get_object(MINIO_BUCKET_COVERS, object_path)
+        with observe_storage("stat_object"):
+            stat = client.stat_object(MINIO_BUCKET_COVERS, object_path)
+        with observe_storage("get_object"):
+            obj = client.get_object(MINIO_BUCKET_COVERS, object_path)
     except S3Error:
         raise HTTPException(status_code=404, detail="Файл не найден")
 
@@ -96,6 +96,7 @@ class RefreshTokenRequest(BaseModel):
 
 class ChatMessageRequest(BaseModel):
     content: str
+    client_id: Optional[str] = None
 
 
 class ChatMessageResponse(BaseModel):
@@ -105,6 +106,7 @@ class ChatMessageResponse(BaseModel):
     content: str
     created_at: datetime
     is_read: bool
+    client_id: Optional[str] = None
 
     class Config:
         orm_mode = True
@@ -116,6 +118,7 @@ class ChatThreadResponse(BaseModel):
     last_message: Optional[str] = None
     last_message_at: Optional[datetime] = None
     unread_count: int
+    partner_last_read_id: int = 0
 
     class Config:
         orm_mode = True
@@ -131,3 +134,18 @@ class ChatThreadByUsername(BaseModel):
 
 class ChatThreadByBook(BaseModel):
     book_id: int
+
+
+class ChatReadResponse(BaseModel):
+    thread_id: int
+    last_read_id: int
+    updated: int
+
+
+class ChatSearchResult(BaseModel):
+    message_id: int
+    thread_id: int
+    sender_id: int
+    created_at: datetime
+    snippet: str
+    rank: float
@@ -0,0 +1,77 @@
+"""
+Запуск uvicorn с предварительным выводом воркера из балансировки.
+
+Uvicorn по SIGTERM сразу закрывает listener и сокеты, а lifespan-остановка
+выполняется уже после этого, поэтому отметить воркер «неготовым» оттуда
+поздно. DrainingServer по первому SIGTERM сначала вызывает зарегистрированные
+drain-хуки (воркер отвечает 503 на /health/ready, закрывает вебсокеты и не
+принимает новые) и только через SHUTDOWN_DRAIN_DELAY секунд запускает обычную
+остановку uvicorn. Повторный сигнал и SIGINT останавливают сразу.
+
+    python -m app.serve                                     # один процесс
+    gunicorn -k app.serve.DrainingUvicornWorker ...         # см. gunicorn.conf.py
+"""
+import asyncio
+import os
+import signal
+from typing import Awaitable, Callable, List
+
+import uvicorn
+from dotenv import load_dotenv
+from uvicorn.workers import UvicornWorker
+
+load_dotenv()
+
+# Пауза между отметкой «не готов» и закрытием listener: балансировщик успевает
+# увидеть 503 на /health/ready. Должна быть меньше GRACEFUL_TIMEOUT
+SHUTDOWN_DRAIN_DELAY = float(os.getenv("SHUTDOWN_DRAIN_DELAY", "5"))
+
+_drain_hooks: List[Callable[[], Awaitable[None]]] = []
+
+
+def register_drain_hook(hook: Callable[[], Awaitable[None]]):
+    _drain_hooks.append(hook)
+
+
+class DrainingServer(uvicorn.Server):
+    def __init__(self, config: uvicorn.Config):
+        super().__init__(config)
+        self.draining = False
+
+    def handle_exit(self, sig, frame):
+        if sig != signal.SIGTERM or self.draining or SHUTDOWN_DRAIN_DELAY <= 0:
+            super().handle_exit(sig, frame)
+            return
+        self.draining = True
+        loop = asyncio.get_event_loop()
+        for hook in _drain_hooks:
+            loop.create_task(hook())
+        loop.call_later(SHUTDOWN_DRAIN_DELAY, super().handle_exit, sig, frame)
+
+
+class DrainingUvicornWorker(UvicornWorker):
+    """UvicornWorker, у которого сервер — DrainingServer"""
+
+    async def _serve(self) -> None:
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            from gunicorn.arbiter import Arbiter
+
+            raise SystemExit(Arbiter.WORKER_BOOT_ERROR)
+
+
+def main():
+    config = uvicorn.Config(
+        "app.main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+    )
+    DrainingServer(config).run()
+
+
+if __name__ == "__main__":
+    main()
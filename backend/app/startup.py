@@ -0,0 +1,100 @@
+"""
+Подготовка контейнера перед запуском сервера: ожидание Postgres и миграции,
+только если схема отстаёт от head. Всё в одном процессе Python, без
+импорта приложения.
+
+    python -m app.startup
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+STARTUP_DB_TIMEOUT = float(os.getenv("STARTUP_DB_TIMEOUT", "60"))
+# Ключ advisory-блокировки: реплики, стартующие одновременно, не гоняют миграции параллельно
+MIGRATIONS_LOCK_KEY = 7301002
+
+
+def connect(timeout: float = STARTUP_DB_TIMEOUT):
+    """Соединение с Postgres с частыми повторами вместо ожидания по секунде"""
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        raise SystemExit("DATABASE_URL is not set")
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while True:
+        try:
+            return psycopg2.connect(url, connect_timeout=2)
+        except psycopg2.OperationalError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+
+def current_revisions(conn) -> set:
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('alembic_version') IS NOT NULL")
+        if not cursor.fetchone()[0]:
+            return set()
+        cursor.execute("SELECT version_num FROM alembic_version")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def alembic_config():
+    from alembic.config import Config
+
+    config = Config(str(BASE_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(BASE_DIR / "alembic"))
+    return config
+
+
+def head_revisions(config) -> set:
+    from alembic.script import ScriptDirectory
+
+    return set(ScriptDirectory.from_config(config).get_heads())
+
+
+def migrate_if_needed(conn) -> bool:
+    config = alembic_config()
+    heads = head_revisions(config)
+    if current_revisions(conn) == heads:
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_KEY,))
+    try:
+        # Пока ждали блокировку, миграции могла выполнить другая реплика
+        if current_revisions(conn) == heads:
+            return False
+        from alembic import command
+
+        command.upgrade(config, "head")
+        return True
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_KEY,))
+
+
+def main():
+    started = time.perf_counter()
+    print("⏳ Waiting for Postgres...")
+    conn = connect()
+    conn.autocommit = True
+    print(f"✅ Postgres is ready ({time.perf_counter() - started:.2f}s)")
+    try:
+        if migrate_if_needed(conn):
+            print(f"🗄️  Migrations applied ({time.perf_counter() - started:.2f}s)")
+        else:
+            print("🗄️  Schema is at head, skipping migrations")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
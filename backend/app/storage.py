@@ -1,15 +1,18 @@
 import os
 import logging
+import threading
 from io import BytesIO
 from uuid import uuid4
-from typing import Optional, Tuple
+from typing import TYPE_CHECKING, Optional, Tuple
 
-from minio import Minio
-from minio.error import S3Error
 from fastapi import HTTPException
-from PIL import Image
 from dotenv import load_dotenv
 
+from .metrics import observe_image_processing, observe_storage
+
+if TYPE_CHECKING:
+    from minio import Minio
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
@@ -17,6 +20,7 @@ MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "localhost:9000")
 MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
 MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minioadmin")
 MINIO_BUCKET_COVERS = os.getenv("MINIO_BUCKET_COVERS", "bookex-covers")
+MINIO_BUCKET_ARCHIVE = os.getenv("MINIO_BUCKET_ARCHIVE", "bookex-archive")
 MINIO_SECURE = os.getenv("MINIO_SECURE", "false").lower() == "true"
 MINIO_PUBLIC_URL = os.getenv("MINIO_PUBLIC_URL")
 MINIO_PREFER_DIRECT_URL = os.getenv("MINIO_PREFER_DIRECT_URL", "false").lower() == "true"
@@ -24,29 +28,44 @@ APP_BASE_URL = os.getenv("APP_BASE_URL", "http://localhost:8000")
 
 TARGET_COVER_SIZE = (600, 900)
 
-_minio_client: Optional[Minio] = None
+# Клиент создаётся лениво в каждом процессе-воркере (после fork), а не при импорте
+_minio_client: Optional["Minio"] = None
+_minio_lock = threading.Lock()
+_archive_bucket_ready = False
 
 
-def get_minio_client() -> Minio:
+def get_minio_client() -> "Minio":
     global _minio_client
-    if _minio_client is None:
-        _minio_client = Minio(
-            endpoint=MINIO_ENDPOINT,
-            access_key=MINIO_ACCESS_KEY,
-            secret_key=MINIO_SECRET_KEY,
-            secure=MINIO_SECURE
-        )
-        try:
-            if not _minio_client.bucket_exists(MINIO_BUCKET_COVERS):
-                _minio_client.make_bucket(MINIO_BUCKET_COVERS)
-                logger.info("Создан бакет MinIO %s", MINIO_BUCKET_COVERS)
-        except S3Error as exc:
-            logger.error("Не удалось проверить/создать бакет MinIO: %s", exc)
-            raise
+    if _minio_client is not None:
+        return _minio_client
+    # minio импортируется при первом обращении к хранилищу
+    from minio import Minio
+    from minio.error import S3Error
+    with _minio_lock:
+        if _minio_client is None:
+            client = Minio(
+                endpoint=MINIO_ENDPOINT,
+                access_key=MINIO_ACCESS_KEY,
+                secret_key=MINIO_SECRET_KEY,
+                secure=MINIO_SECURE
+            )
+            try:
+                with observe_storage("bucket_exists"):
+                    bucket_exists = client.bucket_exists(MINIO_BUCKET_COVERS)
+                if not bucket_exists:
+                    client.make_bucket(MINIO_BUCKET_COVERS)
+                    logger.info("Создан бакет MinIO %s", MINIO_BUCKET_COVERS)
+            except S3Error as exc:
+                if exc.code != "BucketAlreadyOwnedByYou":
+                    logger.error("Не удалось проверить/создать бакет MinIO: %s", exc)
+                    raise
+            _minio_client = client
     return _minio_client
 
 
 def _process_image(upload_file) -> Tuple[BytesIO, str]:
+    from PIL import Image
+
     upload_file.file.seek(0)
     buffer = BytesIO()
     content_type = upload_file.content_type or "image/jpeg"
@@ -86,19 +105,23 @@ def _process_image(upload_file) -> Tuple[BytesIO, str]:
 
 
 def upload_book_cover(upload_file) -> str:
+    from minio.error import S3Error
+
     client = get_minio_client()
     object_name = f"covers/{uuid4().hex}.jpg"
-    buffer, content_type = _process_image(upload_file)
+    with observe_image_processing():
+        buffer, content_type = _process_image(upload_file)
     data = buffer.getvalue()
 
     try:
-        client.put_object(
-            bucket_name=MINIO_BUCKET_COVERS,
-            object_name=object_name,
-            data=BytesIO(data),
-            length=len(data),
-            content_type=content_type
-        )
+        with observe_storage("put_object"):
+            client.put_object(
+                bucket_name=MINIO_BUCKET_COVERS,
+                object_name=object_name,
+                data=BytesIO(data),
+                length=len(data),
+                content_type=content_type
+            )
     except S3Error as exc:
         logger.error("Ошибка загрузки файла в MinIO: %s", exc)
         raise HTTPException(status_code=500, detail="Не удалось загрузить обложку")
@@ -111,9 +134,12 @@ def delete_book_cover(object_name: Optional[str]):
         return
     if "/" not in object_name:
         return
+    from minio.error import S3Error
+
     client = get_minio_client()
     try:
-        client.remove_object(MINIO_BUCKET_COVERS, object_name)
+        with observe_storage("remove_object"):
+            client.remove_object(MINIO_BUCKET_COVERS, object_name)
     except S3Error as exc:
         logger.warning("Не удалось удалить обложку %s: %s", object_name, exc)
 
@@ -132,3 +158,37 @@ def get_book_cover_url(object_name: Optional[str]) -> Optional[str]:
     base_app = APP_BASE_URL.rstrip("/")
     normalized_object = object_name.lstrip("/")
     return f"{base_app}/media/{normalized_object}"
+
+
+def _ensure_archive_bucket(client: "Minio"):
+    global _archive_bucket_ready
+    if not _archive_bucket_ready:
+        if not client.bucket_exists(MINIO_BUCKET_ARCHIVE):
+            client.make_bucket(MINIO_BUCKET_ARCHIVE)
+            logger.info("Создан бакет MinIO %s", MINIO_BUCKET_ARCHIVE)
+        _archive_bucket_ready = True
+
+
+def put_archive_object(object_name: str, data: bytes, content_type: str = "application/gzip"):
+    client = get_minio_client()
+    _ensure_archive_bucket(client)
+    with observe_storage("put_archive_object"):
+        client.put_object(
+            bucket_name=MINIO_BUCKET_ARCHIVE,
+            object_name=object_name,
+            data=BytesIO(data),
+            length=len(data),
+            content_type=content_type
+        )
+
+
+def get_archive_object(object_name: str) -> bytes:
+    client = get_minio_client()
+    with observe_storage("get_archive_object"):
+        response = client.get_object(MINIO_BUCKET_ARCHIVE, object_name)
+    try:
+        with observe_storage("read_archive_object"):
+            return response.read()
+    finally:
+        response.close()
+        response.release_conn()
@@ -1,10 +1,33 @@
+import asyncio
 import socketio
-from jose import jwt
-from typing import Dict, Set, Optional
+from jose import JWTError, jwt
+from typing import Dict, List, Optional, Set
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
-from .database import get_db
-from .models import User, Exchange, Book, ChatThread, ChatMessage
+from .realtime_db import RealtimeDB
+from .exchange_events import load_exchange_event, EXCHANGE_CREATED, EXCHANGE_STATUS_CHANGED
+from .notifications import NotificationOutbox, load_notifications_since, notification_event
+from .models import User, Exchange, Book
+from .messaging import persist_chat_message, chat_message_payload
+from .presence import (
+    create_presence_store,
+    SOCKETIO_REDIS_URL,
+    PRESENCE_NODE_TTL,
+    PRESENCE_OFFLINE_GRACE,
+    MAX_PRESENCE_USERS
+)
+from .realtime_logging import realtime_logger
+from .metrics import observe_emit, SOCKETIO_CONNECTIONS
+from .read_replica import mark_user_write
+from .wire import (
+    SOCKETIO_SERIALIZER,
+    SOCKETIO_COMPACT_EVENTS,
+    compact_chat_message,
+    compact_notification,
+    compact_presence,
+    compact_messages_read
+)
+from fastapi import HTTPException
 from datetime import datetime
 from dotenv import load_dotenv
 import os
@@ -15,31 +38,67 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 
+logger = realtime_logger("bookex.realtime")
+
+
+def user_room(user_id, compact: bool = False) -> str:
+    # Клиенты с компактными схемами событий живут в отдельных комнатах
+    return f"user:{user_id}:c" if compact else f"user:{user_id}"
+
+
+def presence_room(user_id, compact: bool = False) -> str:
+    """Комната подписчиков на статус пользователя"""
+    return f"presence:{user_id}:c" if compact else f"presence:{user_id}"
+
+
 class SocketManager:
     def __init__(self):
+        # С общим Redis события рассылаются всем процессам и узлам
+        client_manager = socketio.AsyncRedisManager(SOCKETIO_REDIS_URL) if SOCKETIO_REDIS_URL else None
         self.sio = socketio.AsyncServer(
             async_mode='asgi',
+            client_manager=client_manager,
             cors_allowed_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
             allow_upgrades=True,
             ping_timeout=60,
             ping_interval=25,
-            logger=True,
-            engineio_logger=True
+            serializer=SOCKETIO_SERIALIZER,
+            logger=realtime_logger("socketio.server"),
+            engineio_logger=realtime_logger("engineio.server")
         )
         self.app = socketio.ASGIApp(self.sio, socketio_path='socket.io')
-        self.online_users: Dict[str, Set[str]] = {}
+        self.presence = create_presence_store()
+        self.db = RealtimeDB()
+        self.notifications = NotificationOutbox(self.db, self._deliver_notification)
+        # Обратное отображение sid -> user_id для сокетов этого процесса
+        self.sid_users: Dict[str, str] = {}
+        # Подписки сокетов этого процесса на статусы пользователей
+        self.sid_presence: Dict[str, Set[str]] = {}
+        # Сокеты этого процесса, запросившие компактные схемы событий
+        self.compact_sids: Set[str] = set()
+        # Отложенные объявления ухода в офлайн
+        self._offline_timers: Dict[str, asyncio.Task] = {}
+        self._presence_task: Optional[asyncio.Task] = None
+        # Устанавливается при старте приложения, если включён CHAT_WRITE_BEHIND
+        self.chat_write_behind = None
+        # Воркер останавливается: новые подключения уходят в другие процессы
+        self.draining = False
         self.setup_events()
     
     def setup_events(self):
         @self.sio.event
         async def connect(sid, environ, auth):
-            print(f"🔌 Клиент подключен: {sid}")
+            logger.info("🔌 Клиент подключен: %s", sid)
+            if self.draining:
+                return False
             # Получаем токен из query параметров
             query_string = environ.get('QUERY_STRING', '')
             token = None
             
             if 'token=' in query_string:
                 token = query_string.split('token=')[1].split('&')[0]
+            if SOCKETIO_COMPACT_EVENTS and 'compact=1' in query_string.split('&'):
+                self.compact_sids.add(sid)
             
             if token:
                 try:
@@ -48,18 +107,11 @@ class SocketManager:
 
                     if user_id:
                         user_id_str = str(user_id)
-                        if user_id_str not in self.online_users:
-                            self.online_users[user_id_str] = set()
-                        self.online_users[user_id_str].add(sid)
-                        await self.sio.save_session(sid, {'user_id': user_id_str})
+                        await self.register_socket(sid, user_id_str)
                         await self.sio.emit('auth_success', {'user_id': user_id_str}, to=sid)
-                        if len(self.online_users[user_id_str]) == 1:
-                            await self.sio.emit('user_online', {'user_id': user_id_str})
-                        await self.sio.emit('online_users', {'users': list(self.online_users.keys())}, to=sid)
-                        await self.send_pending_exchanges(user_id_str)
                         return True
                 except Exception as e:
-                    print(f"❌ Ошибка аутентификации: {str(e)}")
+                    logger.error(f"❌ Ошибка аутентификации: {str(e)}")
                     await self.sio.emit('auth_error', {'error': str(e)}, to=sid)
             
             # Если аутентификация не прошла
@@ -68,20 +120,8 @@ class SocketManager:
 
         @self.sio.event
         async def disconnect(sid):
-            print(f"🔌 Клиент отключен: {sid}")
-            # Находим и удаляем пользователя
-            user_id_to_remove = None
-            for user_id, sessions in list(self.online_users.items()):
-                if sid in sessions:
-                    sessions.remove(sid)
-                    if not sessions:  # Если нет активных сессий для пользователя
-                        del self.online_users[user_id]
-                        user_id_to_remove = user_id
-                    break
-            
-            if user_id_to_remove:
-                await self.sio.emit('user_offline', {'user_id': user_id_to_remove})
-                print(f"👤 Пользователь {user_id_to_remove} отключен")
+            logger.info("🔌 Клиент отключен: %s", sid)
+            await self.unregister_socket(sid)
 
         @self.sio.event
         async def authenticate(sid, token_data):
@@ -94,134 +134,307 @@ class SocketManager:
                 
                 if not token or not user_id:
                     await self.sio.emit('auth_error', {'error': 'Требуется токен и user_id'}, to=sid)
-                    print("❌ Ошибка аутентификации: отсутствует токен или user_id")
+                    logger.error("❌ Ошибка аутентификации: отсутствует токен или user_id")
                     return False
                 
-                # Просто сохраняем пользователя (в реальном проекте здесь должна быть проверка токена)
-                if user_id not in self.online_users:
-                    self.online_users[user_id] = set()
-                self.online_users[user_id].add(sid)
-                
-                await self.sio.save_session(sid, {'user_id': user_id})
+                # Комната user:{id} получает личные события, поэтому user_id должен совпадать с токеном
+                try:
+                    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+                except JWTError:
+                    await self.sio.emit('auth_error', {'error': 'Недействительный токен'}, to=sid)
+                    logger.error("❌ Ошибка аутентификации: недействительный токен")
+                    return False
+                if str(payload.get('user_id')) != str(user_id):
+                    await self.sio.emit('auth_error', {'error': 'user_id не совпадает с токеном'}, to=sid)
+                    logger.error("❌ Ошибка аутентификации: user_id %s не совпадает с токеном", user_id)
+                    return False
+
+                user_id = str(user_id)
+                if SOCKETIO_COMPACT_EVENTS and token_data.get('compact'):
+                    self.compact_sids.add(sid)
+                await self.register_socket(sid, user_id)
                 await self.sio.emit('auth_success', {'user_id': user_id}, to=sid)
-                if len(self.online_users[user_id]) == 1:
-                    await self.sio.emit('user_online', {'user_id': user_id})
-                await self.sio.emit('online_users', {'users': list(self.online_users.keys())}, to=sid)
-                print(f"✅ Пользователь {user_id} успешно прошел аутентификацию")
-                
-                # Отправляем уведомления о новых обменах
-                await self.send_pending_exchanges(user_id, sid)
+                logger.info("✅ Пользователь %s успешно прошел аутентификацию", user_id)
                 return True
                 
             except Exception as e:
                 error_msg = str(e)
-                print(f"❌ Ошибка аутентификации: {error_msg}")
+                logger.error(f"❌ Ошибка аутентификации: {error_msg}")
                 await self.sio.emit('auth_error', {'error': error_msg}, to=sid)
                 return False
 
         @self.sio.event
-        async def get_online_users(sid):
-            await self.sio.emit('online_users', {'users': list(self.online_users.keys())}, to=sid)
+        async def subscribe_presence(sid, data):
+            """
+            Заменяет набор пользователей, за статусом которых следит сокет.
+            В ответ приходят текущие статусы только что добавленных пользователей,
+            дальше — события user_online/user_offline только по ним.
+            """
+            if sid not in self.sid_users:
+                return {'ok': False, 'error': 'Требуется аутентификация'}
+            user_ids = data.get('user_ids') if isinstance(data, dict) else None
+            if not isinstance(user_ids, list):
+                return {'ok': False, 'error': 'Некорректный список пользователей'}
+            if len(user_ids) > MAX_PRESENCE_USERS:
+                return {'ok': False, 'error': 'Слишком много пользователей в подписке'}
+
+            wanted = {str(user_id) for user_id in user_ids}
+            current = self.sid_presence.get(sid, set())
+            added = wanted - current
+            compact = sid in self.compact_sids
+            for user_id in current - wanted:
+                await self.sio.leave_room(sid, presence_room(user_id, compact))
+            for user_id in added:
+                await self.sio.enter_room(sid, presence_room(user_id, compact))
+            if sid not in self.sid_users:
+                # Сокет отключился, пока обновлялась подписка
+                return {'ok': False, 'error': 'Соединение закрыто'}
+            self.sid_presence[sid] = wanted
+            return {'ok': True, 'statuses': await self.presence.statuses(sorted(added))}
+
+        @self.sio.event
+        async def get_presence(sid, data):
+            """Разовый запрос статусов без подписки"""
+            user_ids = data.get('user_ids') if isinstance(data, dict) else None
+            if not isinstance(user_ids, list) or len(user_ids) > MAX_PRESENCE_USERS:
+                return {'ok': False, 'error': 'Некорректный список пользователей'}
+            return {'ok': True, 'statuses': await self.get_presence(user_ids)}
+
+        @self.sio.event
+        async def sync_notifications(sid, data=None):
+            """
+            Синхронизация уведомлений. Клиент передаёт since — номер последнего
+            полученного уведомления — и получает пропущенные; полный снимок
+            предложений обмена возвращается только при первом подключении
+            или слишком большом разрыве.
+            """
+            user_id = self.sid_users.get(sid)
+            if not user_id:
+                return {'ok': False, 'error': 'Требуется аутентификация'}
+            since = data.get('since') if isinstance(data, dict) else None
+            try:
+                result = await self.db.run(
+                    load_notifications_since, int(user_id), int(since) if since is not None else None
+                )
+            except (TypeError, ValueError):
+                return {'ok': False, 'error': 'Некорректный номер события'}
+            except Exception as e:
+                logger.error(f"❌ Ошибка синхронизации уведомлений: {str(e)}")
+                return {'ok': False, 'error': 'Не удалось получить уведомления'}
+            return {'ok': True, **result}
+
+        @self.sio.event
+        async def send_chat_message(sid, data):
+            """
+            Отправка сообщения через сокет. Клиент передаёт thread_id, content и
+            client_id; результат возвращается в ack-колбэк.
+            """
+            session = await self.sio.get_session(sid)
+            user_id = session.get('user_id') if session else None
+            if not user_id:
+                return {'ok': False, 'error': 'Требуется аутентификация'}
+            if not isinstance(data, dict):
+                return {'ok': False, 'error': 'Некорректные данные сообщения'}
+            try:
+                thread_id = int(data.get('thread_id'))
+            except (TypeError, ValueError):
+                return {'ok': False, 'error': 'Некорректный thread_id'}
+
+            try:
+                message, participants, created = await self.store_chat_message(
+                    thread_id, int(user_id), data.get('content'), data.get('client_id')
+                )
+            except HTTPException as exc:
+                return {'ok': False, 'error': exc.detail}
+            except Exception as e:
+                logger.error(f"❌ Ошибка сохранения сообщения: {str(e)}")
+                return {'ok': False, 'error': 'Не удалось отправить сообщение'}
+
+            if created:
+                # Следующее чтение истории этим пользователем не должно попасть на отстающую реплику
+                await mark_user_write(user_id)
+                await self.broadcast_chat_message(chat_message_payload(message), participants)
+            return {'ok': True, 'message': message}
 
-    async def send_pending_exchanges(self, user_id: str, sid: Optional[str] = None):
-        """Отправка уведомлений о новых предложениях обмена"""
+    async def start(self):
+        await self.presence.start()
+        await self.notifications.start()
+        self._presence_task = asyncio.create_task(self._expire_dead_nodes())
+
+    async def drain(self):
+        """
+        Первый шаг остановки воркера (по SIGTERM, см. app/serve.py, и ещё раз
+        в lifespan): закрывает сокеты этого процесса (клиенты переподключаются
+        к другим воркерам) и дожидается отложенных объявлений ухода в офлайн,
+        чтобы по ушедшим пользователям их не потерять.
+        """
+        self.draining = True
+        # Закрытие на уровне engine.io: клиент видит обрыв транспорта и переподключается сам
+        await self.sio.eio.disconnect()
+        timers = list(self._offline_timers.values())
+        if timers:
+            await asyncio.wait(timers, timeout=PRESENCE_OFFLINE_GRACE + 1)
+
+    async def stop(self):
+        if self._presence_task:
+            self._presence_task.cancel()
+            self._presence_task = None
+        for task in self._offline_timers.values():
+            task.cancel()
+        self._offline_timers.clear()
+        await self.notifications.stop()
+        await self.presence.stop()
+        await asyncio.to_thread(self.db.shutdown)
+
+    async def online_count(self) -> int:
+        return await self.presence.count()
+
+    async def is_online(self, user_id) -> bool:
+        return await self.presence.is_online(str(user_id))
+
+    async def get_presence(self, user_ids) -> Dict[str, bool]:
+        """Статус в сети для набора пользователей"""
+        return await self.presence.statuses([str(user_id) for user_id in user_ids])
+
+    async def register_socket(self, sid: str, user_id: str):
+        """
+        Привязывает сокет к пользователю: комната user:{id}, обратное
+        отображение и общее присутствие. Отключение, пришедшее во время
+        регистрации, корректно откатывает её.
+        """
+        # Обратное отображение заполняется до первого await, чтобы disconnect его увидел
+        self.sid_users[sid] = user_id
+        SOCKETIO_CONNECTIONS.set(len(self.sid_users))
+        await self.sio.save_session(sid, {'user_id': user_id})
+        await self.sio.enter_room(sid, user_room(user_id, sid in self.compact_sids))
+        became_online = await self.presence.add(user_id, sid)
+        if sid not in self.sid_users:
+            # Сокет уже отключился, пока шла регистрация
+            if await self.presence.remove(user_id, sid):
+                self._schedule_offline(user_id)
+            return
+        if became_online:
+            pending = self._offline_timers.pop(user_id, None)
+            if pending is not None:
+                # Переподключение в пределах задержки: подписчики не видели ухода
+                pending.cancel()
+            else:
+                await self.emit_presence('user_online', user_id)
+
+    async def unregister_socket(self, sid: str):
+        user_id = self.sid_users.pop(sid, None)
+        SOCKETIO_CONNECTIONS.set(len(self.sid_users))
+        self.sid_presence.pop(sid, None)
+        self.compact_sids.discard(sid)
+        if user_id and await self.presence.remove(user_id, sid):
+            self._schedule_offline(user_id)
+            logger.info("👤 Пользователь %s отключен", user_id)
+
+    def _schedule_offline(self, user_id: str):
+        if user_id not in self._offline_timers:
+            self._offline_timers[user_id] = asyncio.create_task(self._announce_offline(user_id))
+
+    async def _announce_offline(self, user_id: str):
+        """Объявляет уход, если пользователь не вернулся за PRESENCE_OFFLINE_GRACE секунд"""
         try:
-            db = next(get_db())
-            exchanges = db.query(Exchange).join(Book).filter(
-                Exchange.owner_id == int(user_id),
-                Exchange.status == 'pending'
-            ).all()
-            
-            notifications = []
-            for exchange in exchanges:
-                notifications.append({
-                    'id': exchange.id,
-                    'book_id': exchange.book_id,
-                    'book_title': exchange.book.title if exchange.book else 'Неизвестная книга',
-                    'requester_id': exchange.requester_id,
-                    'requester_username': exchange.requester.username if exchange.requester else 'Неизвестный пользователь',
-                    'created_at': exchange.created_at.isoformat() if exchange.created_at else ''
-                })
-            
-            if notifications:
-                if sid:
-                    await self.sio.emit('new_exchanges', {'exchanges': notifications}, to=sid)
-                else:
-                    if user_id in self.online_users:
-                        for session_id in self.online_users[user_id]:
-                            await self.sio.emit('new_exchanges', {'exchanges': notifications}, to=session_id)
-                print(f"📨 Отправлено {len(notifications)} уведомлений пользователю {user_id}")
-                
+            await asyncio.sleep(PRESENCE_OFFLINE_GRACE)
+            if not await self.presence.is_online(user_id):
+                await self.emit_presence('user_offline', user_id)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            print(f"❌ Ошибка отправки уведомлений: {str(e)}")
+            logger.error(f"❌ Ошибка объявления статуса: {str(e)}")
         finally:
-            db.close()
+            if self._offline_timers.get(user_id) is asyncio.current_task():
+                del self._offline_timers[user_id]
+
+    async def emit_to_users(self, event: str, data, user_ids, compact=None):
+        """
+        Одна отправка в комнаты пользователей вместо цикла по их сокетам.
+        compact — функция, строящая компактную схему события для клиентов с compact=1.
+        """
+        user_ids = {str(user_id) for user_id in user_ids if user_id is not None}
+        if not user_ids:
+            return
+        with observe_emit(event):
+            await self.sio.emit(event, data, to=sorted(user_room(user_id) for user_id in user_ids))
+            if SOCKETIO_COMPACT_EVENTS and compact is not None:
+                await self.sio.emit(event, compact(data), to=sorted(user_room(user_id, True) for user_id in user_ids))
+
+    async def emit_presence(self, event: str, user_id: str):
+        payload = {'user_id': user_id}
+        with observe_emit(event):
+            await self.sio.emit(event, payload, to=presence_room(user_id))
+            if SOCKETIO_COMPACT_EVENTS:
+                await self.sio.emit(event, compact_presence(payload), to=presence_room(user_id, True))
+
+    async def _expire_dead_nodes(self):
+        """Периодически убирает подключения упавших узлов из общего присутствия"""
+        while True:
+            await asyncio.sleep(PRESENCE_NODE_TTL)
+            try:
+                for user_id in await self.presence.expire_dead_nodes():
+                    self._schedule_offline(user_id)
+            except Exception as e:
+                logger.error(f"❌ Ошибка очистки присутствия: {str(e)}")
+
+    async def _deliver_notification(self, notification: dict):
+        await self.emit_to_users(
+            'notification', notification_event(notification), [notification['user_id']], compact=compact_notification
+        )
+
+    async def publish_exchange_event(self, exchange_id: int, event_type: str):
+        """Ставит уведомление об обмене в очередь; доставка — после записи в БД"""
+        loaded = await self.db.run(load_exchange_event, exchange_id, event_type)
+        if loaded is None:
+            return None
+        recipient_id, payload = loaded
+        self.notifications.publish(recipient_id, event_type, payload)
+        return recipient_id
 
     async def notify_new_exchange(self, exchange_id: int):
         """Уведомление о новом предложении обмена"""
         try:
-            db = next(get_db())
-            exchange = db.query(Exchange).get(exchange_id)
-            if exchange:
-                await self.send_pending_exchanges(str(exchange.owner_id))
-                print(f"🔔 Уведомление о новом обмене ID {exchange_id} отправлено владельцу {exchange.owner_id}")
+            owner_id = await self.publish_exchange_event(exchange_id, EXCHANGE_CREATED)
+            if owner_id is not None:
+                logger.info("🔔 Уведомление о новом обмене ID %s поставлено в очередь владельцу %s", exchange_id, owner_id)
         except Exception as e:
-            print(f"❌ Ошибка уведомления о новом обмене: {str(e)}")
-        finally:
-            db.close()
-
+            logger.error(f"❌ Ошибка уведомления о новом обмене: {str(e)}")
 
     async def notify_exchange_status_update(self, exchange_id: int, status: str):
-        """Уведомление об обновлении статуса обмена"""
+        """Уведомление об обновлении статуса обмена (статус берётся из БД)"""
         try:
-            db = next(get_db())
-            exchange = db.query(Exchange).get(exchange_id)
-            if exchange:
-                if str(exchange.requester_id) in self.online_users:
-                    for session_id in self.online_users[str(exchange.requester_id)]:
-                        await self.sio.emit('exchange_status_update', {
-                            'exchange_id': exchange.id,
-                            'book_title': exchange.book.title if exchange.book else 'Неизвестная книга',
-                            'status': status
-                        }, to=session_id)
-                    print(f"🔔 Уведомление о статусе обмена ID {exchange_id} отправлено запрашивающему {exchange.requester_id}")
+            requester_id = await self.publish_exchange_event(exchange_id, EXCHANGE_STATUS_CHANGED)
+            if requester_id is not None:
+                logger.info(
+                    "🔔 Уведомление о статусе обмена ID %s (%s) поставлено в очередь запрашивающему %s",
+                    exchange_id, status, requester_id
+                )
         except Exception as e:
-            print(f"❌ Ошибка уведомления о статусе обмена: {str(e)}")
-        finally:
-            db.close()
+            logger.error(f"❌ Ошибка уведомления о статусе обмена: {str(e)}")
 
-    async def notify_chat_message(self, thread_id: int, message_id: int):
-        """Отправка сообщений чата в реальном времени"""
+    async def store_chat_message(self, thread_id: int, sender_id: int, content, client_id=None):
+        """Сохранение сообщения: через очередь отложенной записи, если она включена"""
+        if self.chat_write_behind is not None:
+            return await self.chat_write_behind.submit(thread_id, sender_id, content, client_id)
+        return await self.db.run(persist_chat_message, thread_id, sender_id, content, client_id)
+
+    async def broadcast_chat_message(self, payload: dict, recipients):
+        """Отправка сообщения чата в реальном времени из уже имеющихся данных"""
         try:
-            db = next(get_db())
-            message = db.query(ChatMessage).get(message_id)
-            thread = db.query(ChatThread).get(thread_id)
-            if not message or not thread:
-                return
+            await self.emit_to_users('chat_message', payload, recipients, compact=compact_chat_message)
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки чата: {str(e)}")
 
+    async def notify_messages_read(self, thread_id: int, reader_id: int, partner_id: int, up_to: int, read_at: datetime):
+        """Уведомление о прочтении сообщений (обоим участникам, чтобы синхронизировать вкладки читателя)"""
+        try:
             payload = {
-                "thread_id": thread.id,
-                "message": {
-                    "id": message.id,
-                    "thread_id": thread.id,
-                    "sender_id": message.sender_id,
-                    "content": message.content,
-                    "created_at": message.created_at.isoformat() if message.created_at else datetime.utcnow().isoformat()
-                },
-                "meta": {
-                    "last_message": thread.last_message,
-                    "last_message_at": thread.last_message_at.isoformat() if thread.last_message_at else None
-                }
+                "thread_id": thread_id,
+                "reader_id": reader_id,
+                "up_to": up_to,
+                "read_at": read_at.isoformat()
             }
-
-            recipients = {thread.user_one_id, thread.user_two_id}
-            for user_id in recipients:
-                if user_id is None:
-                    continue
-                sessions = self.online_users.get(str(user_id), set())
-                for sid in sessions:
-                    await self.sio.emit('chat_message', payload, to=sid)
+            await self.emit_to_users('messages_read', payload, [partner_id, reader_id], compact=compact_messages_read)
         except Exception as e:
-            print(f"❌ Ошибка отправки чата: {str(e)}")
-        finally:
-            db.close()
+            logger.error(f"❌ Ошибка уведомления о прочтении: {str(e)}")
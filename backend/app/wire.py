@@ -0,0 +1,80 @@
+"""
+Компактные схемы событий реального времени для клиентов, подключившихся
+с compact=1: короткие ключи, время — миллисекунды эпохи Unix, без полей,
+которые клиент может вывести сам (например, meta у chat_message).
+"""
+import os
+from datetime import datetime
+from typing import Optional, Union
+
+from dotenv import load_dotenv
+
+from .exchange_events import EXCHANGE_CREATED, EXCHANGE_STATUS_CHANGED
+
+load_dotenv()
+
+# Сериализатор python-socketio: default (JSON) или msgpack — для всех клиентов сервера
+SOCKETIO_SERIALIZER = os.getenv("SOCKETIO_SERIALIZER", "default")
+# Разрешить клиентам запрашивать компактные схемы событий
+SOCKETIO_COMPACT_EVENTS = os.getenv("SOCKETIO_COMPACT_EVENTS", "false").lower() == "true"
+
+NOTIFICATION_TYPES = {EXCHANGE_CREATED: 1, EXCHANGE_STATUS_CHANGED: 2}
+
+
+def epoch_ms(value: Union[str, datetime, None]) -> Optional[int]:
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp() * 1000)
+
+
+def compact_chat_message(payload: dict) -> dict:
+    message = payload["message"]
+    compact = {
+        "t": message["thread_id"],
+        "i": message["id"],
+        "s": message["sender_id"],
+        "c": message["content"],
+        "ts": epoch_ms(message["created_at"]),
+    }
+    if message.get("client_id"):
+        compact["k"] = message["client_id"]
+    return compact
+
+
+def compact_exchange(exchange: dict) -> dict:
+    return {
+        "i": exchange["id"],
+        "b": exchange["book_id"],
+        "bt": exchange["book_title"],
+        "r": exchange["requester_id"],
+        "ru": exchange["requester_username"],
+        "o": exchange["owner_id"],
+        "st": exchange["status"],
+        "ts": epoch_ms(exchange["created_at"]),
+    }
+
+
+def compact_notification(event: dict) -> dict:
+    compact = {
+        "q": event["seq"],
+        "y": NOTIFICATION_TYPES.get(event["type"], 0),
+        "ts": epoch_ms(event["created_at"]),
+    }
+    if "exchange" in event:
+        compact["x"] = compact_exchange(event["exchange"])
+    return compact
+
+
+def compact_presence(payload: dict) -> dict:
+    return {"u": int(payload["user_id"])}
+
+
+def compact_messages_read(payload: dict) -> dict:
+    return {
+        "t": payload["thread_id"],
+        "r": payload["reader_id"],
+        "u": payload["up_to"],
+        "ts": epoch_ms(payload["read_at"]),
+    }
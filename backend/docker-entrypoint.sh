@@ -1,50 +1,25 @@
 #!/usr/bin/env sh
 set -eu
 
-echo "⏳ Waiting for Postgres..."
-until python - <<'PY'
-import os, sys
-import psycopg2
-from urllib.parse import urlparse
+# Ожидание Postgres и миграции (пропускаются, если схема уже на head).
+# MinIO подключается лениво; его доступность показывает /health/ready
+python -m app.startup
 
-url = os.environ.get("DATABASE_URL")
-if not url:
-    print("DATABASE_URL is not set", file=sys.stderr)
-    sys.exit(1)
-
-u = urlparse(url)
-try:
-    conn = psycopg2.connect(
-        dbname=(u.path or "").lstrip("/"),
-        user=u.username,
-        password=u.password,
-        host=u.hostname,
-        port=u.port or 5432,
-    )
-    conn.close()
-except Exception:
-    sys.exit(1)
-PY
-do
-  sleep 1
-done
-echo "✅ Postgres is ready"
+# Без общего Redis присутствие и шина Socket.IO живут в памяти процесса — только один воркер
+if [ -z "${WEB_CONCURRENCY:-}" ] && [ -z "${SOCKETIO_REDIS_URL:-}" ]; then
+  WEB_CONCURRENCY=1
+fi
 
-if [ -n "${MINIO_ENDPOINT:-}" ]; then
-  MINIO_SCHEME="http"
-  if [ "${MINIO_SECURE:-false}" = "true" ]; then
-    MINIO_SCHEME="https"
-  fi
-  echo "⏳ Waiting for MinIO at ${MINIO_SCHEME}://${MINIO_ENDPOINT}..."
-  until curl -fsS "${MINIO_SCHEME}://${MINIO_ENDPOINT}/minio/health/ready" >/dev/null 2>&1; do
-    sleep 1
-  done
-  echo "✅ MinIO is ready"
+if [ "${WEB_CONCURRENCY:-}" = "1" ]; then
+  echo "🚀 Starting backend (single process)..."
+  exec python -m app.serve
 fi
 
-echo "🗄️  Running migrations..."
-alembic upgrade head
+# Общий каталог метрик воркеров для /metrics; данные прошлого запуска не нужны
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+rm -rf "${PROMETHEUS_MULTIPROC_DIR}"
+mkdir -p "${PROMETHEUS_MULTIPROC_DIR}"
 
-echo "🚀 Starting backend..."
-exec uvicorn app.main:app --host 0.0.0.0 --port 8000
+echo "🚀 Starting backend (gunicorn, ${WEB_CONCURRENCY:-one worker per CPU})..."
+exec gunicorn -c gunicorn.conf.py app.main:app
 
@@ -0,0 +1,55 @@
+"""
+Запуск backend в нескольких процессах: gunicorn управляет воркерами uvicorn.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+SIGHUP — плавный перезапуск воркеров (новая конфигурация и код),
+SIGTERM — остановка: воркер на SHUTDOWN_DRAIN_DELAY секунд отмечает себя
+неготовым (503 на /health/ready) и закрывает вебсокеты, затем перестаёт
+принимать подключения, дожидается текущих запросов (в том числе загрузок
+обложек) и дописывает очереди, но не дольше GRACEFUL_TIMEOUT секунд.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _cpu_count() -> int:
+    # Учитывает ограничение CPU контейнера через affinity, если оно задано
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY") or 0) or _cpu_count()
+# UvicornWorker, который по SIGTERM сначала выводит себя из балансировки (app/serve.py)
+worker_class = "app.serve.DrainingUvicornWorker"
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = 5
+# Пулы БД, Redis и клиент MinIO создаются в каждом воркере после fork
+preload_app = False
+# Перезапуск воркера после N запросов (0 — никогда) ограничивает рост памяти
+max_requests = int(os.getenv("WORKER_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+
+
+def child_exit(server, worker):
+    # Метрики остановленного воркера больше не учитываются в livesum-показателях
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def on_starting(server):
+    if server.cfg.workers > 1 and not os.getenv("SOCKETIO_REDIS_URL"):
+        raise RuntimeError(
+            "Для нескольких воркеров нужен SOCKETIO_REDIS_URL: "
+            "присутствие и шина Socket.IO должны быть общими для процессов"
+        )
@@ -0,0 +1,169 @@
+"""
+Сравнение синхронного и асинхронного слоя БД на странице каталога книг.
+
+Поднимает uvicorn с двумя вариантами GET /books: прежним синхронным
+(def + psycopg2, пул потоков AnyIO) и асинхронным маршрутом приложения
+(async def + asyncpg). Оба читают одну и ту же базу из DATABASE_URL,
+поэтому нужен запущенный Postgres с данными.
+
+    pip install -r loadtest/requirements.txt
+    python -m loadtest.db_bench --concurrency 50 200 500 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from math import ceil
+from typing import List, Optional
+
+import aiohttp
+from fastapi import Depends, FastAPI
+from sqlalchemy.orm import Session, joinedload
+
+from app.database import get_db, async_engine
+from app.models import Book
+from app.routes import books
+from app.routes.books import _attach_cover_url
+from app.schemas import PaginatedBookResponse
+from .socketio_load import free_port, summarize
+
+VARIANTS = {
+    "sync": "/bench/sync/books/",
+    "async": "/books/",
+}
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.on_event("shutdown")
+    async def dispose_async_engine():
+        await async_engine.dispose()
+
+    @app.get("/bench/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.get("/bench/sync/books/", response_model=PaginatedBookResponse)
+    def get_books_sync(page: int = 1, limit: int = 10, db: Session = Depends(get_db)):
+        """Прежняя синхронная реализация каталога для сравнения"""
+        query = db.query(Book).filter(Book.status == "available")
+        total_count = query.count()
+        books_page = query.options(joinedload(Book.owner)).offset((page - 1) * limit).limit(limit).all()
+        _attach_cover_url(books_page)
+        return {
+            "books": books_page,
+            "total_count": total_count,
+            "total_pages": ceil(total_count / limit) if limit > 0 else 1,
+            "current_page": page,
+            "limit": limit
+        }
+
+    app.include_router(books.router)
+    return app
+
+
+def wait_for_server(base_url: str, timeout: float = 30.0):
+    async def probe():
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{base_url}/bench/ping") as response:
+                response.raise_for_status()
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            return asyncio.run(probe())
+        except (aiohttp.ClientError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError("Сервер бенчмарка не запустился")
+
+
+async def run_load(url: str, concurrency: int, duration: float, pages: int) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def worker(index: int, stop_at: float):
+            nonlocal errors
+            page = index % pages + 1
+            while time.monotonic() < stop_at:
+                started = time.perf_counter()
+                try:
+                    async with session.get(url, params={"page": page}) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                            continue
+                except aiohttp.ClientError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                page = page % pages + 1
+
+        # Короткий прогрев, чтобы пулы соединений успели заполниться
+        warmup_stop = time.monotonic() + min(2.0, duration / 5)
+        await asyncio.gather(*(worker(index, warmup_stop) for index in range(concurrency)))
+        latencies.clear()
+        errors = 0
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker(index, started + duration) for index in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": summarize(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк синхронного и асинхронного слоя БД")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 500], help="одновременных запросов")
+    parser.add_argument("--duration", type=float, default=20, help="длительность замера для каждого уровня, с")
+    parser.add_argument("--pages", type=int, default=10, help="сколько страниц каталога перебирают клиенты")
+    parser.add_argument("--variants", nargs="+", choices=sorted(VARIANTS), default=sorted(VARIANTS))
+    parser.add_argument("--server-url", help="использовать уже запущенный сервер бенчмарка")
+    parser.add_argument("--json", dest="json_path", help="сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    server: Optional[subprocess.Popen] = None
+    if args.server_url:
+        base_url = args.server_url.rstrip("/")
+    else:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "loadtest.db_bench:create_app", "--factory",
+            "--port", str(port), "--log-level", "warning", "--no-access-log"
+        ])
+
+    report = {"duration": args.duration, "results": []}
+    try:
+        wait_for_server(base_url)
+        for concurrency in args.concurrency:
+            for variant in args.variants:
+                result = asyncio.run(run_load(base_url + VARIANTS[variant], concurrency, args.duration, args.pages))
+                result.update({"variant": variant, "concurrency": concurrency})
+                report["results"].append(result)
+                print(
+                    f"{variant:>5} c={concurrency:<5} {result['rps']:>9} req/s  "
+                    f"p50={result['latency_ms']['p50']} ms  p99={result['latency_ms']['p99']} ms  "
+                    f"errors={result['errors']}"
+                )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from itertools import count
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.exchange_events import EXCHANGE_CREATED
+from app.notifications import notification_event, NOTIFICATIONS_REPLAY_LIMIT, NOTIFICATIONS_RETENTION_DAYS
+
+# Сколько последних уведомлений пользователя хранит заглушка
+KEEP_NOTIFICATIONS = 500
+
+
+def thread_participants(thread_id: int) -> Tuple[int, int]:
+    """Нагрузочный тест объединяет пользователей в пары: (1, 2) — чат 1, (3, 4) — чат 2 и т.д."""
+    return 2 * thread_id - 1, 2 * thread_id
+
+
+def thread_for_user(user_id: int) -> int:
+    return (user_id + 1) // 2
+
+
+def partner_of(user_id: int) -> int:
+    return user_id + 1 if user_id % 2 else user_id - 1
+
+
+class InMemoryStore:
+    """
+    Заглушка Postgres для вебсокет-сервера: те же функции и контракты, что
+    вызывает SocketManager через RealtimeDB, но данные в памяти процесса.
+    Тела сообщений не хранятся, чтобы память сервера отражала только подключения.
+    """
+
+    def __init__(self):
+        self._message_ids = count(1)
+        self._exchange_ids = count(1)
+        self.client_ids: Dict[Tuple[int, str], dict] = {}
+        self.exchanges: Dict[int, dict] = {}
+        self.event_seq: Dict[int, int] = defaultdict(int)
+        self.notifications: Dict[int, List[dict]] = defaultdict(list)
+
+    def persist_chat_message(self, thread_id: int, sender_id: int, content, client_id: Optional[str] = None):
+        content = (content or "").strip()
+        if not content:
+            raise HTTPException(status_code=400, detail="Сообщение не может быть пустым")
+        participants = thread_participants(thread_id)
+        if sender_id not in participants:
+            raise HTTPException(status_code=403, detail="Вы не участвуете в этом чате")
+        if client_id is not None and (sender_id, client_id) in self.client_ids:
+            return self.client_ids[(sender_id, client_id)], participants, False
+
+        message = {
+            "id": next(self._message_ids),
+            "thread_id": thread_id,
+            "sender_id": sender_id,
+            "content": content,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "is_read": False,
+            "client_id": client_id,
+        }
+        if client_id is not None:
+            self.client_ids[(sender_id, client_id)] = {**message, "content": ""}
+        return message, participants, True
+
+    def create_exchange(self, requester_id: int, owner_id: int) -> int:
+        exchange_id = next(self._exchange_ids)
+        self.exchanges[exchange_id] = {
+            "id": exchange_id,
+            "book_id": exchange_id,
+            "book_title": f"Книга {exchange_id}",
+            "requester_id": requester_id,
+            "requester_username": f"loadtest{requester_id}",
+            "owner_id": owner_id,
+            "status": "pending",
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        return exchange_id
+
+    def load_exchange_event(self, exchange_id: int, event_type: str):
+        exchange = self.exchanges.get(exchange_id)
+        if exchange is None:
+            return None
+        recipient_id = exchange["owner_id"] if event_type == EXCHANGE_CREATED else exchange["requester_id"]
+        return recipient_id, {"exchange": dict(exchange)}
+
+    def write_notifications(self, batch: List[dict]) -> List[dict]:
+        created_at = datetime.now(timezone.utc).isoformat()
+        written = []
+        for item in batch:
+            self.event_seq[item["user_id"]] += 1
+            notification = {**item, "seq": self.event_seq[item["user_id"]], "created_at": created_at}
+            inbox = self.notifications[item["user_id"]]
+            inbox.append(notification)
+            if len(inbox) > KEEP_NOTIFICATIONS:
+                del inbox[:len(inbox) - KEEP_NOTIFICATIONS]
+            written.append(notification)
+        return written
+
+    def load_notifications_since(self, user_id: int, since: Optional[int], limit: int = NOTIFICATIONS_REPLAY_LIMIT) -> dict:
+        seq = self.event_seq[user_id]
+        if since is not None and since <= seq and seq - since <= limit:
+            missed = [item for item in self.notifications[user_id] if item["seq"] > since]
+            if len(missed) == seq - since:
+                return {"seq": seq, "notifications": [notification_event(item) for item in missed]}
+        pending = [
+            exchange for exchange in self.exchanges.values()
+            if exchange["owner_id"] == user_id and exchange["status"] == "pending"
+        ]
+        return {"seq": seq, "exchanges": pending, "reset": True}
+
+    def prune_notifications(self, retention_days: int = NOTIFICATIONS_RETENTION_DAYS) -> int:
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).isoformat()
+        removed = 0
+        for user_id, inbox in self.notifications.items():
+            kept = [item for item in inbox if item["created_at"] >= cutoff]
+            removed += len(inbox) - len(kept)
+            self.notifications[user_id] = kept
+        return removed
+
+
+class FakeRealtimeDB:
+    """Подмена RealtimeDB: вызывает одноимённый метод InMemoryStore с задержкой сети"""
+
+    # Функции, которые SocketManager и NotificationWriter передают в RealtimeDB.run
+    SUPPORTED = (
+        "persist_chat_message",
+        "load_exchange_event",
+        "load_notifications_since",
+        "write_notifications",
+        "prune_notifications",
+    )
+
+    def __init__(self, store: InMemoryStore, latency: float = 0.0):
+        missing = [name for name in self.SUPPORTED if not callable(getattr(store, name, None))]
+        if missing:
+            raise TypeError(f"Хранилище нагрузочного теста не реализует: {', '.join(missing)}")
+        self.store = store
+        self.latency = latency
+        self._handlers = {name: getattr(store, name) for name in self.SUPPORTED}
+
+    async def run(self, fn, *args):
+        handler = self._handlers.get(fn.__name__)
+        if handler is None:
+            raise TypeError(
+                f"Нагрузочная заглушка БД не поддерживает {fn.__name__}; "
+                f"поддерживаются: {', '.join(self.SUPPORTED)}"
+            )
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return handler(*args)
+
+    def shutdown(self):
+        pass
+
+
+class FakeObjectResponse:
+    """Ответ get_object: итерируется кусками, как urllib3.HTTPResponse"""
+
+    def __init__(self, data: bytes, chunk_size: int = 32 * 1024):
+        self.data = data
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        for offset in range(0, len(self.data), self.chunk_size):
+            yield self.data[offset:offset + self.chunk_size]
+
+    def read(self) -> bytes:
+        return self.data
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class FakeMinio:
+    """
+    Хранилище объектов в памяти с теми методами клиента minio, которые
+    вызывает app.storage. Подставляется вместо storage._minio_client.
+    """
+
+    def __init__(self):
+        self.buckets: Dict[str, Dict[str, Tuple[bytes, str]]] = defaultdict(dict)
+
+    def bucket_exists(self, bucket_name: str) -> bool:
+        return bucket_name in self.buckets
+
+    def make_bucket(self, bucket_name: str):
+        self.buckets[bucket_name]
+
+    def put_object(self, bucket_name: str, object_name: str, data, length: int, content_type: str = "application/octet-stream"):
+        self.buckets[bucket_name][object_name] = (data.read(length), content_type)
+
+    def _get(self, bucket_name: str, object_name: str) -> Tuple[bytes, str]:
+        from minio.error import S3Error
+
+        try:
+            return self.buckets[bucket_name][object_name]
+        except KeyError:
+            raise S3Error("NoSuchKey", "Object does not exist", object_name, None, None, None, bucket_name, object_name)
+
+    def stat_object(self, bucket_name: str, object_name: str):
+        data, content_type = self._get(bucket_name, object_name)
+        return SimpleNamespace(size=len(data), content_type=content_type)
+
+    def get_object(self, bucket_name: str, object_name: str) -> FakeObjectResponse:
+        return FakeObjectResponse(self._get(bucket_name, object_name)[0])
+
+    def remove_object(self, bucket_name: str, object_name: str):
+        self.buckets[bucket_name].pop(object_name, None)
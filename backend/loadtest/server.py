@@ -0,0 +1,132 @@
+"""
+Вебсокет-сервер BookEx для нагрузочного теста: настоящий SocketManager,
+Postgres заменён InMemoryStore. MinIO вебсокет-серверу не нужен.
+
+    python -m loadtest.server --port 8765
+"""
+import argparse
+import asyncio
+import logging
+import os
+import resource
+from contextlib import asynccontextmanager
+from typing import List
+
+# Настройки читаются модулями app при импорте; соединение с БД не открывается
+os.environ.setdefault("DATABASE_URL", "postgresql://loadtest@127.0.0.1/loadtest")
+os.environ.setdefault("SECRET_KEY", "loadtest-secret")
+os.environ.setdefault("SOCKETIO_REDIS_URL", "")
+
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from app.websockets import SocketManager
+from .fakes import InMemoryStore, FakeRealtimeDB
+
+LAG_INTERVAL = 0.05
+MAX_LAG_SAMPLES = 100000
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize()
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+class LoopLagMonitor:
+    """Задержка цикла событий: насколько позже заказанного просыпается короткий sleep"""
+
+    def __init__(self, interval: float = LAG_INTERVAL):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            if len(self.samples) < MAX_LAG_SAMPLES:
+                self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def take(self) -> List[float]:
+        samples, self.samples = self.samples, []
+        return samples
+
+
+class ExchangeRequest(BaseModel):
+    requester_id: int
+    owner_id: int
+
+
+def create_app(db_latency_ms: float = 0.0) -> FastAPI:
+    # Журнал socketio/engineio на каждое событие исказил бы измерения
+    logging.getLogger("socketio.server").setLevel(logging.WARNING)
+    logging.getLogger("engineio.server").setLevel(logging.WARNING)
+
+    store = InMemoryStore()
+    manager = SocketManager()
+    manager.db = FakeRealtimeDB(store, db_latency_ms / 1000)
+    manager.notifications.db = manager.db
+    monitor = LoopLagMonitor()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        monitor.start()
+        await manager.start()
+        yield
+        monitor.stop()
+        await manager.sio.eio.shutdown()
+        await manager.stop()
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.get("/loadtest/stats")
+    async def stats(reset_lag: bool = False):
+        return {
+            "connections": len(manager.sid_users),
+            "online_users": await manager.online_count(),
+            "rss_bytes": rss_bytes(),
+            "loop_lag": monitor.take() if reset_lag else [],
+        }
+
+    @app.post("/loadtest/exchanges")
+    async def create_exchange(request: ExchangeRequest):
+        exchange_id = store.create_exchange(request.requester_id, request.owner_id)
+        await manager.notify_new_exchange(exchange_id)
+        return {"id": exchange_id}
+
+    app.mount("/ws", manager.app)
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Вебсокет-сервер для нагрузочного теста")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db-latency-ms", type=float, default=1.0, help="имитация задержки запроса к БД")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    uvicorn.run(
+        create_app(args.db_latency_ms),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+        access_log=False,
+        ws_max_size=1024 * 1024
+    )
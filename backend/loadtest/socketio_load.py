@@ -0,0 +1,329 @@
+"""
+Нагрузочный тест вебсокет-сервера BookEx.
+
+Поднимает loadtest.server (настоящий SocketManager, данные в памяти), подключает
+N клиентов python-socketio с JWT и гоняет трафик чата, обменов и присутствия.
+Отчёт: время установки соединения, задержка от отправки до получения
+(перцентили), задержка цикла событий сервера и память на одно подключение.
+
+    pip install -r loadtest/requirements.txt
+    python -m loadtest.socketio_load --clients 2000 --duration 60
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+from datetime import datetime
+from typing import Dict, List
+
+os.environ.setdefault("DATABASE_URL", "postgresql://loadtest@127.0.0.1/loadtest")
+os.environ.setdefault("SECRET_KEY", "loadtest-secret")
+
+import aiohttp
+import socketio
+
+from app.security import create_access_token
+from .fakes import thread_for_user, partner_of
+from .server import raise_fd_limit
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(values: List[float], scale: float = 1000.0) -> dict:
+    """Сводка в миллисекундах"""
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50) * scale, 2),
+        "p95": round(percentile(values, 95) * scale, 2),
+        "p99": round(percentile(values, 99) * scale, 2),
+        "max": round(max(values) * scale, 2) if values else 0.0,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_stats(base_url: str, reset_lag: bool = False) -> dict:
+    url = f"{base_url}/loadtest/stats?reset_lag={'true' if reset_lag else 'false'}"
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def wait_for_server(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            return get_stats(base_url)
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Сервер нагрузочного теста не запустился")
+
+
+class LoadClient:
+    """Один пользователь: сокет, подписка на статусы и учёт полученных событий"""
+
+    def __init__(self, user_id: int, config: dict, results: dict):
+        self.user_id = user_id
+        self.config = config
+        self.results = results
+        self.token = create_access_token({"sub": f"loadtest{user_id}", "user_id": user_id})
+        self.sio = None
+
+    def _register_handlers(self, sio):
+        results = self.results
+
+        @sio.on("chat_message")
+        async def on_chat_message(data):
+            message = data.get("message") or {}
+            if message.get("sender_id") == self.user_id:
+                return
+            sent_at = message.get("content", "").split(" ")[-1]
+            try:
+                results["chat_latency"].append(time.time() - float(sent_at))
+            except ValueError:
+                pass
+
+        @sio.on("notification")
+        async def on_notification(data):
+            created_at = (data.get("exchange") or {}).get("created_at")
+            if created_at:
+                results["notification_latency"].append(
+                    time.time() - datetime.fromisoformat(created_at).timestamp()
+                )
+
+        @sio.on("user_online")
+        async def on_user_online(data):
+            results["presence_events"] += 1
+
+        @sio.on("user_offline")
+        async def on_user_offline(data):
+            results["presence_events"] += 1
+
+    async def connect(self):
+        sio = socketio.AsyncClient(reconnection=False)
+        self._register_handlers(sio)
+        started = time.perf_counter()
+        try:
+            await sio.connect(
+                f"{self.config['url']}?token={self.token}",
+                socketio_path="ws/socket.io",
+                transports=["websocket"],
+                wait_timeout=30
+            )
+            watch = {partner_of(self.user_id)}
+            watch.update(random.randint(1, self.config["total_clients"]) for _ in range(self.config["presence_watch"]))
+            await sio.call("subscribe_presence", {"user_ids": sorted(watch)}, timeout=30)
+            await sio.call("sync_notifications", {"since": None}, timeout=30)
+        except Exception:
+            self.results["connect_errors"] += 1
+            await sio.disconnect()
+            return False
+        self.results["connect_time"].append(time.perf_counter() - started)
+        self.sio = sio
+        return True
+
+    async def disconnect(self):
+        if self.sio is not None:
+            await self.sio.disconnect()
+            self.sio = None
+
+    async def send_chat(self):
+        if self.sio is None or not self.sio.connected:
+            return
+        started = time.perf_counter()
+        try:
+            ack = await self.sio.call("send_chat_message", {
+                "thread_id": thread_for_user(self.user_id),
+                "content": f"loadtest {time.time():.6f}",
+                "client_id": uuid.uuid4().hex
+            }, timeout=30)
+        except Exception:
+            self.results["chat_errors"] += 1
+            return
+        if ack and ack.get("ok"):
+            self.results["chat_ack"].append(time.perf_counter() - started)
+        else:
+            self.results["chat_errors"] += 1
+
+
+async def chat_loop(client: LoadClient, interval: float, stop_at: float):
+    while time.monotonic() < stop_at:
+        await asyncio.sleep(random.expovariate(1 / interval))
+        await client.send_chat()
+
+
+async def churn_loop(clients: List[LoadClient], rate: float, stop_at: float, results: dict):
+    """Переподключения: rate — доля клиентов, переподключающихся за секунду"""
+    if rate <= 0:
+        return
+    while time.monotonic() < stop_at:
+        await asyncio.sleep(1)
+        for client in random.sample(clients, max(1, int(len(clients) * rate))):
+            await client.disconnect()
+            if await client.connect():
+                results["reconnects"] += 1
+
+
+async def exchange_loop(config: dict, rate: float, stop_at: float, results: dict):
+    if rate <= 0:
+        return
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < stop_at:
+            await asyncio.sleep(random.expovariate(rate))
+            owner_id, requester_id = random.sample(range(1, config["total_clients"] + 1), 2)
+            try:
+                async with session.post(
+                    f"{config['url']}/loadtest/exchanges",
+                    json={"requester_id": requester_id, "owner_id": owner_id}
+                ) as response:
+                    response.raise_for_status()
+            except aiohttp.ClientError:
+                results["exchange_errors"] += 1
+
+
+async def run_worker_async(user_ids: List[int], config: dict) -> dict:
+    results = {
+        "connect_time": [], "connect_errors": 0, "reconnects": 0,
+        "chat_ack": [], "chat_latency": [], "chat_errors": 0,
+        "notification_latency": [], "exchange_errors": 0, "presence_events": 0,
+    }
+    clients = [LoadClient(user_id, config, results) for user_id in user_ids]
+
+    # Плавный набор подключений с заданной общей скоростью
+    delay = config["workers"] / config["ramp_rate"]
+    connecting = []
+    for client in clients:
+        connecting.append(asyncio.create_task(client.connect()))
+        await asyncio.sleep(delay)
+    await asyncio.gather(*connecting)
+
+    # Старт трафика у всех процессов в одно и то же время
+    await asyncio.sleep(max(0.0, config["traffic_start"] - time.time()))
+    stop_at = time.monotonic() + config["duration"]
+    tasks = [asyncio.create_task(chat_loop(client, config["chat_interval"], stop_at)) for client in clients]
+    tasks.append(asyncio.create_task(churn_loop(clients, config["churn"], stop_at, results)))
+    tasks.append(asyncio.create_task(exchange_loop(config, config["exchange_rate"] / config["workers"], stop_at, results)))
+    await asyncio.gather(*tasks)
+    # Даём дойти последним событиям
+    await asyncio.sleep(1)
+    await asyncio.gather(*(client.disconnect() for client in clients), return_exceptions=True)
+    return results
+
+
+def run_worker(args) -> dict:
+    user_ids, config = args
+    raise_fd_limit()
+    return asyncio.run(run_worker_async(user_ids, config))
+
+
+def merge(results: List[dict]) -> Dict[str, object]:
+    merged: Dict[str, object] = {}
+    for result in results:
+        for key, value in result.items():
+            if isinstance(value, list):
+                merged.setdefault(key, []).extend(value)
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест вебсокет-сервера")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=60, help="длительность фазы трафика, с")
+    parser.add_argument("--ramp-rate", type=float, default=200, help="новых подключений в секунду")
+    parser.add_argument("--chat-interval", type=float, default=10, help="среднее время между сообщениями клиента, с")
+    parser.add_argument("--exchange-rate", type=float, default=5, help="новых предложений обмена в секунду")
+    parser.add_argument("--presence-watch", type=int, default=10, help="случайных пользователей в подписке на статусы")
+    parser.add_argument("--churn", type=float, default=0.005, help="доля клиентов, переподключающихся за секунду")
+    parser.add_argument("--db-latency-ms", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="процессов с клиентами")
+    parser.add_argument("--server-url", help="использовать уже запущенный loadtest.server")
+    parser.add_argument("--json", dest="json_path", help="сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    server = None
+    if args.server_url:
+        base_url = args.server_url.rstrip("/")
+    else:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "loadtest.server", "--port", str(port), "--db-latency-ms", str(args.db_latency_ms)],
+            stdout=subprocess.DEVNULL
+        )
+
+    try:
+        baseline = wait_for_server(base_url)
+        workers = min(args.workers, args.clients)
+        ramp_seconds = args.clients / args.ramp_rate
+        config = {
+            "url": base_url,
+            "total_clients": args.clients,
+            "workers": workers,
+            "ramp_rate": args.ramp_rate,
+            "duration": args.duration,
+            "chat_interval": args.chat_interval,
+            "exchange_rate": args.exchange_rate,
+            "presence_watch": args.presence_watch,
+            "churn": args.churn,
+            "traffic_start": time.time() + ramp_seconds + 5,
+        }
+        user_ids = list(range(1, args.clients + 1))
+        chunks = [(user_ids[index::workers], config) for index in range(workers)]
+
+        with multiprocessing.Pool(workers) as pool:
+            pending = pool.map_async(run_worker, chunks)
+            # Память и задержка цикла снимаются в начале фазы трафика, когда все подключены
+            time.sleep(max(0.0, config["traffic_start"] - time.time()))
+            connected = get_stats(base_url, reset_lag=True)
+            results = merge(pending.get())
+            final = get_stats(base_url, reset_lag=True)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    connections = max(1, connected["connections"])
+    report = {
+        "clients": args.clients,
+        "connected": connected["connections"],
+        "connect_errors": results["connect_errors"],
+        "reconnects": results["reconnects"],
+        "connect_time_ms": summarize(results["connect_time"]),
+        "chat_ack_ms": summarize(results["chat_ack"]),
+        "chat_delivery_ms": summarize(results["chat_latency"]),
+        "chat_errors": results["chat_errors"],
+        "notification_delivery_ms": summarize(results["notification_latency"]),
+        "exchange_errors": results["exchange_errors"],
+        "presence_events": results["presence_events"],
+        "loop_lag_ms": summarize(final["loop_lag"]),
+        "server_rss_mb": round(connected["rss_bytes"] / 2 ** 20, 1),
+        "memory_per_connection_kb": round((connected["rss_bytes"] - baseline["rss_bytes"]) / connections / 1024, 1),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
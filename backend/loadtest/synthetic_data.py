@@ -0,0 +1,408 @@
+"""
+Генератор больших синтетических наборов данных для нагрузочных тестов.
+
+Пишет прямо в Postgres через COPY, минуя API и ORM: миллионы книг, сотни
+тысяч пользователей и десятки миллионов сообщений за минуты, а не сутки.
+Распределения приближены к живым данным:
+
+- жанры и авторы — по закону Ципфа (немногие популярные, длинный хвост);
+- владельцы книг и участники чатов — скошенная активность: небольшая доля
+  пользователей владеет большинством книг и ведёт большинство переписок;
+- длина чатов — распределение Парето: большинство чатов из пары сообщений,
+  единицы — из тысяч.
+
+Результат детерминирован от --seed и не зависит от --jobs. У всех
+пользователей один заранее вычисленный хеш пароля (--password), обложки —
+несколько заглушек covers/stub-N.jpg (--upload-covers загружает их в MinIO).
+
+    python -m loadtest.synthetic_data --users 200000 --books 2000000 \\
+        --threads 600000 --messages 20000000 --jobs 8 --truncate
+"""
+import argparse
+import io
+import itertools
+import multiprocessing
+import os
+import random
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+import psycopg2
+
+from app.chat_partitions import ensure_partitions, add_months, month_start, CHAT_PARTITIONS_AHEAD
+from app.database import engine, DATABASE_URL
+from app.security import get_password_hash
+
+GENRES = [
+    "Роман", "Детектив", "Фантастика", "Фэнтези", "Классика", "Детская", "История",
+    "Психология", "Бизнес", "Поэзия", "Наука", "Биография", "Приключения", "Ужасы",
+    "Философия", "Комиксы", "Кулинария", "Путешествия", "Религия", "Искусство",
+]
+CONDITIONS = ["new", "like_new", "good", "fair", "poor"]
+CONDITION_WEIGHTS = [10, 25, 40, 20, 5]
+CITIES = [
+    "Москва", "Санкт-Петербург", "Новосибирск", "Екатеринбург", "Казань", "Нижний Новгород",
+    "Челябинск", "Самара", "Омск", "Ростов-на-Дону", "Уфа", "Красноярск", "Воронеж", "Пермь",
+]
+FIRST_NAMES = ["Анна", "Иван", "Мария", "Алексей", "Елена", "Дмитрий", "Ольга", "Сергей", "Наталья", "Андрей"]
+LAST_NAMES = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев", "Козлов", "Новиков", "Морозов", "Волков"]
+WORDS = (
+    "книга время жизнь день рука человек дело мир город дом слово место лицо друг глаз вопрос "
+    "сторона страна ночь голова работа земля история сила война путь море звезда сад огонь тень "
+    "свет дорога память сердце ветер зима лето осень весна река лес небо солнце тайна письмо"
+).split()
+CHAT_PHRASES = [
+    "Привет!", "Книга ещё доступна?", "Да, можно обменяться", "Когда удобно встретиться?",
+    "Спасибо!", "Могу завтра вечером", "А в каком она состоянии?", "Отличное, почти новая",
+    "Договорились", "Напишу, когда буду на месте", "Хорошо", "Есть ещё что-нибудь из этого автора?",
+]
+EXCHANGE_STATUSES = ["pending", "accepted", "rejected", "cancelled"]
+EXCHANGE_STATUS_WEIGHTS = [30, 30, 25, 15]
+
+STUB_COVERS = 20
+# В каждом UNREAD_EVERY-м чате второй участник не прочитал последние UNREAD_TAIL сообщений
+UNREAD_EVERY = 5
+UNREAD_TAIL = 3
+# Поправка к seed для независимых потоков случайных чисел по таблицам
+STREAM_USERS, STREAM_BOOKS, STREAM_THREADS, STREAM_EXCHANGES = 1, 2, 3, 4
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def zipf_weights(count: int, exponent: float = 1.1) -> List[float]:
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def skewed_id(rng: random.Random, total: int, skew: float) -> int:
+    """Id от 1 до total; чем больше skew, тем сильнее перевес малых id (активных пользователей)"""
+    return 1 + int(total * rng.random() ** skew)
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, str):
+        return value.translate(_COPY_ESCAPES)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return str(value)
+
+
+class CopyStream(io.RawIOBase):
+    """Файлоподобный поток строк COPY в текстовом формате, формируемых по мере чтения"""
+
+    def __init__(self, rows: Iterable[Sequence]):
+        self._lines = ("\t".join(map(_copy_value, row)) + "\n" for row in rows)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line.encode("utf-8")
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+def copy_rows(conn, table: str, columns: Sequence[str], rows: Iterable[Sequence]) -> int:
+    written = 0
+
+    def counted():
+        nonlocal written
+        for row in rows:
+            written += 1
+            yield row
+
+    with conn.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN",
+            CopyStream(counted()),
+            size=256 * 1024
+        )
+    return written
+
+
+def connect():
+    conn = psycopg2.connect(DATABASE_URL)
+    with conn.cursor() as cursor:
+        # Данные можно пересоздать, ожидание fsync на каждой транзакции не нужно
+        cursor.execute("SET synchronous_commit = off")
+    return conn
+
+
+def user_rows(args, password_hash: str, now: datetime) -> Iterator[tuple]:
+    rng = random.Random(args.seed * 10 + STREAM_USERS)
+    city_weights = zipf_weights(len(CITIES), 0.9)
+    for user_id in range(1, args.users + 1):
+        yield (
+            user_id,
+            f"user{user_id}@example.com",
+            f"user{user_id}",
+            password_hash,
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            rng.choices(CITIES, cum_weights=city_weights)[0],
+            None,
+            now - timedelta(days=rng.uniform(0, 3 * 365)),
+        )
+
+
+def book_rows(args, owners: array, now: datetime) -> Iterator[tuple]:
+    rng = random.Random(args.seed * 10 + STREAM_BOOKS)
+    genre_weights = zipf_weights(len(GENRES))
+    author_count = max(1, args.books // 50)
+    author_weights = zipf_weights(min(author_count, 100000), 1.05)
+    for book_id in range(1, args.books + 1):
+        owner_id = skewed_id(rng, args.users, args.owner_skew)
+        owners.append(owner_id)
+        cover = f"covers/stub-{rng.randrange(STUB_COVERS)}.jpg" if rng.random() < 0.8 else None
+        yield (
+            book_id,
+            " ".join(rng.choices(WORDS, k=rng.randint(1, 5))).capitalize(),
+            f"Автор {rng.choices(range(1, len(author_weights) + 1), cum_weights=author_weights)[0]}",
+            " ".join(rng.choices(WORDS, k=rng.randint(10, 60))),
+            rng.choices(GENRES, cum_weights=genre_weights)[0],
+            rng.choices(CONDITIONS, weights=CONDITION_WEIGHTS)[0],
+            cover,
+            owner_id,
+            "available" if rng.random() < 0.85 else "exchanged",
+            now - timedelta(days=rng.uniform(0, 2 * 365)),
+        )
+
+
+def plan_threads(args) -> Tuple[List[Tuple[int, int]], List[int]]:
+    """Участники чатов (активные пользователи общаются чаще) и число сообщений в каждом"""
+    rng = random.Random(args.seed * 10 + STREAM_THREADS)
+    pairs = set()
+    while len(pairs) < args.threads:
+        one = skewed_id(rng, args.users, args.chat_skew)
+        two = rng.randint(1, args.users)
+        if one != two:
+            pairs.add((min(one, two), max(one, two)))
+    pairs = sorted(pairs)
+    rng.shuffle(pairs)
+
+    # Длины по Парето, масштабированные к заданному общему числу сообщений
+    weights = [rng.paretovariate(args.thread_tail) for _ in pairs]
+    scale = args.messages / sum(weights)
+    counts = [max(1, int(weight * scale)) for weight in weights]
+    return pairs, counts
+
+
+def message_rows(seed: int, first_thread_id: int, pairs, counts, first_message_id: int,
+                 months: int, now: datetime) -> Iterator[tuple]:
+    message_id = first_message_id
+    history = timedelta(days=30 * months)
+    for offset, ((one, two), count) in enumerate(zip(pairs, counts)):
+        thread_id = first_thread_id + offset
+        # Свой генератор на чат: результат не зависит от разбиения на процессы
+        rng = random.Random(seed * 1_000_003 + thread_id)
+        started = now - history * rng.random()
+        span = (now - started).total_seconds()
+        gaps = list(itertools.accumulate(rng.expovariate(1) for _ in range(count)))
+        step = span / (gaps[-1] + 1)
+        sender = one if rng.random() < 0.5 else two
+        # Согласовано с водяными знаками прочтения, которые выставляет UPDATE сводок
+        unread_from = count - UNREAD_TAIL if thread_id % UNREAD_EVERY == 0 else count
+        for index, gap in enumerate(gaps):
+            # Реплики чаще идут сериями от одного участника
+            if rng.random() < 0.6:
+                sender = two if sender == one else one
+            content = rng.choice(CHAT_PHRASES) if rng.random() < 0.5 else " ".join(rng.choices(WORDS, k=rng.randint(2, 20)))
+            yield (
+                message_id,
+                thread_id,
+                sender,
+                content,
+                started + timedelta(seconds=gap * step),
+                # Сообщение прочитано, если получатель дочитал чат до него
+                not (index >= unread_from and sender == one),
+            )
+            message_id += 1
+
+
+def _copy_messages(job) -> int:
+    seed, first_thread_id, pairs, counts, first_message_id, months, now = job
+    conn = connect()
+    try:
+        written = copy_rows(
+            conn, "chat_messages",
+            ["id", "thread_id", "sender_id", "content", "created_at", "is_read"],
+            message_rows(seed, first_thread_id, pairs, counts, first_message_id, months, now)
+        )
+        conn.commit()
+        return written
+    finally:
+        conn.close()
+
+
+def exchange_rows(args, owners: array, now: datetime) -> Iterator[tuple]:
+    rng = random.Random(args.seed * 10 + STREAM_EXCHANGES)
+    for exchange_id in range(1, args.exchanges + 1):
+        book_id = skewed_id(rng, args.books, 1.5)
+        owner_id = owners[book_id - 1]
+        requester_id = skewed_id(rng, args.users, args.chat_skew)
+        if requester_id == owner_id:
+            requester_id = requester_id % args.users + 1
+        yield (
+            exchange_id,
+            book_id,
+            requester_id,
+            owner_id,
+            rng.choices(EXCHANGE_STATUSES, weights=EXCHANGE_STATUS_WEIGHTS)[0],
+            now - timedelta(days=rng.uniform(0, 365)),
+        )
+
+
+def _split(counts: List[int], jobs: int) -> List[Tuple[int, int]]:
+    """Диапазоны чатов [start, end) примерно с равным числом сообщений"""
+    totals = list(itertools.accumulate(counts))
+    bounds = [0]
+    for job in range(1, jobs):
+        bounds.append(bisect_left(totals, totals[-1] * job / jobs))
+    bounds.append(len(counts))
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def upload_stub_covers():
+    from PIL import Image
+
+    from app.storage import get_minio_client, MINIO_BUCKET_COVERS, TARGET_COVER_SIZE
+
+    client = get_minio_client()
+    for index in range(STUB_COVERS):
+        buffer = io.BytesIO()
+        hue = int(255 * index / STUB_COVERS)
+        Image.new("RGB", TARGET_COVER_SIZE, (hue, 120, 255 - hue)).save(buffer, format="JPEG", quality=70)
+        data = buffer.getvalue()
+        client.put_object(MINIO_BUCKET_COVERS, f"covers/stub-{index}.jpg", io.BytesIO(data), len(data), content_type="image/jpeg")
+
+
+def step(title: str, started: float):
+    print(f"  {title} ({time.perf_counter() - started:.1f} с)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор синтетических данных BookEx")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--books", type=int, default=1000000)
+    parser.add_argument("--threads", type=int, default=300000)
+    parser.add_argument("--messages", type=int, default=10000000)
+    parser.add_argument("--exchanges", type=int, default=200000)
+    parser.add_argument("--months", type=int, default=12, help="глубина истории чатов, месяцев")
+    parser.add_argument("--owner-skew", type=float, default=3.0, help="перекос владения книгами к активным пользователям")
+    parser.add_argument("--chat-skew", type=float, default=2.0, help="перекос участия в чатах к активным пользователям")
+    parser.add_argument("--thread-tail", type=float, default=1.2, help="показатель Парето длины чатов (меньше — тяжелее хвост)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--password", default="password", help="пароль всех сгенерированных пользователей")
+    parser.add_argument("--jobs", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="процессов для COPY сообщений")
+    parser.add_argument("--truncate", action="store_true", help="очистить таблицы перед генерацией")
+    parser.add_argument("--upload-covers", action="store_true", help="загрузить обложки-заглушки в MinIO")
+    args = parser.parse_args()
+
+    max_threads = args.users * (args.users - 1) // 2
+    if args.threads > max_threads:
+        parser.error(f"Для {args.users} пользователей возможно не больше {max_threads} чатов")
+
+    # Дата отсчёта фиксирована по дню, чтобы повторный запуск в тот же день давал те же данные
+    now = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    started = time.perf_counter()
+    print("🌱 Генерация синтетических данных")
+
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            if args.truncate:
+                cursor.execute(
+                    "TRUNCATE notifications, chat_message_client_ids, chat_message_archives, chat_messages, "
+                    "chat_threads, exchanges, books, users RESTART IDENTITY CASCADE"
+                )
+            else:
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM users)")
+                if cursor.fetchone()[0]:
+                    raise SystemExit("В базе уже есть пользователи: запустите с --truncate")
+        conn.commit()
+
+        # Секции заранее: строки, попавшие в секцию по умолчанию, помешают создать месячную позже
+        first_month = add_months(month_start(now), -args.months - 1)
+        with engine.begin() as sa_conn:
+            ensure_partitions(sa_conn, months_ahead=args.months + 1 + CHAT_PARTITIONS_AHEAD, start=first_month)
+        step("секции chat_messages", started)
+
+        password_hash = get_password_hash(args.password)
+        copy_rows(conn, "users", ["id", "email", "username", "password_hash", "full_name", "city", "about", "created_at"],
+                  user_rows(args, password_hash, now))
+        conn.commit()
+        step(f"users: {args.users}", started)
+
+        owners = array("i")
+        copy_rows(conn, "books", ["id", "title", "author", "description", "genre", "condition", "cover",
+                                  "owner_id", "status", "created_at"],
+                  book_rows(args, owners, now))
+        conn.commit()
+        step(f"books: {args.books}", started)
+
+        copy_rows(conn, "exchanges", ["id", "book_id", "requester_id", "owner_id", "status", "created_at"],
+                  exchange_rows(args, owners, now))
+        conn.commit()
+        step(f"exchanges: {args.exchanges}", started)
+
+        pairs, counts = plan_threads(args)
+        copy_rows(conn, "chat_threads", ["id", "user_one_id", "user_two_id"],
+                  ((thread_id, one, two) for thread_id, (one, two) in enumerate(pairs, start=1)))
+        conn.commit()
+        step(f"chat_threads: {len(pairs)}", started)
+
+        first_ids = [1] + [1 + total for total in itertools.accumulate(counts)]
+        jobs = [
+            (args.seed, start + 1, pairs[start:end], counts[start:end], first_ids[start], args.months, now)
+            for start, end in _split(counts, args.jobs)
+        ]
+        with multiprocessing.Pool(len(jobs)) as pool:
+            written = sum(pool.imap_unordered(_copy_messages, jobs))
+        step(f"chat_messages: {written}", started)
+
+        with conn.cursor() as cursor:
+            # Сводка чата и водяные знаки прочтения: в каждом UNREAD_EVERY-м чате у второго
+            # участника остаются непрочитанные (is_read в message_rows выставлен так же)
+            cursor.execute(
+                "UPDATE chat_threads t SET last_message = m.content, last_sender_id = m.sender_id, "
+                "last_message_at = m.created_at, user_one_last_read_id = m.id, "
+                "user_two_last_read_id = CASE WHEN t.id %% %(every)s = 0 THEN GREATEST(m.id - %(tail)s, 0) ELSE m.id END "
+                "FROM (SELECT DISTINCT ON (thread_id) thread_id, id, content, sender_id, created_at "
+                "FROM chat_messages ORDER BY thread_id, id DESC) m WHERE m.thread_id = t.id",
+                {"every": UNREAD_EVERY, "tail": UNREAD_TAIL}
+            )
+            for table in ("users", "books", "exchanges", "chat_threads", "chat_messages"):
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 1))"
+                )
+        conn.commit()
+        step("сводки чатов и последовательности", started)
+
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        step("ANALYZE", started)
+    finally:
+        conn.close()
+
+    if args.upload_covers:
+        upload_stub_covers()
+        step("обложки-заглушки в MinIO", started)
+
+    print(f"✅ Готово за {time.perf_counter() - started:.1f} с. Вход: user1 / {args.password}")
+
+
+if __name__ == "__main__":
+    main()
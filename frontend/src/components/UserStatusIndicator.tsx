@@ -1,5 +1,6 @@
-import React from 'react';
+import React, { useEffect } from 'react';
 import { useSocket } from '../hooks/useSocket';
+import { watchPresence } from '../services/socket';
 
 interface UserStatusIndicatorProps {
   userId: string | number;
@@ -15,6 +16,8 @@ const UserStatusIndicator: React.FC<UserStatusIndicatorProps> = ({
   const { getIsUserOnline } = useSocket();
   const isOnline = getIsUserOnline(userId.toString());
 
+  useEffect(() => watchPresence([userId]), [userId]);
+
   return (
     <div 
       style={{ 
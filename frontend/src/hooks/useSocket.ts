@@ -3,11 +3,11 @@ import {
   initSocket, 
   connectSocket, 
   disconnectSocket, 
-  setupExchangeNotifications, 
-  setupExchangeStatusUpdates,
+  setupNotifications,
   setupUserStatus 
 } from '../services/socket';
 import { useAuth } from '../context/AuthContext';
+import { ExchangeEventData } from '../types';
 
 export const useSocket = () => {
   const { user, refreshTokens, logout } = useAuth();
@@ -45,6 +45,7 @@ export const useSocket = () => {
       console.log('🔄 Попытка подключения к вебсокетам для пользователя', user.id);
 
       setIsConnecting(true);
+      const userId = user.id;
 
       const ensureConnection = async () => {
         try {
@@ -56,9 +57,13 @@ export const useSocket = () => {
           await connectSocket(updatedToken);
           console.log('✅ Успешное подключение к вебсокетам');
 
-          const cleanupExchanges = setupExchangeNotifications((exchange) => {
-            if (!notifications.some(n => n.id === exchange.id)) {
-              setNotifications(prev => [...prev, {
+          const addExchangeOffers = (exchanges: ExchangeEventData[]) => {
+            setNotifications(prev => {
+              const fresh = exchanges.filter(exchange => !prev.some(n => n.id === exchange.id));
+              if (fresh.length === 0) {
+                return prev;
+              }
+              return [...prev, ...fresh.map(exchange => ({
                 id: exchange.id,
                 type: 'exchange',
                 title: 'Новое предложение обмена',
@@ -66,11 +71,17 @@ export const useSocket = () => {
                 bookId: exchange.book_id,
                 timestamp: new Date().toISOString(),
                 read: false
-              }]);
-            }
-          });
+              }))];
+            });
+          };
 
-          const cleanupStatus = setupExchangeStatusUpdates((update) => {
+          const addStatusUpdate = (exchange: ExchangeEventData) => {
+            const update = {
+              exchange_id: exchange.id,
+              book_id: exchange.book_id,
+              book_title: exchange.book_title,
+              status: exchange.status
+            };
             setNotifications(prev => [...prev, {
               id: `status-${update.exchange_id}`,
               type: 'status_update',
@@ -86,6 +97,17 @@ export const useSocket = () => {
               ...update,
               timestamp: new Date().toISOString()
             }]);
+          };
+
+          const cleanupExchanges = setupNotifications(userId, {
+            onSnapshot: addExchangeOffers,
+            onEvent: (event) => {
+              if (event.type === 'exchange_created') {
+                addExchangeOffers([event.exchange]);
+              } else {
+                addStatusUpdate(event.exchange);
+              }
+            }
           });
 
           const cleanupStatusUsers = setupUserStatus(({ user_id, isOnline }: { user_id: string; isOnline: boolean }) => {
@@ -97,7 +119,6 @@ export const useSocket = () => {
 
           cleanupFn = () => {
             cleanupExchanges();
-            cleanupStatus();
             cleanupStatusUsers();
           };
         } catch (error) {
@@ -119,7 +140,7 @@ export const useSocket = () => {
         disconnectSocket();
       }
     };
-  }, [user, isConnected, isConnecting, notifications, refreshTokens, logout]);
+  }, [user, isConnected, isConnecting, refreshTokens, logout]);
 
   const clearNotifications = () => {
     setNotifications([]);
@@ -1,11 +1,27 @@
 import React, { useCallback, useEffect, useRef, useState } from 'react';
 import { useLocation, useNavigate } from 'react-router-dom';
 import { chatAPI } from '../services/api';
-import { ChatThread, ChatMessage } from '../types';
+import { ChatThread, ChatMessage, ChatSearchResult, MessagesReadEvent } from '../types';
 import { useAuth } from '../context/AuthContext';
-import { setupChatMessages } from '../services/socket';
+import { setupChatMessages, setupMessagesRead, sendChatMessage, generateClientId, watchPresence } from '../services/socket';
 import { useNotifications } from '../context/NotificationsContext';
 
+const THREADS_PAGE_SIZE = 50;
+const MESSAGES_PAGE_SIZE = 50;
+
+// ts_headline отмечает совпадения управляющими символами \u0002…\u0003
+const renderSnippet = (snippet: string) =>
+  snippet.split('\u0002').map((part, index) => {
+    if (index === 0) return <React.Fragment key={index}>{part}</React.Fragment>;
+    const [match, rest = ''] = part.split('\u0003');
+    return (
+      <React.Fragment key={index}>
+        <mark>{match}</mark>
+        {rest}
+      </React.Fragment>
+    );
+  });
+
 const Chat: React.FC = () => {
   const { user } = useAuth();
   const navigate = useNavigate();
@@ -17,19 +33,30 @@ const Chat: React.FC = () => {
   const [messages, setMessages] = useState<ChatMessage[]>([]);
   const [messageInput, setMessageInput] = useState('');
   const [loadingThreads, setLoadingThreads] = useState(true);
+  const [hasMoreThreads, setHasMoreThreads] = useState(false);
+  const [loadingMoreThreads, setLoadingMoreThreads] = useState(false);
   const [loadingMessages, setLoadingMessages] = useState(false);
+  const [hasOlderMessages, setHasOlderMessages] = useState(false);
+  const [loadingOlderMessages, setLoadingOlderMessages] = useState(false);
   const [error, setError] = useState('');
   const [newChatUsername, setNewChatUsername] = useState('');
   const [isStartingChat, setIsStartingChat] = useState(false);
   const [startChatError, setStartChatError] = useState('');
   const [requestedThreadId, setRequestedThreadId] = useState<number | null>(null);
+  const [searchQuery, setSearchQuery] = useState('');
+  const [searchResults, setSearchResults] = useState<ChatSearchResult[] | null>(null);
+  const [isSearching, setIsSearching] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement | null>(null);
+  const messagesContainerRef = useRef<HTMLDivElement | null>(null);
+  // Высота ленты до подгрузки старых сообщений, чтобы сохранить позицию прокрутки
+  const prependScrollHeightRef = useRef<number | null>(null);
 
   const fetchThreads = useCallback(async () => {
     setLoadingThreads(true);
     try {
-      const response = await chatAPI.getThreads();
+      const response = await chatAPI.getThreads({ limit: THREADS_PAGE_SIZE });
       setThreads(response.data);
+      setHasMoreThreads(response.data.length === THREADS_PAGE_SIZE);
       setActiveThread(prev => {
         if (prev) {
           return response.data.find(thread => thread.id === prev.id) ?? prev;
@@ -44,23 +71,86 @@ const Chat: React.FC = () => {
     }
   }, []);
 
+  const loadMoreThreads = useCallback(async () => {
+    const last = threads[threads.length - 1];
+    if (!last) return;
+    setLoadingMoreThreads(true);
+    try {
+      const response = await chatAPI.getThreads({
+        limit: THREADS_PAGE_SIZE,
+        before_at: last.last_message_at,
+        before_id: last.id,
+      });
+      setThreads(prev => [
+        ...prev,
+        ...response.data.filter(thread => !prev.some(item => item.id === thread.id)),
+      ]);
+      setHasMoreThreads(response.data.length === THREADS_PAGE_SIZE);
+    } catch (err) {
+      console.error('Не удалось загрузить чаты', err);
+      setError('Не удалось загрузить список чатов.');
+    } finally {
+      setLoadingMoreThreads(false);
+    }
+  }, [threads]);
+
+  const markThreadRead = useCallback(async (threadId: number, upTo: number) => {
+    setThreads(prev =>
+      prev.map(thread =>
+        thread.id === threadId ? { ...thread, unread_count: 0 } : thread
+      )
+    );
+    try {
+      await chatAPI.markRead(threadId, upTo);
+    } catch (err) {
+      console.error('Не удалось отметить сообщения прочитанными', err);
+    }
+  }, []);
+
   const fetchMessages = useCallback(async (threadId: number) => {
     setLoadingMessages(true);
     try {
-      const response = await chatAPI.getMessages(threadId);
+      const response = await chatAPI.getMessages(threadId, { limit: MESSAGES_PAGE_SIZE });
       setMessages(response.data);
-      setThreads(prev =>
-        prev.map(thread =>
-          thread.id === threadId ? { ...thread, unread_count: 0 } : thread
-        )
-      );
+      setHasOlderMessages(response.data.length === MESSAGES_PAGE_SIZE);
+      const lastMessage = response.data[response.data.length - 1];
+      if (lastMessage) {
+        markThreadRead(threadId, lastMessage.id);
+      }
     } catch (err) {
       console.error('Не удалось загрузить сообщения', err);
       setError('Не удалось загрузить сообщения.');
     } finally {
       setLoadingMessages(false);
     }
-  }, []);
+  }, [markThreadRead]);
+
+  const loadOlderMessages = useCallback(async () => {
+    if (!activeThread || loadingOlderMessages || !hasOlderMessages || messages.length === 0) return;
+    setLoadingOlderMessages(true);
+    try {
+      const response = await chatAPI.getMessages(activeThread.id, {
+        limit: MESSAGES_PAGE_SIZE,
+        before_id: messages[0].id,
+        before_at: messages[0].created_at,
+      });
+      prependScrollHeightRef.current = messagesContainerRef.current?.scrollHeight ?? null;
+      setMessages(prev => [...response.data.filter(item => !prev.some(m => m.id === item.id)), ...prev]);
+      setHasOlderMessages(response.data.length === MESSAGES_PAGE_SIZE);
+    } catch (err) {
+      console.error('Не удалось загрузить сообщения', err);
+      setError('Не удалось загрузить сообщения.');
+    } finally {
+      setLoadingOlderMessages(false);
+    }
+  }, [activeThread, loadingOlderMessages, hasOlderMessages, messages]);
+
+  const handleMessagesScroll = useCallback(() => {
+    const container = messagesContainerRef.current;
+    if (container && container.scrollTop < 80) {
+      loadOlderMessages();
+    }
+  }, [loadOlderMessages]);
 
   const startThreadWithPartner = useCallback(
     async (partnerId: number) => {
@@ -185,9 +275,44 @@ const Chat: React.FC = () => {
 
       if (activeId === normalizedThreadId) {
         setMessages(prev => (prev.some(item => item.id === message.id) ? prev : [...prev, message]));
+        if (message.sender_id !== user?.id) {
+          markThreadRead(normalizedThreadId, message.id);
+        }
+      }
+    },
+    [activeThread?.id, user?.id, fetchThreads, markThreadRead]
+  );
+
+  const handleMessagesRead = useCallback(
+    (payload: MessagesReadEvent) => {
+      const threadId = Number(payload?.thread_id);
+      if (Number.isNaN(threadId)) return;
+
+      if (payload.reader_id === user?.id) {
+        setThreads(prev =>
+          prev.map(thread => (thread.id === threadId ? { ...thread, unread_count: 0 } : thread))
+        );
+        return;
+      }
+
+      setThreads(prev =>
+        prev.map(thread =>
+          thread.id === threadId
+            ? { ...thread, partner_last_read_id: Math.max(thread.partner_last_read_id ?? 0, payload.up_to) }
+            : thread
+        )
+      );
+      if (activeThread?.id === threadId) {
+        setMessages(prev =>
+          prev.map(message =>
+            message.sender_id === user?.id && message.id <= payload.up_to && !message.is_read
+              ? { ...message, is_read: true }
+              : message
+          )
+        );
       }
     },
-    [activeThread?.id, user?.id, fetchThreads]
+    [activeThread?.id, user?.id]
   );
 
   useEffect(() => {
@@ -197,23 +322,53 @@ const Chat: React.FC = () => {
   }, [handleIncomingMessage, user]);
 
   useEffect(() => {
+    if (!user) return;
+    const cleanup = setupMessagesRead(handleMessagesRead);
+    return () => cleanup();
+  }, [handleMessagesRead, user]);
+
+  // Статусы нужны только собеседникам из загруженного списка чатов
+  const partnerIdsKey = threads.map(thread => thread.partner.id).join(',');
+
+  useEffect(() => {
+    if (!user || !partnerIdsKey) return;
+    return watchPresence(partnerIdsKey.split(','));
+  }, [partnerIdsKey, user]);
+
+  useEffect(() => {
+    const container = messagesContainerRef.current;
+    if (container && prependScrollHeightRef.current !== null) {
+      container.scrollTop += container.scrollHeight - prependScrollHeightRef.current;
+      prependScrollHeightRef.current = null;
+      return;
+    }
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   }, [messages]);
 
   const handleSendMessage = async (e: React.FormEvent) => {
     e.preventDefault();
     if (!activeThread || !messageInput.trim()) return;
+    const content = messageInput.trim();
+    const clientId = generateClientId();
     try {
-      const response = await chatAPI.sendMessage(activeThread.id, messageInput.trim());
-      setMessages(prev => [...prev, response.data]);
+      let sent: ChatMessage;
+      try {
+        sent = await sendChatMessage(activeThread.id, content, clientId);
+      } catch (socketErr) {
+        // Повтор по HTTP с тем же client_id не создаст дубль, если сокет успел сохранить сообщение
+        console.warn('Отправка через вебсокет не удалась, используем HTTP', socketErr);
+        const response = await chatAPI.sendMessage(activeThread.id, content, clientId);
+        sent = response.data;
+      }
+      setMessages(prev => (prev.some(item => item.id === sent.id) ? prev : [...prev, sent]));
       setMessageInput('');
       setThreads(prev =>
         prev.map(thread =>
           thread.id === activeThread.id
             ? {
                 ...thread,
-                last_message: response.data.content,
-                last_message_at: response.data.created_at,
+                last_message: sent.content,
+                last_message_at: sent.created_at,
                 unread_count: 0,
               }
             : thread
@@ -225,6 +380,34 @@ const Chat: React.FC = () => {
     }
   };
 
+  const handleSearch = async (e: React.FormEvent) => {
+    e.preventDefault();
+    const q = searchQuery.trim();
+    if (q.length < 2) {
+      setSearchResults(null);
+      return;
+    }
+    setIsSearching(true);
+    try {
+      const response = await chatAPI.searchMessages({ q });
+      setSearchResults(response.data);
+    } catch (err: any) {
+      setError(err.response?.data?.detail || 'Не удалось выполнить поиск.');
+    } finally {
+      setIsSearching(false);
+    }
+  };
+
+  const openSearchResult = (result: ChatSearchResult) => {
+    const thread = threads.find(item => item.id === result.thread_id);
+    if (thread) {
+      setActiveThread(thread);
+    } else {
+      setRequestedThreadId(result.thread_id);
+      fetchThreads();
+    }
+  };
+
   const handleStartChatByUsername = async (e: React.FormEvent) => {
     e.preventDefault();
     if (!newChatUsername.trim()) {
@@ -288,8 +471,45 @@ const Chat: React.FC = () => {
                 {isStartingChat ? 'Создание…' : 'Начать'}
               </button>
             </form>
+            <form className="chat-new-thread" onSubmit={handleSearch}>
+              <label>
+                Поиск по сообщениям
+                <input
+                  type="search"
+                  placeholder="Например, Достоевский"
+                  value={searchQuery}
+                  onChange={e => {
+                    setSearchQuery(e.target.value);
+                    if (!e.target.value.trim()) setSearchResults(null);
+                  }}
+                />
+              </label>
+              <button type="submit" className="btn btn-secondary" disabled={isSearching}>
+                {isSearching ? 'Поиск…' : 'Найти'}
+              </button>
+            </form>
           </div>
-          {loadingThreads ? (
+          {searchResults ? (
+            searchResults.length === 0 ? (
+              <div className="chat-empty">Ничего не найдено</div>
+            ) : (
+              <div className="chat-threads">
+                {searchResults.map(result => (
+                  <button key={result.message_id} className="chat-thread" onClick={() => openSearchResult(result)}>
+                    <div className="chat-thread-header">
+                      <p className="chat-thread-name">
+                        {threads.find(thread => thread.id === result.thread_id)?.partner.username ?? `Чат #${result.thread_id}`}
+                      </p>
+                      <span className="chat-thread-time">
+                        {new Date(result.created_at).toLocaleDateString('ru-RU')}
+                      </span>
+                    </div>
+                    <p className="chat-thread-preview">{renderSnippet(result.snippet)}</p>
+                  </button>
+                ))}
+              </div>
+            )
+          ) : loadingThreads ? (
             <div className="chat-empty">Загрузка диалогов...</div>
           ) : threads.length === 0 ? (
             <div className="chat-empty">
@@ -323,6 +543,11 @@ const Chat: React.FC = () => {
                   {thread.unread_count > 0 && <span className="chat-thread-unread">{thread.unread_count}</span>}
                 </button>
               ))}
+              {hasMoreThreads && (
+                <button className="btn btn-secondary" onClick={loadMoreThreads} disabled={loadingMoreThreads}>
+                  {loadingMoreThreads ? 'Загрузка…' : 'Показать ещё'}
+                </button>
+              )}
             </div>
           )}
         </div>
@@ -342,11 +567,12 @@ const Chat: React.FC = () => {
                   </span>
                 </div>
               </div>
-              <div className="chat-messages">
+              <div className="chat-messages" ref={messagesContainerRef} onScroll={handleMessagesScroll}>
                 {loadingMessages ? (
                   <div className="chat-empty">Загрузка сообщений...</div>
                 ) : (
                   <>
+                    {loadingOlderMessages && <div className="chat-empty">Загрузка сообщений...</div>}
                     {messages.map(message => (
                       <div
                         key={message.id}
@@ -358,6 +584,7 @@ const Chat: React.FC = () => {
                             hour: '2-digit',
                             minute: '2-digit',
                           })}
+                          {message.sender_id === user.id && (message.is_read ? ' ✓✓' : ' ✓')}
                         </span>
                       </div>
                     ))}
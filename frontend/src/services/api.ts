@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { AuthResponse, Book, User, Exchange, ExchangeResponse, ChatThread, ChatMessage } from '../types';
+import { AuthResponse, Book, User, Exchange, ExchangeResponse, ChatThread, ChatMessage, ChatReadResponse, ChatSearchResult } from '../types';
 import { API_BASE_URL } from '../config';
 
 const api = axios.create({
@@ -70,16 +70,26 @@ export const booksAPI = {
 };
 
 export const chatAPI = {
-  getThreads: () => api.get<ChatThread[]>('/chat/threads'),
+  getThreads: (params?: { limit?: number; before_at?: string | null; before_id?: number }) =>
+    api.get<ChatThread[]>('/chat/threads', { params }),
   createThread: (partnerId: number) => api.post<ChatThread>('/chat/threads', { partner_id: partnerId }),
   createThreadByUsername: (username: string) =>
     api.post<ChatThread>('/chat/threads/by-username', { username }),
   createThreadByBook: (bookId: number) =>
     api.post<ChatThread>('/chat/threads/by-book', { book_id: bookId }),
-  getMessages: (threadId: number, limit = 50) =>
-    api.get<ChatMessage[]>(`/chat/threads/${threadId}/messages`, { params: { limit } }),
-  sendMessage: (threadId: number, content: string) =>
-    api.post<ChatMessage>(`/chat/threads/${threadId}/messages`, { content }),
+  getMessages: (threadId: number, params: { limit?: number; before_id?: number; before_at?: string; after_id?: number } = {}) =>
+    api.get<ChatMessage[]>(`/chat/threads/${threadId}/messages`, { params: { limit: 50, ...params } }),
+  searchMessages: (params: { q: string; limit?: number; before_rank?: number; before_id?: number }) =>
+    api.get<ChatSearchResult[]>('/chat/search', { params }),
+  markRead: (threadId: number, upTo?: number) =>
+    api.post<ChatReadResponse>(`/chat/threads/${threadId}/read`, null, { params: { up_to: upTo } }),
+  sendMessage: (threadId: number, content: string, clientId?: string) =>
+    api.post<ChatMessage>(`/chat/threads/${threadId}/messages`, { content, client_id: clientId }),
+  getPresence: (userIds: number[]) => {
+    const params = new URLSearchParams();
+    userIds.forEach((id) => params.append('user_ids', String(id)));
+    return api.get<Record<string, boolean>>('/chat/presence', { params });
+  },
 };
 
 export default api;
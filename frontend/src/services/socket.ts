@@ -1,7 +1,45 @@
 import io, { Socket } from 'socket.io-client';
 import { SOCKET_BASE_URL } from '../config';
+import { ChatMessage, MessagesReadEvent, ExchangeEvent, ExchangeEventData, NotificationsSyncResponse } from '../types';
 
 let socket: Socket | null = null;
+// Номер последнего полученного уведомления (null — снимок ещё не получен)
+let lastNotificationSeq: number | null = null;
+let notificationsUserId: number | null = null;
+
+type PresenceListener = (data: { user_id: string; isOnline: boolean }) => void;
+
+// Пользователи, чьи статусы нужны открытым экранам (с числом заинтересованных)
+const presenceInterest = new Map<string, number>();
+const presenceListeners = new Set<PresenceListener>();
+let presenceSyncTimer: ReturnType<typeof setTimeout> | null = null;
+
+const notifyPresence = (user_id: string, isOnline: boolean) => {
+  presenceListeners.forEach(listener => listener({ user_id, isOnline }));
+};
+
+const syncPresenceSubscriptions = () => {
+  presenceSyncTimer = null;
+  if (!socket?.connected) {
+    return;
+  }
+  socket.emit(
+    'subscribe_presence',
+    { user_ids: Array.from(presenceInterest.keys()) },
+    (ack: { ok: boolean; statuses?: Record<string, boolean> }) => {
+      if (ack?.ok && ack.statuses) {
+        Object.entries(ack.statuses).forEach(([userId, isOnline]) => notifyPresence(userId, isOnline));
+      }
+    }
+  );
+};
+
+// Изменения интересов за один тик отправляются одной подпиской
+const schedulePresenceSync = () => {
+  if (presenceSyncTimer === null) {
+    presenceSyncTimer = setTimeout(syncPresenceSubscriptions, 50);
+  }
+};
 const SOCKET_URL = SOCKET_BASE_URL;
 const isRelativeSocketUrl = SOCKET_URL.startsWith('/');
 const SOCKET_ORIGIN = isRelativeSocketUrl ? window.location.origin : SOCKET_URL;
@@ -29,6 +67,9 @@ export const initSocket = () => {
         socket?.connect();
       }
     });
+
+    // После (пере)подключения подписка на статусы восстанавливается
+    socket.on('auth_success', schedulePresenceSync);
   }
   return socket;
 };
@@ -47,7 +88,6 @@ export const connectSocket = async (token: string) => {
         });
         
         socket.on('auth_success', () => {
-          socket.emit('get_online_users');
           resolve();
         });
         
@@ -70,53 +110,115 @@ export const disconnectSocket = () => {
     socket.disconnect();
   }
   socket = null;
+  if (presenceSyncTimer !== null) {
+    clearTimeout(presenceSyncTimer);
+    presenceSyncTimer = null;
+  }
 };
 
-export const setupExchangeNotifications = (callback: (exchange: any) => void) => {
+// Номер уведомления переживает переподключения, поэтому после обрыва сети
+// сервер повторяет только пропущенное; сбрасывается при смене пользователя
+export const setupNotifications = (userId: number, handlers: {
+  onSnapshot: (exchanges: ExchangeEventData[]) => void;
+  onEvent: (event: ExchangeEvent) => void;
+}) => {
   const socket = initSocket();
-  
-  socket.on('new_exchanges', (data: { exchanges: any[] }) => {
-    console.log('Получены новые предложения обмена:', data);
-    data.exchanges.forEach(callback);
-  });
-  
-  return () => {
-    socket.off('new_exchanges');
+  if (notificationsUserId !== userId) {
+    notificationsUserId = userId;
+    lastNotificationSeq = null;
+  }
+  let syncing = false;
+  let syncAgain = false;
+
+  const applyEvent = (event: ExchangeEvent) => {
+    if (lastNotificationSeq !== null && event.seq <= lastNotificationSeq) {
+      return;
+    }
+    handlers.onEvent(event);
+    lastNotificationSeq = event.seq;
   };
-};
 
-export const setupExchangeStatusUpdates = (callback: (update: any) => void) => {
-  const socket = initSocket();
-  
-  socket.on('exchange_status_update', (data: any) => {
-    console.log('Обновление статуса обмена:', data);
-    callback(data);
-  });
-  
+  // Сервер повторяет пропущенное после lastNotificationSeq; снимок — только при первом подключении
+  const resync = () => {
+    if (syncing) {
+      syncAgain = true;
+      return;
+    }
+    syncing = true;
+    socket.emit('sync_notifications', { since: lastNotificationSeq }, (ack: NotificationsSyncResponse) => {
+      syncing = false;
+      if (ack?.ok && ack.seq !== undefined) {
+        if (ack.reset && ack.exchanges) {
+          handlers.onSnapshot(ack.exchanges);
+        }
+        ack.notifications?.forEach(applyEvent);
+        lastNotificationSeq = Math.max(lastNotificationSeq ?? 0, ack.seq);
+      }
+      if (syncAgain) {
+        syncAgain = false;
+        resync();
+      }
+    });
+  };
+
+  const handleEvent = (event: ExchangeEvent) => {
+    if (lastNotificationSeq !== null && event.seq > lastNotificationSeq + 1) {
+      resync();
+      return;
+    }
+    applyEvent(event);
+  };
+
+  socket.on('notification', handleEvent);
+  const handleAuth = () => resync();
+  socket.on('auth_success', handleAuth);
+  if (socket.connected) {
+    resync();
+  }
+
   return () => {
-    socket.off('exchange_status_update');
+    socket.off('notification', handleEvent);
+    socket.off('auth_success', handleAuth);
   };
 };
 
-export const setupUserStatus = (callback: (data: { user_id: string; isOnline: boolean }) => void) => {
+export const setupUserStatus = (callback: PresenceListener) => {
   const socket = initSocket();
 
-  socket.on('online_users', (data: { users: string[] }) => {
-    data.users.forEach(userId => callback({ user_id: userId, isOnline: true }));
-  });
-
-  socket.on('user_online', (data: { user_id: string }) => {
+  const handleOnline = (data: { user_id: string }) => {
     callback({ user_id: data.user_id, isOnline: true });
-  });
-  
-  socket.on('user_offline', (data: { user_id: string }) => {
+  };
+  const handleOffline = (data: { user_id: string }) => {
     callback({ user_id: data.user_id, isOnline: false });
-  });
-  
+  };
+
+  presenceListeners.add(callback);
+  socket.on('user_online', handleOnline);
+  socket.on('user_offline', handleOffline);
+
   return () => {
-    socket.off('online_users');
-    socket.off('user_online');
-    socket.off('user_offline');
+    presenceListeners.delete(callback);
+    socket.off('user_online', handleOnline);
+    socket.off('user_offline', handleOffline);
+  };
+};
+
+// Подписка на статусы пользователей, видимых на экране; возвращает отписку
+export const watchPresence = (userIds: Array<string | number>) => {
+  const ids = userIds.map(String);
+  ids.forEach(id => presenceInterest.set(id, (presenceInterest.get(id) ?? 0) + 1));
+  schedulePresenceSync();
+
+  return () => {
+    ids.forEach(id => {
+      const count = (presenceInterest.get(id) ?? 1) - 1;
+      if (count <= 0) {
+        presenceInterest.delete(id);
+      } else {
+        presenceInterest.set(id, count);
+      }
+    });
+    schedulePresenceSync();
   };
 };
 
@@ -127,3 +229,41 @@ export const setupChatMessages = (callback: (data: any) => void) => {
     socket.off('chat_message', callback);
   };
 };
+
+export const setupMessagesRead = (callback: (data: MessagesReadEvent) => void) => {
+  const socket = initSocket();
+  socket.on('messages_read', callback);
+  return () => {
+    socket.off('messages_read', callback);
+  };
+};
+
+export const generateClientId = () =>
+  typeof crypto !== 'undefined' && 'randomUUID' in crypto
+    ? crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
+export const sendChatMessage = (threadId: number, content: string, clientId: string, timeoutMs = 10000) => {
+  const socket = initSocket();
+  return new Promise<ChatMessage>((resolve, reject) => {
+    if (!socket.connected) {
+      reject(new Error('Вебсокет не подключен'));
+      return;
+    }
+    socket
+      .timeout(timeoutMs)
+      .emit(
+        'send_chat_message',
+        { thread_id: threadId, content, client_id: clientId },
+        (err: Error | null, ack: { ok: boolean; message?: ChatMessage; error?: string }) => {
+          if (err) {
+            reject(err);
+          } else if (!ack?.ok || !ack.message) {
+            reject(new Error(ack?.error || 'Не удалось отправить сообщение'));
+          } else {
+            resolve(ack.message);
+          }
+        }
+      );
+  });
+};
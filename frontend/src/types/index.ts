@@ -62,6 +62,7 @@ export interface ChatThread {
   last_message: string | null;
   last_message_at: string | null;
   unread_count: number;
+  partner_last_read_id: number;
 }
 
 export interface ChatMessage {
@@ -71,4 +72,54 @@ export interface ChatMessage {
   content: string;
   created_at: string;
   is_read: boolean;
+  client_id?: string | null;
+}
+
+export interface ChatReadResponse {
+  thread_id: number;
+  last_read_id: number;
+  updated: number;
+}
+
+export interface MessagesReadEvent {
+  thread_id: number;
+  reader_id: number;
+  up_to: number;
+  read_at: string;
+}
+
+export interface ExchangeEventData {
+  id: number;
+  book_id: number;
+  book_title: string;
+  requester_id: number;
+  requester_username: string;
+  owner_id: number;
+  status: string;
+  created_at: string;
+}
+
+export interface ExchangeEvent {
+  type: 'exchange_created' | 'exchange_status_changed';
+  seq: number;
+  created_at: string;
+  exchange: ExchangeEventData;
+}
+
+export interface NotificationsSyncResponse {
+  ok: boolean;
+  seq?: number;
+  notifications?: ExchangeEvent[];
+  reset?: boolean;
+  exchanges?: ExchangeEventData[];
+  error?: string;
+}
+
+export interface ChatSearchResult {
+  message_id: number;
+  thread_id: number;
+  sender_id: number;
+  created_at: string;
+  snippet: string;
+  rank: number;
 }